@@ -0,0 +1,48 @@
+import os
+
+from fastapi import Body
+
+from configs.kb import DEFAULT_VS_TYPE
+from configs.model import EMBEDDING_MODEL
+from db.repository.knowledge_base_repository import add_kb_to_db, list_kbs_from_db
+from knowledge_base.ingest import ingest_kb
+from knowledge_base.kb_service import VS_TYPES, get_content_path, get_kb_service
+from pages.api_utils import BaseResponse, ListResponse
+
+
+async def list_kbs() -> ListResponse:
+    '''
+    获取知识库列表
+    '''
+    return ListResponse(data=await list_kbs_from_db())
+
+
+async def create_kb(knowledge_base_name: str = Body(..., examples=["samples"]),
+                    kb_info: str = Body("", description="知识库简介"),
+                    vector_store_type: str = Body(DEFAULT_VS_TYPE, description="向量库类型"),
+                    embed_model: str = Body(EMBEDDING_MODEL, description="嵌入模型名称"),
+                    ) -> BaseResponse:
+    '''
+    创建知识库，已存在时更新知识库信息
+    '''
+    if not knowledge_base_name or "/" in knowledge_base_name or knowledge_base_name.startswith("."):
+        return BaseResponse(code=403, msg=f"知识库名称不合法: {knowledge_base_name}")
+    if vector_store_type not in VS_TYPES:
+        return BaseResponse(code=404, msg=f"不支持的向量库类型: {vector_store_type}")
+    os.makedirs(get_content_path(knowledge_base_name), exist_ok=True)
+    await add_kb_to_db(knowledge_base_name, kb_info, vector_store_type, embed_model)
+    return BaseResponse(code=200, msg=f"已创建知识库 {knowledge_base_name}")
+
+
+async def update_kb_docs(knowledge_base_name: str = Body(..., examples=["samples"]),
+                         force: bool = Body(False, description="忽略文件修改时间，全部重新向量化"),
+                         ) -> BaseResponse:
+    '''
+    增量更新知识库：只处理content目录下新增、修改或删除的文件
+    '''
+    if await get_kb_service(knowledge_base_name) is None:
+        return BaseResponse(code=404, msg=f"未找到知识库 {knowledge_base_name}")
+    report = await ingest_kb(knowledge_base_name, force=force)
+    msg = (f"新增 {len(report.added)} 个文件，更新 {len(report.updated)} 个文件，"
+           f"删除 {len(report.deleted)} 个文件，跳过 {report.unchanged} 个未修改文件")
+    return BaseResponse(code=200 if not report.failed else 500, msg=msg, data=report.to_dict())
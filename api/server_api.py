@@ -0,0 +1,9 @@
+from pages.api_utils import BaseResponse
+from utils.stats import collect_stats
+
+
+def server_stats() -> BaseResponse:
+    '''
+    获取服务运行统计，如prompt模板缓存命中率等
+    '''
+    return BaseResponse(data=collect_stats())
@@ -3,7 +3,7 @@ from typing import Dict, Any, List
 from langchain_core.callbacks.base import BaseCallbackHandler
 from langchain_core.outputs import LLMResult
 
-from db.repository.message_repository import update_message_to_db
+from db.repository.message_repository import update_message
 
 
 class ConversationCallbackHandler(BaseCallbackHandler):
@@ -30,7 +30,7 @@ class ConversationCallbackHandler(BaseCallbackHandler):
     async def on_llm_end(self, response: LLMResult, **kwargs: Any) -> None:
         try:
             answer = response.generations[0][0].text
-            await update_message_to_db(self.message_id, answer)
+            await update_message(self.message_id, answer)
         except Exception as e:
             print(f"Error updating message to database: {str(e)}")
 
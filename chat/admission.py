@@ -0,0 +1,287 @@
+import asyncio
+import math
+import time
+from collections import deque
+from typing import Dict, List, Optional, Any, Tuple, AsyncIterator
+
+from configs.basic import ADMISSION_CONTROL, FAIR_SCHEDULING
+from utils.stats import register_stats_provider
+
+
+class AdmissionRejected(Exception):
+    """
+    请求未被接纳(队列已满或排队超时)，retry_after为建议的重试间隔(秒)
+    """
+
+    def __init__(self, model_name: str, reason: str, retry_after: int):
+        super().__init__(f"模型 {model_name} 当前请求过多({reason})，请 {retry_after} 秒后重试")
+        self.model_name = model_name
+        self.reason = reason
+        self.retry_after = retry_after
+
+    def to_response(self):
+        from fastapi.responses import JSONResponse
+        from pages.api_utils import BaseResponse
+
+        return JSONResponse(status_code=429, headers={"Retry-After": str(self.retry_after)},
+                            content=BaseResponse(code=429, msg=str(self)).model_dump())
+
+
+class AdmissionSlot:
+    """
+    已接纳请求占用的并发名额，release可重复调用
+    """
+
+    def __init__(self, gate: Optional["ModelGate"]):
+        self._gate = gate
+        self._start = time.monotonic()
+
+    def release(self):
+        gate, self._gate = self._gate, None
+        if gate is not None:
+            gate.release(time.monotonic() - self._start)
+
+
+class _TenantQueue:
+    """
+    同一优先级类别中一个租户的等待队列；deficit为DRR的赤字计数，每轮增加weight，出队一个请求消耗1
+    """
+
+    def __init__(self, tenant: str, weight: float):
+        self.tenant = tenant
+        self.weight = max(weight, 0.01)
+        self.deficit = 0.0
+        self.waiters: deque = deque()
+
+
+class ModelGate:
+    """
+    单个模型的准入控制：最多concurrency个请求同时调用模型，其余排队，
+    队列满时立即拒绝，排队超过max_queue_time时超时拒绝。
+    排队的请求按优先级类别严格先后出队，同一类别内各租户按加权赤字轮转(DRR)出队；
+    不区分租户和类别时即为先来先服务
+    """
+
+    def __init__(self, model_name: str, concurrency: int, max_queue: int, max_queue_time: float,
+                 priorities: List[str] = None, default_priority: str = None, max_tenant_queue: int = None):
+        self.model_name = model_name
+        self.concurrency = concurrency
+        self.max_queue = max_queue
+        self.max_queue_time = max_queue_time
+        self.max_tenant_queue = max_tenant_queue or max_queue
+        self.priorities = priorities or [""]
+        self.default_priority = default_priority if default_priority in self.priorities else self.priorities[-1]
+        self.running = 0
+        self.queued = 0
+        # {优先级类别: {租户: 等待队列}}，dict的顺序即轮转顺序
+        self._queues: Dict[str, Dict[str, _TenantQueue]] = {priority: {} for priority in self.priorities}
+        self.admitted = 0
+        self.rejected_full = 0
+        self.rejected_timeout = 0
+        self.wait_time = 0.0
+        self.max_wait_time = 0.0
+        self._priority_stats = {priority: {"admitted": 0, "wait_time": 0.0} for priority in self.priorities}
+        # 单个请求占用名额的时间(秒)的指数移动平均，用于估算Retry-After
+        self.service_time_ema = 0.0
+
+    def retry_after(self) -> int:
+        estimate = (self.queued + 1) * (self.service_time_ema or 1.0) / self.concurrency
+        return max(1, min(math.ceil(estimate), math.ceil(self.max_queue_time)))
+
+    def _admit(self, priority: str, waited: float):
+        self.admitted += 1
+        self.wait_time += waited
+        self.max_wait_time = max(self.max_wait_time, waited)
+        self._priority_stats[priority]["admitted"] += 1
+        self._priority_stats[priority]["wait_time"] += waited
+
+    async def acquire(self, tenant: str = "", priority: str = None, weight: float = 1.0) -> AdmissionSlot:
+        if priority not in self._queues:
+            priority = self.default_priority
+        if self.running < self.concurrency and not self.queued:
+            self.running += 1
+            self._admit(priority, 0.0)
+            return AdmissionSlot(self)
+        queues = self._queues[priority]
+        queue = queues.get(tenant)
+        if self.queued >= self.max_queue or (queue and len(queue.waiters) >= self.max_tenant_queue):
+            self.rejected_full += 1
+            raise AdmissionRejected(self.model_name, "队列已满", self.retry_after())
+        if queue is None:
+            queue = queues[tenant] = _TenantQueue(tenant, weight)
+        start = time.monotonic()
+        waiter = asyncio.get_running_loop().create_future()
+        queue.waiters.append(waiter)
+        self.queued += 1
+        try:
+            await asyncio.wait({waiter}, timeout=self.max_queue_time)
+        except asyncio.CancelledError:
+            # 客户端断开；若恰好已分到名额则归还
+            if waiter.done() and not waiter.cancelled():
+                self.release()
+            else:
+                self._remove_waiter(priority, queue, waiter)
+            raise
+        if not waiter.done():
+            self._remove_waiter(priority, queue, waiter)
+            self.rejected_timeout += 1
+            raise AdmissionRejected(self.model_name, "排队超时", self.retry_after())
+        self._admit(priority, time.monotonic() - start)
+        return AdmissionSlot(self)
+
+    def _remove_waiter(self, priority: str, queue: _TenantQueue, waiter: asyncio.Future):
+        waiter.cancel()
+        try:
+            queue.waiters.remove(waiter)
+        except ValueError:
+            return
+        self.queued -= 1
+        if not queue.waiters and self._queues[priority].get(queue.tenant) is queue:
+            del self._queues[priority][queue.tenant]
+
+    def _next_waiter(self) -> Optional[asyncio.Future]:
+        '''
+        按优先级类别取出下一个等待者：类别内轮转到的租户赤字不足1时增加weight并移到队尾，否则出队一个请求
+        '''
+        for queues in self._queues.values():
+            while queues:
+                tenant, queue = next(iter(queues.items()))
+                if queue.deficit < 1:
+                    queue.deficit += queue.weight
+                    queues[tenant] = queues.pop(tenant)
+                    continue
+                queue.deficit -= 1
+                waiter = queue.waiters.popleft()
+                if not queue.waiters:
+                    del queues[tenant]
+                return waiter
+        return None
+
+    def release(self, service_time: float = None):
+        if service_time is not None:
+            self.service_time_ema = service_time if not self.service_time_ema \
+                else 0.9 * self.service_time_ema + 0.1 * service_time
+        # 名额直接交给调度选中的等待者
+        waiter = self._next_waiter()
+        if waiter is not None:
+            self.queued -= 1
+            waiter.set_result(None)
+            return
+        self.running -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        stats = {
+            "concurrency": self.concurrency,
+            "running": self.running,
+            "queued": self.queued,
+            "max_queue": self.max_queue,
+            "admitted": self.admitted,
+            "rejected_full": self.rejected_full,
+            "rejected_timeout": self.rejected_timeout,
+            "avg_wait_ms": round(self.wait_time / self.admitted * 1000, 2) if self.admitted else 0.0,
+            "max_wait_ms": round(self.max_wait_time * 1000, 2),
+            "avg_service_ms": round(self.service_time_ema * 1000, 2),
+        }
+        if len(self.priorities) > 1:
+            stats["priorities"] = {
+                priority: {
+                    "queued": sum(len(q.waiters) for q in self._queues[priority].values()),
+                    "queued_tenants": len(self._queues[priority]),
+                    "admitted": s["admitted"],
+                    "avg_wait_ms": round(s["wait_time"] / s["admitted"] * 1000, 2) if s["admitted"] else 0.0,
+                }
+                for priority, s in self._priority_stats.items()
+            }
+        return stats
+
+
+class AdmissionController:
+    """
+    按模型的准入控制，并发数取自模型worker的 limit_worker_concurrency；fair为False时各模型按先来先服务排队
+    """
+
+    def __init__(self, enabled: bool = ADMISSION_CONTROL["enabled"],
+                 queue_factor: int = ADMISSION_CONTROL["queue_factor"],
+                 max_queue_time: float = ADMISSION_CONTROL["max_queue_time"],
+                 fair: bool = FAIR_SCHEDULING["enabled"]):
+        self.enabled = enabled
+        self.queue_factor = queue_factor
+        self.max_queue_time = max_queue_time
+        self.fair = fair
+        self._gates: Dict[str, ModelGate] = {}
+
+    def gate(self, model_name: str) -> ModelGate:
+        gate = self._gates.get(model_name)
+        if gate is None:
+            concurrency = ADMISSION_CONTROL["concurrency"].get(model_name)
+            if concurrency is None:
+                from chat.chat_utils import get_model_worker_config
+                concurrency = get_model_worker_config(model_name).get("limit_worker_concurrency", 1)
+            max_queue = concurrency * self.queue_factor
+            if self.fair:
+                gate = ModelGate(model_name, concurrency, max_queue, self.max_queue_time,
+                                 FAIR_SCHEDULING["priorities"], FAIR_SCHEDULING["default_priority"],
+                                 max(1, int(max_queue * FAIR_SCHEDULING["max_tenant_queue_share"])))
+            else:
+                gate = ModelGate(model_name, concurrency, max_queue, self.max_queue_time)
+            self._gates[model_name] = gate
+        return gate
+
+    async def acquire(self, model_name: str, tenant: str = "", priority: str = None) -> AdmissionSlot:
+        '''
+        等待模型的并发名额，未被接纳时抛出AdmissionRejected；请求结束后需调用 slot.release()
+        '''
+        if not self.enabled:
+            return AdmissionSlot(None)
+        if not self.fair:
+            return await self.gate(model_name).acquire()
+        return await self.gate(model_name).acquire(tenant, priority, FAIR_SCHEDULING["weights"].get(tenant, 1.0))
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        return {model_name: gate.stats() for model_name, gate in self._gates.items()}
+
+
+def request_tenant(request, conversation_id: str = "") -> Tuple[str, str]:
+    '''
+    从请求中识别(租户, 优先级类别)：租户依次取API Key请求头、Authorization: Bearer、对话ID、客户端IP。
+    API Key配置在 tenant_priorities 中时使用配置的类别；否则请求头只能指定 header_priorities 中的类别，
+    客户端不能自行声明更高的优先级
+    '''
+    headers = request.headers
+    api_key = headers.get(FAIR_SCHEDULING["tenant_header"], "")
+    if not api_key:
+        authorization = headers.get("authorization", "")
+        if authorization[:7].lower() == "bearer ":
+            api_key = authorization[7:].strip()
+    priority = FAIR_SCHEDULING["tenant_priorities"].get(api_key) if api_key else None
+    if priority is None:
+        priority = headers.get(FAIR_SCHEDULING["priority_header"], "").strip().lower()
+        if priority not in FAIR_SCHEDULING["header_priorities"]:
+            priority = FAIR_SCHEDULING["default_priority"]
+    tenant = api_key or conversation_id or (request.client.host if request.client else "")
+    return tenant, priority
+
+
+def admitted_event_source(iterator: AsyncIterator[str], slot: Optional[AdmissionSlot] = None):
+    '''
+    返回SSE响应，输出结束、出错或客户端断开后归还名额；响应未开始输出就结束时由background归还
+    slot为None时表示该响应不调用模型(如缓存命中)或名额由其它方归还
+    '''
+    from sse_starlette.sse import EventSourceResponse
+    from starlette.background import BackgroundTask
+
+    if slot is None:
+        return EventSourceResponse(iterator)
+
+    async def release_after():
+        try:
+            async for item in iterator:
+                yield item
+        finally:
+            slot.release()
+
+    return EventSourceResponse(release_after(), background=BackgroundTask(slot.release))
+
+
+admission_controller = AdmissionController()
+register_stats_provider("admission", admission_controller.stats)
@@ -2,20 +2,30 @@ import asyncio
 import json
 from typing import Union, List, Optional, AsyncIterator
 
-from fastapi import Body
+from fastapi import Body, Request
 from langchain.callbacks import AsyncIteratorCallbackHandler
 from langchain.chains.llm import LLMChain
-from langchain_core.prompts import PromptTemplate
-from sse_starlette.sse import EventSourceResponse
+from langchain_core.prompts import ChatPromptTemplate, HumanMessagePromptTemplate
 
 from callback_handler.conversation_callback_handler import ConversationCallbackHandler
-from chat.chat_utils import History, get_chat_model, get_prompt_template, wrap_done
-from configs.basic import LLM_MODELS
+from chat.admission import admission_controller, admitted_event_source, request_tenant, AdmissionRejected
+from chat.chat_utils import History, get_pooled_chat_model, get_llm_kwargs, get_compiled_prompt_template, \
+    wrap_done, format_history, count_tokens, pack_history_messages, get_history_token_budget, get_openai_messages, \
+    astream_llm_chain
+from chat.direct_engine import astream_chat_completion, achat_completion
+from chat.response_cache import response_cache, make_response_cache_key, iter_replay_chunks
+from chat.semantic_cache import semantic_cache
+from chat.single_flight import single_flight
+from chat.streaming import coalesce_tokens
+from configs.basic import LLM_MODELS, STREAM_COALESCE, CHAT_ENGINE
 from configs.model import TEMPERATURE
-from db.repository.message_repository import add_message_to_db
+from db.repository.message_repository import add_message, update_message, get_history_messages
+from db.session import request_session
+from pages.api_utils import BaseResponse
 
 
-async def chat(query: str = Body(..., description="用户输入", examples=["恼羞成怒"]),
+async def chat(request: Request,
+               query: str = Body(..., description="用户输入", examples=["恼羞成怒"]),
                conversation_id: str = Body("", description="对话框ID"),
                history_len: int = Body(-1, description="从数据库中取历史消息的数量"),
                history: Union[int, List[History]] = Body([],
@@ -31,41 +41,164 @@ async def chat(query: str = Body(..., description="用户输入", examples=["恼
                max_tokens: Optional[int] = Body(None, description="限制LLM生成Token数量，默认None代表模型最大值"),
                # top_p: float = Body(TOP_P, description="LLM 核采样。勿与temperature同时设置", gt=0.0, lt=1.0),
                prompt_name: str = Body("default", description="使用的prompt模板名称(在configs/prompt.py中配置)"),
+               use_cache: bool = Body(False, description="temperature为0时使用回答缓存，相同请求直接返回缓存的回答"),
+               coalesce: bool = Body(STREAM_COALESCE["enabled"],
+                                     description="流式输出时把相邻token合并为一帧，设为False时逐token输出"),
                ):
+    if isinstance(history, int):
+        # 传入整数时从数据库读取历史消息
+        history_len, history = history, []
+    # 生成前的准备在返回响应前完成：缓存命中、合并到进行中的相同生成的请求都不调用模型，不占用模型名额
+    try:
+        # 请求级工作单元只包含生成前的数据库操作，返回响应前提交并归还连接；
+        # 生成期间及结束后的 add_message/update_message、回调各自使用短会话
+        async with request_session():
+            if history:
+                # 优先使用前端传入的历史消息
+                history = [History.from_data(h) for h in history]
+                input_msg = HumanMessagePromptTemplate(prompt=get_compiled_prompt_template("llm_chat", prompt_name))
+                prompt_template = ChatPromptTemplate.from_messages(
+                    [h.to_msg_template() for h in history] + [input_msg])
+                inputs = {"input": query}
+            elif conversation_id and history_len > 0:
+                # 从数据库读取历史消息(活跃会话命中内存缓存)，使用所选的prompt模板
+                messages = await get_history_messages(conversation_id, history_len)
+                prompt_template = get_compiled_prompt_template("llm_chat", prompt_name)
+                # 模板自带{history}(如with_history)时历史拼接为文本，否则作为对话消息放在模板之前
+                history_slot = {"history": ""} if "history" in prompt_template.input_variables else {}
+                # 按token预算截取历史消息，为模型回答预留max_tokens
+                prompt_tokens = await asyncio.to_thread(
+                    count_tokens, prompt_template.format(input=query, **history_slot), model_name)
+                messages = await pack_history_messages(messages, model_name,
+                                                       get_history_token_budget(prompt_tokens, max_tokens))
+                inputs = {"input": query}
+                if history_slot:
+                    inputs["history"] = format_history(messages)
+                elif messages:
+                    history = [History(role=role, content=m[key]) for m in messages
+                               for role, key in (("user", "query"), ("assistant", "response"))]
+                    prompt_template = ChatPromptTemplate.from_messages(
+                        [h.to_msg_template() for h in history] + [HumanMessagePromptTemplate(prompt=prompt_template)])
+            else:
+                # 获取编译好的PromptTemplate对象
+                prompt_template = get_compiled_prompt_template("llm_chat", prompt_name)
+                inputs = {"input": query}
+
+            # 确定性请求可使用回答缓存
+            answer, cache_key = None, None
+            llm_kwargs = get_llm_kwargs(temperature, max_tokens)
+            # 语义缓存只用于不带历史消息的请求
+            use_semantic_cache = (use_cache and semantic_cache.cacheable(temperature)
+                                  and not history and "history" not in inputs)
+            if use_cache and response_cache.cacheable(temperature):
+                cache_key = make_response_cache_key(model_name, prompt_name, prompt_template.format(**inputs),
+                                                    llm_kwargs)
+                answer = await response_cache.aget(cache_key)
+            if answer is None and use_semantic_cache:
+                hit = await semantic_cache.alookup(model_name, prompt_name, query, llm_kwargs)
+                answer = hit[0] if hit else None
+            if answer is not None:
+                message_id = await add_message(conversation_id, "llm_chat", query, response=answer,
+                                               metadata={"cached": True})
+    except Exception as e:
+        import traceback
+        print(traceback.format_exc())
+        return BaseResponse(code=500, msg=f"模型调用出错: {str(e)}")
+
+    if answer is not None:
+        async def cached_iterator():
+            for text in (iter_replay_chunks(answer) if stream else [answer]):
+                yield json.dumps({"text": text, "message_id": message_id}, ensure_ascii=False)
+
+        return admitted_event_source(cached_iterator())
+
+    async def save_to_cache(answer: str):
+        if cache_key:
+            await response_cache.aset(cache_key, answer)
+        if use_semantic_cache:
+            await semantic_cache.aadd(model_name, prompt_name, query, answer, llm_kwargs)
+
+    # 确定性请求与进行中的相同请求共用一次生成
+    flight_key = make_response_cache_key(model_name, prompt_name, prompt_template.format(**inputs),
+                                         llm_kwargs) if single_flight.eligible(temperature) else None
+
+    # 只有实际发起上游生成的请求占用模型名额；模型并发已满时按租户公平排队，排队过长时直接返回429
+    slot = None
+    if not (flight_key and single_flight.in_flight(flight_key)):
+        try:
+            slot = await admission_controller.acquire(model_name, *request_tenant(request, conversation_id))
+        except AdmissionRejected as e:
+            return e.to_response()
+
+    def generate():
+        # direct引擎不经过LangChain，直接请求OpenAI兼容接口
+        if CHAT_ENGINE == "direct":
+            return astream_chat_completion(model_name, get_openai_messages(prompt_template, inputs), llm_kwargs)
+        return astream_llm_chain(model_name, prompt_template, inputs, llm_kwargs)
+
+    flight_tokens = None
+    if flight_key:
+        # 名额随上游生成结束归还(发起请求的客户端断开后生成仍可能为其它请求继续)；排队期间已有相同生成时立即归还
+        flight_tokens = single_flight.join(flight_key, generate, on_done=slot.release if slot else None)
+        slot = None
+
     async def chat_iterator():
         callback = AsyncIteratorCallbackHandler()
         callbacks = [callback]
+        acall_task = None
         try:
-            message_id = await add_message_to_db(conversation_id, "llm_chat", query)
+            # 消息先进入写回队列，无需等待数据库写入即可开始生成
+            message_id = await add_message(conversation_id, "llm_chat", query)
+
+            if CHAT_ENGINE == "direct" or flight_tokens is not None:
+                # 两种引擎的回答都在生成结束后写入
+                if stream:
+                    tokens = flight_tokens if flight_tokens is not None else generate()
+                    parts = []
+                    async for text in (coalesce_tokens(tokens) if coalesce else tokens):
+                        parts.append(text)
+                        yield json.dumps({"text": text, "message_id": message_id}, ensure_ascii=False)
+                    answer = "".join(parts)
+                elif flight_tokens is not None:
+                    answer = "".join([token async for token in flight_tokens])
+                    yield json.dumps({"text": answer, "message_id": message_id}, ensure_ascii=False)
+                else:
+                    answer = await achat_completion(model_name, get_openai_messages(prompt_template, inputs),
+                                                    llm_kwargs)
+                    yield json.dumps({"text": answer, "message_id": message_id}, ensure_ascii=False)
+                await update_message(message_id, answer)
+                await save_to_cache(answer)
+                return
+
             conversation_callback = ConversationCallbackHandler(
                 conversation_id, message_id, "llm_chat", query
             )
             callbacks.append(conversation_callback)
 
-            model = get_chat_model(model_name=model_name, temperature=temperature,
-                                   max_tokens=max_tokens, callbacks=callbacks)
-            prompt = get_prompt_template("llm_chat", prompt_name)
-            # 创建PromptTemplate对象
-            prompt_template = PromptTemplate.from_template(prompt)
+            # 从客户端池获取模型，采样参数按请求传入
+            model = get_pooled_chat_model(model_name)
             # 使用PromptTemplate对象创建LLMChain
             llm_chain = LLMChain(
                 llm=model,
                 prompt=prompt_template,
+                llm_kwargs=llm_kwargs,
             )
             if stream:
                 # 流式模式
-                acall_task = asyncio.create_task(wrap_done(
-                    llm_chain.acall({"input": query}),
-                    callback.done),
-                )
-                async for token in callback.aiter():
+                chain_task = asyncio.create_task(llm_chain.acall(inputs, callbacks=callbacks))
+                acall_task = asyncio.create_task(wrap_done(chain_task, callback.done))
+                tokens = coalesce_tokens(callback.aiter()) if coalesce else callback.aiter()
+                async for token in tokens:
                     yield json.dumps({"text": token, "message_id": message_id}, ensure_ascii=False)
                 await acall_task
+                if not chain_task.cancelled() and chain_task.exception() is None:
+                    await save_to_cache(chain_task.result().get("text", ""))
             else:
                 # 非流式模式
-                result = await llm_chain.acall({"input": query})
+                result = await llm_chain.acall(inputs, callbacks=callbacks)
                 answer = result.get("text", "")
                 yield json.dumps({"text": answer, "message_id": message_id}, ensure_ascii=False)
+                await save_to_cache(answer)
         except asyncio.CancelledError:
             if acall_task:
                 acall_task.cancel()
@@ -73,6 +206,9 @@ async def chat(query: str = Body(..., description="用户输入", examples=["恼
             import traceback
             print(traceback.format_exc())
             yield json.dumps({"text": f"模型调用出错: {str(e)}", "message_id": ""}, ensure_ascii=False)
+        finally:
+            # 出错时订阅可能还未读取；响应从未开始输出时由订阅被回收时退订
+            if flight_tokens is not None:
+                flight_tokens.close()
 
-    return EventSourceResponse(chat_iterator())
-
+    return admitted_event_source(chat_iterator(), slot)
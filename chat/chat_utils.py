@@ -1,13 +1,17 @@
 import asyncio
 import os
-from typing import Union, List, Tuple, Dict, Callable, Any, Literal, Optional, Awaitable
+import threading
+from functools import lru_cache
+from typing import Union, List, Tuple, Dict, Callable, Any, Literal, Optional, Awaitable, AsyncIterator
 
 from langchain_community.chat_models import ChatOpenAI
-from langchain_core.prompts import ChatMessagePromptTemplate
+from langchain_core.prompts import ChatMessagePromptTemplate, ChatPromptTemplate, PromptTemplate
 from pydantic import BaseModel, Field
 
-from configs.basic import LLM_DEVICE
+from configs.basic import LLM_DEVICE, HTTPX_DEFAULT_TIMEOUT, LLM_MAX_RETRIES
 from configs.fastchat import get_openai_api_addr
+from db.utils import merge_json_patch
+from utils.stats import register_stats_provider
 
 
 async def wrap_done(fn: Awaitable, event: asyncio.Event):
@@ -63,6 +67,103 @@ class History(BaseModel):
         return h
 
 
+def format_history(messages: List[Dict]) -> str:
+    '''
+    将数据库中的历史消息拼接为with_history模板中的{history}
+    '''
+    lines = []
+    for m in messages:
+        lines.append(f"Human: {m['query']}")
+        lines.append(f"AI: {m['response']}")
+    return "\n".join(lines)
+
+
+@lru_cache(maxsize=8)
+def get_tokenizer(model_name: str):
+    '''
+    加载模型的tokenizer，本地模型不存在时返回None，按字符数估算token数
+    '''
+    config = get_model_worker_config(model_name)
+    if not config.get("model_path_exists"):
+        return None
+    try:
+        from transformers import AutoTokenizer
+        return AutoTokenizer.from_pretrained(config["model_path"], trust_remote_code=config.get("trust_remote_code", False))
+    except Exception as e:
+        print(f"load tokenizer of {model_name} failed, fallback to estimation: {e}")
+        return None
+
+
+def count_tokens(text: str, model_name: str) -> int:
+    '''
+    计算文本的token数
+    '''
+    if not text:
+        return 0
+    tokenizer = get_tokenizer(model_name)
+    if tokenizer is not None:
+        return len(tokenizer.encode(text, add_special_tokens=False))
+    # 估算：中文等非ASCII字符约1个token，ASCII字符约4个一个token
+    non_ascii = sum(1 for c in text if ord(c) > 127)
+    return non_ascii + (len(text) - non_ascii + 3) // 4
+
+
+# 每轮历史消息格式化("Human: ...\nAI: ...")带来的额外token数
+HISTORY_TURN_OVERHEAD = 6
+
+
+def pack_history(turn_tokens: List[int], budget: int) -> int:
+    '''
+    从最近一轮往前，计算token数不超过budget时最多能放入的轮数
+    '''
+    if budget <= 0 or not turn_tokens:
+        return 0
+    total = 0
+    for i, n in enumerate(reversed(turn_tokens)):
+        total += n
+        if total > budget:
+            return i
+    return len(turn_tokens)
+
+
+def get_history_token_budget(prompt_tokens: int, max_tokens: Optional[int] = None) -> int:
+    '''
+    历史消息可用的token预算：上下文长度 - 生成长度 - 当前prompt长度
+    '''
+    from configs.model import MAX_CONTEXT_LENGTH, MAX_TOKENS
+    return MAX_CONTEXT_LENGTH - (max_tokens or MAX_TOKENS) - prompt_tokens
+
+
+def count_message_tokens(messages: List[Dict], model_name: str) -> List[List[int]]:
+    '''
+    计算每条消息问题和回答的token数
+    '''
+    return [[count_tokens(m["query"], model_name), count_tokens(m["response"], model_name)] for m in messages]
+
+
+async def pack_history_messages(messages: List[Dict], model_name: str, budget: int) -> List[Dict]:
+    '''
+    按token预算截取最近的历史消息。
+    每条消息的token数只计算一次，缓存在 MessageModel.meta_data["token_counts"][model_name] 中；
+    新计算的token数合并到各消息已有的meta_data中，一次批量写入。
+    '''
+    from db.repository.message_repository import merge_messages_metadata
+
+    uncounted = [m for m in messages if (m.get("meta_data") or {}).get("token_counts", {}).get(model_name) is None]
+    if uncounted:
+        # 加载tokenizer及分词在线程中执行，不阻塞事件循环
+        patches = {}
+        for m, counts in zip(uncounted, await asyncio.to_thread(count_message_tokens, uncounted, model_name)):
+            patch = {"token_counts": {model_name: counts}}
+            m["meta_data"] = merge_json_patch(m.get("meta_data"), patch)
+            if m.get("id"):
+                patches[m["id"]] = patch
+        await merge_messages_metadata(patches)
+    turn_tokens = [sum(m["meta_data"]["token_counts"][model_name]) + HISTORY_TURN_OVERHEAD for m in messages]
+    n = pack_history(turn_tokens, budget)
+    return messages[len(messages) - n:]
+
+
 def detect_device() -> Literal["cuda", "mps", "cpu"]:
     try:
         import torch
@@ -83,11 +184,8 @@ def llm_device(device: str = None) -> Literal["cuda", "mps", "cpu"]:
 
 
 
-def get_model_worker_config(model_name: str = None) -> dict:
-    '''
-    加载model worker的配置项。
-    优先级:FSCHAT_MODEL_WORKERS[model_name] > ONLINE_LLM_MODEL[model_name] > FSCHAT_MODEL_WORKERS["default"]
-    '''
+@lru_cache(maxsize=None)
+def _load_model_worker_config(model_name: str = None) -> dict:
     from configs.model import MODEL_PATH
     from configs.fastchat import FSCHAT_MODEL_WORKERS
 
@@ -104,6 +202,15 @@ def get_model_worker_config(model_name: str = None) -> dict:
     return config
 
 
+def get_model_worker_config(model_name: str = None) -> dict:
+    '''
+    加载model worker的配置项。
+    优先级:FSCHAT_MODEL_WORKERS[model_name] > ONLINE_LLM_MODEL[model_name] > FSCHAT_MODEL_WORKERS["default"]
+    合并结果按模型缓存，返回副本，调用方可随意修改。
+    '''
+    return _load_model_worker_config(model_name).copy()
+
+
 def get_chat_model(model_name: str,
         temperature: float,
         max_tokens: int = None,
@@ -127,21 +234,143 @@ def get_chat_model(model_name: str,
         temperature=temperature,
         max_tokens=max_tokens,
         openai_proxy=model_config.get("openai_proxy"),
-        request_timeout=300,  # 增加超时时间到300秒
-        max_retries=3,        # 增加重试次数
+        request_timeout=HTTPX_DEFAULT_TIMEOUT,  # 增加超时时间到300秒
+        max_retries=LLM_MAX_RETRIES,
         **kwargs
     )
     return model
 
 
+class ChatModelPool:
+    """
+    进程内复用的ChatOpenAI客户端池，按(model_name, api_base, timeout)区分。
+    所有客户端共享同一个keep-alive连接池；temperature、max_tokens、callbacks等请求级参数
+    在调用时传入，不再为每个请求重新创建模型对象。
+    """
+
+    def __init__(self):
+        self._models: Dict[Tuple[str, str, float], ChatOpenAI] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, model_name: str, request_timeout: float = HTTPX_DEFAULT_TIMEOUT) -> ChatOpenAI:
+        model_config = get_model_worker_config(model_name)
+        api_base = model_config.get("api_base_url", get_openai_api_addr())
+        key = (model_name, api_base, request_timeout)
+        model = self._models.get(key)
+        if model is not None:
+            self.hits += 1
+            return model
+        with self._lock:
+            model = self._models.get(key)
+            if model is None:
+                self.misses += 1
+                model = self._create(model_name, api_base, request_timeout, model_config)
+                self._models[key] = model
+            return model
+
+    @staticmethod
+    def _create(model_name: str, api_base: str, request_timeout: float, model_config: dict) -> ChatOpenAI:
+        import openai
+        from utils.http import get_shared_httpx_async_client
+
+        api_key = model_config.get("api_key", "EMPTY")
+        async_client = openai.AsyncOpenAI(
+            api_key=api_key,
+            base_url=api_base,
+            timeout=request_timeout,
+            max_retries=LLM_MAX_RETRIES,
+            http_client=get_shared_httpx_async_client(model_config.get("openai_proxy")),
+        ).chat.completions
+        return ChatOpenAI(
+            streaming=True,
+            verbose=True,
+            openai_api_key=api_key,
+            openai_api_base=api_base,
+            model_name=model_name,
+            openai_proxy=model_config.get("openai_proxy"),
+            request_timeout=request_timeout,
+            max_retries=LLM_MAX_RETRIES,
+            async_client=async_client,
+        )
+
+    def clear(self):
+        with self._lock:
+            self._models.clear()
+
+    def stats(self) -> dict:
+        return {"size": len(self._models), "hits": self.hits, "misses": self.misses}
+
+
+chat_model_pool = ChatModelPool()
+register_stats_provider("chat_model_pool", chat_model_pool.stats)
+
+
+def get_pooled_chat_model(model_name: str, request_timeout: float = HTTPX_DEFAULT_TIMEOUT) -> ChatOpenAI:
+    """
+    从客户端池获取ChatOpenAI模型，采样参数通过 get_llm_kwargs 在调用时传入
+    """
+    return chat_model_pool.get(model_name, request_timeout)
+
+
+def get_llm_kwargs(temperature: float, max_tokens: Optional[int] = None, **kwargs: Any) -> Dict[str, Any]:
+    """
+    请求级的模型调用参数，用于LLMChain(llm_kwargs=...)
+    """
+    llm_kwargs = {"temperature": temperature, **kwargs}
+    if max_tokens is not None:
+        llm_kwargs["max_tokens"] = max_tokens
+    return llm_kwargs
+
+
+async def astream_llm_chain(model_name: str, prompt_template: Union[PromptTemplate, ChatPromptTemplate],
+                            inputs: Dict[str, Any], llm_kwargs: Dict[str, Any]) -> AsyncIterator[str]:
+    """
+    以LLMChain流式生成，逐个返回token；生成出错时在token流结束后抛出异常
+    """
+    from langchain.callbacks import AsyncIteratorCallbackHandler
+    from langchain.chains.llm import LLMChain
+
+    callback = AsyncIteratorCallbackHandler()
+    llm_chain = LLMChain(llm=get_pooled_chat_model(model_name), prompt=prompt_template, llm_kwargs=llm_kwargs)
+    chain_task = asyncio.create_task(llm_chain.acall(inputs, callbacks=[callback]))
+    done_task = asyncio.create_task(wrap_done(chain_task, callback.done))
+    try:
+        async for token in callback.aiter():
+            yield token
+        await done_task
+        chain_task.result()
+    finally:
+        chain_task.cancel()
+        done_task.cancel()
+
+
+def get_openai_messages(prompt_template: Union[PromptTemplate, ChatPromptTemplate],
+                        inputs: Dict[str, Any]) -> List[Dict[str, str]]:
+    """
+    渲染prompt，得到与ChatOpenAI发送内容一致的OpenAI格式消息，供direct引擎使用
+    """
+    from langchain_community.adapters.openai import convert_message_to_dict
+
+    if isinstance(prompt_template, ChatPromptTemplate):
+        return [convert_message_to_dict(m) for m in prompt_template.format_messages(**inputs)]
+    return [{"role": "user", "content": prompt_template.format(**inputs)}]
+
+
 def get_prompt_template(type: str, name: str) -> Optional[str]:
     '''
     从prompt_config中加载模板内容
     type: "llm_chat","agent_chat","knowledge_base_chat","search_engine_chat"的其中一种，如果有新功能，应该进行加入。
     '''
+    from chat.prompt_registry import prompt_registry
+    # 模板文件修改后自动重新加载，无需重启服务；未修改时直接使用内存中的模板。
+    return prompt_registry.get(type, name)
+
 
-    from configs import prompt
-    import importlib
-    # 强制动态加载，避免修改配置文件后，重启服务。
-    importlib.reload(prompt)
-    return prompt.PROMPT_TEMPLATES[type].get(name)
\ No newline at end of file
+def get_compiled_prompt_template(type: str, name: str) -> Optional[PromptTemplate]:
+    '''
+    获取编译好的PromptTemplate对象，避免每次请求重复解析模板
+    '''
+    from chat.prompt_registry import prompt_registry
+    return prompt_registry.get_compiled(type, name)
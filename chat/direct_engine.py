@@ -0,0 +1,101 @@
+import json
+from typing import List, Dict, Any, AsyncIterator, Optional
+
+from configs.basic import HTTPX_DEFAULT_TIMEOUT
+from configs.fastchat import get_openai_api_addr
+
+
+class SSEDecoder:
+    """
+    增量解析SSE字节流：按收到的数据块喂入，返回已完整的事件的data字段；未完整的行留到下一次
+    """
+
+    def __init__(self):
+        self._buffer = b""
+        self._data: List[str] = []
+
+    def feed(self, chunk: bytes) -> List[str]:
+        events = []
+        lines = (self._buffer + chunk).split(b"\n")
+        self._buffer = lines.pop()
+        for line in lines:
+            if line.endswith(b"\r"):
+                line = line[:-1]
+            if not line:
+                # 空行结束一个事件
+                if self._data:
+                    events.append("\n".join(self._data))
+                    self._data = []
+            elif line.startswith(b"data:"):
+                value = line[5:]
+                self._data.append((value[1:] if value.startswith(b" ") else value).decode("utf-8"))
+        return events
+
+
+def _api_config(model_name: str, api_base: Optional[str]) -> Dict[str, Any]:
+    from chat.chat_utils import get_model_worker_config
+
+    model_config = get_model_worker_config(model_name)
+    return {
+        "api_base": api_base or model_config.get("api_base_url", get_openai_api_addr()),
+        "api_key": model_config.get("api_key", "EMPTY"),
+        "proxy": model_config.get("openai_proxy"),
+    }
+
+
+def _raise_for_error(payload: Dict[str, Any]):
+    # OpenAI格式的 {"error": {...}} 及fastchat的 {"error_code": ..., "text": ...}
+    error = payload.get("error") or (payload.get("text") if payload.get("error_code") else None)
+    if error:
+        raise RuntimeError(error.get("message", str(error)) if isinstance(error, dict) else str(error))
+
+
+async def astream_chat_completion(model_name: str, messages: List[Dict[str, str]], llm_kwargs: Dict[str, Any],
+                                  api_base: str = None,
+                                  request_timeout: float = HTTPX_DEFAULT_TIMEOUT) -> AsyncIterator[str]:
+    '''
+    不经过LangChain，直接以流式方式调用OpenAI兼容接口(/chat/completions)，逐个返回增量文本
+    使用进程内共享的httpx连接池，边接收边解析SSE
+    '''
+    from utils.http import get_shared_httpx_async_client
+
+    config = _api_config(model_name, api_base)
+    client = get_shared_httpx_async_client(config["proxy"])
+    body = {"model": model_name, "messages": messages, "stream": True, **llm_kwargs}
+    async with client.stream("POST", f"{config['api_base'].rstrip('/')}/chat/completions", json=body,
+                             headers={"Authorization": f"Bearer {config['api_key']}"},
+                             timeout=request_timeout) as response:
+        if response.status_code != 200:
+            await response.aread()
+            raise RuntimeError(f"模型服务返回 {response.status_code}: {response.text}")
+        decoder = SSEDecoder()
+        async for chunk in response.aiter_bytes():
+            for data in decoder.feed(chunk):
+                if data == "[DONE]":
+                    return
+                payload = json.loads(data)
+                _raise_for_error(payload)
+                for choice in payload.get("choices", ()):
+                    content = (choice.get("delta") or {}).get("content")
+                    if content:
+                        yield content
+
+
+async def achat_completion(model_name: str, messages: List[Dict[str, str]], llm_kwargs: Dict[str, Any],
+                           api_base: str = None, request_timeout: float = HTTPX_DEFAULT_TIMEOUT) -> str:
+    '''
+    非流式调用OpenAI兼容接口，返回完整回答
+    '''
+    from utils.http import get_shared_httpx_async_client
+
+    config = _api_config(model_name, api_base)
+    client = get_shared_httpx_async_client(config["proxy"])
+    response = await client.post(f"{config['api_base'].rstrip('/')}/chat/completions",
+                                 json={"model": model_name, "messages": messages, "stream": False, **llm_kwargs},
+                                 headers={"Authorization": f"Bearer {config['api_key']}"},
+                                 timeout=request_timeout)
+    if response.status_code != 200:
+        raise RuntimeError(f"模型服务返回 {response.status_code}: {response.text}")
+    payload = response.json()
+    _raise_for_error(payload)
+    return payload["choices"][0]["message"].get("content") or ""
@@ -0,0 +1,70 @@
+import asyncio
+from typing import List, Optional
+
+from fastapi import Body, File, Form, Request, UploadFile
+
+from chat.admission import admission_controller, admitted_event_source, request_tenant, AdmissionRejected
+from chat.chat_utils import History
+from chat.knowledge_base_chat import retrieval_chat_iterator
+from configs.basic import LLM_MODELS
+from configs.kb import VECTOR_SEARCH_TOP_K, SCORE_THRESHOLD, FILE_CHAT
+from configs.model import TEMPERATURE
+from knowledge_base.document_loader import SUPPORTED_EXTS, file_ext
+from knowledge_base.file_chat import file_chat_manager
+from pages.api_utils import BaseResponse
+
+
+async def upload_temp_docs(files: List[UploadFile] = File(..., description="上传文件，支持多文件"),
+                           prev_id: str = Form(None, description="前知识库ID，传入时替换该会话的文件"),
+                           ) -> BaseResponse:
+    '''
+    上传文件用于文件对话，返回file_chat_id；文件在后台切分、向量化，只保存在内存中
+    '''
+    contents, total = [], 0
+    for file in files:
+        if file_ext(file.filename) not in SUPPORTED_EXTS:
+            return BaseResponse(code=403, msg=f"不支持的文件类型: {file.filename}")
+        content = await file.read()
+        total += len(content)
+        if total > FILE_CHAT["max_upload_mb"] * 1024 * 1024:
+            return BaseResponse(code=413, msg=f"上传文件总大小超过 {FILE_CHAT['max_upload_mb']}MB")
+        contents.append((file.filename, content))
+    session = file_chat_manager.create(contents, prev_id or None)
+    return BaseResponse(code=200, msg="文件上传成功，正在建立索引", data=session.info())
+
+
+async def file_chat(request: Request,
+                    query: str = Body(..., description="用户输入", examples=["你好"]),
+                    knowledge_id: str = Body(..., description="临时知识库ID(file_chat_id)"),
+                    top_k: int = Body(VECTOR_SEARCH_TOP_K, description="匹配向量数"),
+                    score_threshold: float = Body(SCORE_THRESHOLD,
+                                                  description="知识库匹配相关度阈值，取值范围在0-1之间，"
+                                                              "相似度低于该值的文档不会用于回答",
+                                                  ge=0, le=1),
+                    conversation_id: str = Body("", description="对话框ID"),
+                    history: List[History] = Body([], description="历史对话"),
+                    stream: bool = Body(False, description="流式输出"),
+                    model_name: str = Body(LLM_MODELS[0], description="LLM 模型名称。"),
+                    temperature: float = Body(TEMPERATURE, description="LLM 采样温度", ge=0.0, le=2.0),
+                    max_tokens: Optional[int] = Body(None, description="限制LLM生成Token数量，默认None代表模型最大值"),
+                    prompt_name: str = Body("default", description="使用的prompt模板名称(在configs/prompt.py中配置)"),
+                    ):
+    session = file_chat_manager.get(knowledge_id)
+    if session is None:
+        return BaseResponse(code=404, msg=f"未找到临时知识库 {knowledge_id}，请先上传文件")
+    try:
+        await asyncio.wait_for(session.ready.wait(), FILE_CHAT["wait_timeout"])
+    except asyncio.TimeoutError:
+        return BaseResponse(code=503, msg="文件仍在处理中，请稍后再试", data=session.info())
+    if session.status != "ready":
+        return BaseResponse(code=500, msg=f"文件处理失败: {session.error}", data=session.info())
+
+    try:
+        slot = await admission_controller.acquire(model_name, *request_tenant(request, conversation_id))
+    except AdmissionRejected as e:
+        return e.to_response()
+
+    return admitted_event_source(retrieval_chat_iterator(
+        query, lambda k: file_chat_manager.search(session, query, k, score_threshold), top_k, "file_chat",
+        {"file_chat_id": knowledge_id, "files": session.file_names}, conversation_id, history, stream, model_name,
+        temperature, max_tokens, prompt_name), slot)
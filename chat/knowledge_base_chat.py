@@ -0,0 +1,131 @@
+import asyncio
+import json
+import time
+from typing import List, Optional, Dict, Any, Callable, Awaitable
+
+from fastapi import Body, Request
+from langchain.callbacks import AsyncIteratorCallbackHandler
+from langchain.chains.llm import LLMChain
+from langchain_core.prompts import ChatPromptTemplate, HumanMessagePromptTemplate
+
+from callback_handler.conversation_callback_handler import ConversationCallbackHandler
+from chat.admission import admission_controller, admitted_event_source, request_tenant, AdmissionRejected
+from chat.chat_utils import History, get_pooled_chat_model, get_llm_kwargs, get_compiled_prompt_template, wrap_done
+from configs.basic import LLM_MODELS
+from configs.kb import VECTOR_SEARCH_TOP_K, SCORE_THRESHOLD
+from configs.model import TEMPERATURE, USE_RERANKER, RERANKER_CANDIDATE_FACTOR
+from db.repository.message_repository import add_message
+from db.session import request_session
+from knowledge_base.kb_service import get_kb_service
+from knowledge_base.reranker import get_reranker
+from pages.api_utils import BaseResponse
+
+
+async def knowledge_base_chat(request: Request,
+                              query: str = Body(..., description="用户输入", examples=["你好"]),
+                              knowledge_base_name: str = Body(..., description="知识库名称", examples=["samples"]),
+                              top_k: int = Body(VECTOR_SEARCH_TOP_K, description="匹配向量数"),
+                              score_threshold: float = Body(SCORE_THRESHOLD,
+                                                            description="知识库匹配相关度阈值，取值范围在0-1之间，"
+                                                                        "相似度低于该值的文档不会用于回答",
+                                                            ge=0, le=1),
+                              conversation_id: str = Body("", description="对话框ID"),
+                              history: List[History] = Body([],
+                                                            description="历史对话",
+                                                            examples=[[
+                                                                {"role": "user",
+                                                                 "content": "我们来玩成语接龙，我先来，生龙活虎"},
+                                                                {"role": "assistant",
+                                                                 "content": "虎头虎脑"}]]
+                                                            ),
+                              stream: bool = Body(False, description="流式输出"),
+                              model_name: str = Body(LLM_MODELS[0], description="LLM 模型名称。"),
+                              temperature: float = Body(TEMPERATURE, description="LLM 采样温度", ge=0.0, le=2.0),
+                              max_tokens: Optional[int] = Body(None, description="限制LLM生成Token数量，默认None代表模型最大值"),
+                              prompt_name: str = Body("default", description="使用的prompt模板名称(在configs/prompt.py中配置)"),
+                              ):
+    kb = await get_kb_service(knowledge_base_name)
+    if kb is None:
+        return BaseResponse(code=404, msg=f"未找到知识库 {knowledge_base_name}")
+
+    try:
+        slot = await admission_controller.acquire(model_name, *request_tenant(request, conversation_id))
+    except AdmissionRejected as e:
+        return e.to_response()
+
+    return admitted_event_source(retrieval_chat_iterator(
+        query, lambda k: kb.search(query, k, score_threshold), top_k, "knowledge_base_chat",
+        {"kb_name": knowledge_base_name}, conversation_id, history, stream, model_name, temperature, max_tokens,
+        prompt_name), slot)
+
+
+async def retrieval_chat_iterator(query: str, retrieve: Callable[[int], Awaitable[List[Dict[str, Any]]]], top_k: int,
+                                  chat_type: str, message_metadata: Dict[str, Any], conversation_id: str,
+                                  history: List[History], stream: bool, model_name: str, temperature: float,
+                                  max_tokens: Optional[int], prompt_name: str):
+    '''
+    检索增强对话：retrieve(k) 返回与 KBService.search 相同格式的文档，启用reranker时多取候选再重排
+    知识库对话与文件对话共用，最后一帧为匹配到的文档
+    '''
+    callback = AsyncIteratorCallbackHandler()
+    callbacks = [callback]
+    acall_task = None
+    try:
+        start = time.perf_counter()
+        # 请求级会话只包含检索阶段的数据库操作，不在重排和模型生成期间占用连接
+        async with request_session():
+            docs = await retrieve(top_k * RERANKER_CANDIDATE_FACTOR if USE_RERANKER else top_k)
+        retrieval_metadata = {"search_time": time.perf_counter() - start}
+        if USE_RERANKER:
+            docs, rerank_info = await get_reranker().arerank(query, docs, top_k)
+            retrieval_metadata["rerank_time"] = rerank_info.pop("rerank_time")
+            retrieval_metadata["reranker"] = rerank_info
+        context = "\n".join(doc["page_content"] for doc in docs)
+        # 没有匹配到文档时使用empty模板
+        prompt_template = get_compiled_prompt_template("knowledge_base_chat",
+                                                       prompt_name if docs else "empty")
+        if history:
+            input_msg = HumanMessagePromptTemplate(prompt=prompt_template)
+            prompt_template = ChatPromptTemplate.from_messages(
+                [History.from_data(h).to_msg_template() for h in history] + [input_msg])
+        inputs = {"input": query, "context": context} if docs else {"input": query}
+
+        message_id = await add_message(conversation_id, chat_type, query,
+                                       metadata={**message_metadata,
+                                                 "doc_ids": [doc["doc_id"] for doc in docs]})
+        callbacks.append(ConversationCallbackHandler(conversation_id, message_id, chat_type, query))
+
+        llm_chain = LLMChain(
+            llm=get_pooled_chat_model(model_name),
+            prompt=prompt_template,
+            llm_kwargs=get_llm_kwargs(temperature, max_tokens),
+        )
+        if stream:
+            acall_task = asyncio.create_task(wrap_done(
+                llm_chain.acall(inputs, callbacks=callbacks),
+                callback.done),
+            )
+            async for token in callback.aiter():
+                yield json.dumps({"text": token, "message_id": message_id}, ensure_ascii=False)
+            await acall_task
+        else:
+            result = await llm_chain.acall(inputs, callbacks=callbacks)
+            yield json.dumps({"text": result.get("text", ""), "message_id": message_id}, ensure_ascii=False)
+
+        source_documents = [
+            f"出处 [{i + 1}] {doc['file_name']} (相似度 {doc['score']:.3f}"
+            + (f", 相关度 {doc['relevance_score']:.3f}" if "relevance_score" in doc else "")
+            + f")\n\n{doc['page_content']}\n\n"
+            for i, doc in enumerate(docs)
+        ]
+        if not source_documents:
+            source_documents.append("<span style='color:red'>未找到相关文档,该回答为大模型自身能力解答！</span>")
+        yield json.dumps({"docs": source_documents, "message_id": message_id,
+                          "metadata": retrieval_metadata}, ensure_ascii=False)
+    except asyncio.CancelledError:
+        if acall_task:
+            acall_task.cancel()
+    except Exception as e:
+        import traceback
+        print(traceback.format_exc())
+        yield json.dumps({"text": f"模型调用出错: {str(e)}", "message_id": ""}, ensure_ascii=False)
@@ -0,0 +1,141 @@
+import importlib
+import os
+import sys
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+from langchain_core.prompts import PromptTemplate
+
+from configs.basic import PROMPT_TEMPLATE_DIR, PROMPT_RELOAD_INTERVAL
+from utils.stats import register_stats_provider
+
+TEMPLATE_FILE_EXTS = {".txt": "f-string", ".jinja2": "jinja2"}
+
+
+class PromptTemplateRegistry:
+    """
+    Prompt模板注册表
+    常驻内存保存模板文本及编译好的PromptTemplate，仅当 configs/prompt.py 或模板目录中的文件发生变化时才重新加载，
+    修改模板后无需重启服务。
+    """
+
+    def __init__(self,
+                 module_name: str = "configs.prompt",
+                 template_dir: str = PROMPT_TEMPLATE_DIR,
+                 check_interval: float = PROMPT_RELOAD_INTERVAL):
+        self.module_name = module_name
+        self.template_dir = template_dir
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        # {type: {name: (text, template_format)}}
+        self._templates: Dict[str, Dict[str, Tuple[str, str]]] = {}
+        self._compiled: Dict[Tuple[str, str], PromptTemplate] = {}
+        self._signature = None
+        self._next_check = 0.0
+        self.hits = 0
+        self.misses = 0
+        self.reloads = 0
+
+    def _module_file(self) -> Optional[str]:
+        module = sys.modules.get(self.module_name)
+        if module is None:
+            module = importlib.import_module(self.module_name)
+        return getattr(module, "__file__", None)
+
+    def _iter_template_files(self):
+        if not self.template_dir or not os.path.isdir(self.template_dir):
+            return
+        for type_entry in os.scandir(self.template_dir):
+            if not type_entry.is_dir():
+                continue
+            for entry in os.scandir(type_entry.path):
+                name, ext = os.path.splitext(entry.name)
+                if entry.is_file() and ext in TEMPLATE_FILE_EXTS:
+                    yield type_entry.name, name, ext, entry
+
+    def _sources_signature(self) -> Tuple:
+        '''
+        以文件的(路径, mtime, size)作为版本标识，任一变化即触发重新加载
+        '''
+        signature = []
+        module_file = self._module_file()
+        if module_file and os.path.exists(module_file):
+            st = os.stat(module_file)
+            signature.append((module_file, st.st_mtime_ns, st.st_size))
+        for _, _, _, entry in self._iter_template_files():
+            st = entry.stat()
+            signature.append((entry.path, st.st_mtime_ns, st.st_size))
+        return tuple(sorted(signature))
+
+    def _load(self) -> Dict[str, Dict[str, Tuple[str, str]]]:
+        module = importlib.reload(importlib.import_module(self.module_name))
+        templates = {
+            type: {name: (text, "f-string") for name, text in items.items()}
+            for type, items in getattr(module, "PROMPT_TEMPLATES", {}).items()
+        }
+        for type, name, ext, entry in self._iter_template_files():
+            with open(entry.path, encoding="utf-8") as f:
+                templates.setdefault(type, {})[name] = (f.read(), TEMPLATE_FILE_EXTS[ext])
+        return templates
+
+    def _maybe_reload(self) -> None:
+        now = time.monotonic()
+        if self._signature is not None and now < self._next_check:
+            return
+        with self._lock:
+            if self._signature is not None and now < self._next_check:
+                return
+            self._next_check = now + self.check_interval
+            signature = self._sources_signature()
+            if signature == self._signature:
+                return
+            self._templates = self._load()
+            self._compiled = {}
+            self._signature = signature
+            self.reloads += 1
+
+    def get(self, type: str, name: str) -> Optional[str]:
+        '''
+        获取模板原文
+        '''
+        self._maybe_reload()
+        item = self._templates.get(type, {}).get(name)
+        return item[0] if item else None
+
+    def get_compiled(self, type: str, name: str) -> Optional[PromptTemplate]:
+        '''
+        获取编译好的PromptTemplate，同一版本的模板只编译一次
+        '''
+        self._maybe_reload()
+        key = (type, name)
+        compiled = self._compiled.get(key)
+        if compiled is not None:
+            self.hits += 1
+            return compiled
+        self.misses += 1
+        item = self._templates.get(type, {}).get(name)
+        if item is None:
+            return None
+        text, template_format = item
+        compiled = PromptTemplate.from_template(text, template_format=template_format)
+        self._compiled[key] = compiled
+        return compiled
+
+    def list_names(self, type: str) -> list:
+        self._maybe_reload()
+        return list(self._templates.get(type, {}).keys())
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "reloads": self.reloads,
+            "hit_rate": self.hits / total if total else 0.0,
+            "compiled": len(self._compiled),
+        }
+
+
+prompt_registry = PromptTemplateRegistry()
+register_stats_provider("prompt_templates", prompt_registry.stats)
@@ -0,0 +1,227 @@
+import asyncio
+import hashlib
+import json
+import math
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Dict, Any, Iterator, Tuple
+
+from configs.basic import RESPONSE_CACHE
+from utils.stats import register_stats_provider
+
+
+def make_response_cache_key(model_name: str, prompt_name: str, prompt: str, params: Dict[str, Any]) -> str:
+    '''
+    按(模型, prompt模板, 渲染后的prompt, 采样参数)生成缓存key
+    '''
+    raw = json.dumps([model_name, prompt_name, prompt, params], ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class _DiskTier:
+    """
+    sqlite磁盘缓存，服务重启后仍可命中
+    每隔purge_interval秒在写入时删除过期的回答；回答占用超过max_bytes时按过期时间(即写入顺序)删除最早的回答，
+    降到上限的90%
+    """
+
+    def __init__(self, path: str, max_bytes: int = 0, purge_interval: float = RESPONSE_CACHE["purge_interval"]):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.max_bytes = max_bytes
+        self.purge_interval = purge_interval
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("CREATE TABLE IF NOT EXISTS response_cache "
+                           "(key TEXT PRIMARY KEY, answer TEXT NOT NULL, expires_at REAL NOT NULL)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS ix_response_cache_expires_at ON response_cache (expires_at)")
+        self._conn.commit()
+        self.evictions = 0
+        self.purge_expired()
+
+    def _total_bytes(self) -> int:
+        return self._conn.execute(
+            "SELECT COALESCE(SUM(LENGTH(CAST(answer AS BLOB))), 0) FROM response_cache").fetchone()[0]
+
+    def _evict(self):
+        count = self._conn.execute("SELECT COUNT(*) FROM response_cache").fetchone()[0]
+        self.bytes = self._total_bytes()
+        target = int(0.9 * self.max_bytes)
+        if count and self.bytes > target:
+            n = math.ceil((self.bytes - target) / (self.bytes / count))
+            self._conn.execute("DELETE FROM response_cache WHERE key IN "
+                               "(SELECT key FROM response_cache ORDER BY expires_at LIMIT ?)", (n,))
+            self.evictions += n
+            self.bytes = self._total_bytes()
+
+    def get(self, key: str) -> Optional[Tuple[str, float]]:
+        with self._lock:
+            row = self._conn.execute("SELECT answer, expires_at FROM response_cache WHERE key=?", (key,)).fetchone()
+        return row
+
+    def set(self, key: str, answer: str, expires_at: float):
+        if time.monotonic() - self._purged_at > self.purge_interval:
+            self.purge_expired()
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO response_cache VALUES (?, ?, ?)", (key, answer, expires_at))
+            # 覆盖写入的回答会重复计入，淘汰时重新统计
+            self.bytes += len(answer.encode("utf-8"))
+            if self.max_bytes and self.bytes > self.max_bytes:
+                self._evict()
+            self._conn.commit()
+
+    def delete(self, key: str):
+        with self._lock:
+            self._conn.execute("DELETE FROM response_cache WHERE key=?", (key,))
+            self._conn.commit()
+
+    def purge_expired(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM response_cache WHERE expires_at<?", (time.time(),))
+            self._conn.commit()
+            self.bytes = self._total_bytes()
+            self._purged_at = time.monotonic()
+
+
+class ResponseCache:
+    """
+    确定性请求的回答缓存
+    内存层为LRU，按TTL过期、按占用字节数淘汰；可选sqlite磁盘层，内存未命中时查询磁盘并回填内存。
+    磁盘层在首次使用时打开，异步接口中的打开、读写均在线程中执行，不阻塞事件循环。
+    """
+
+    def __init__(self,
+                 ttl: float = RESPONSE_CACHE["ttl"],
+                 max_memory_bytes: int = RESPONSE_CACHE["max_memory_mb"] * 1024 * 1024,
+                 disk_path: Optional[str] = RESPONSE_CACHE["disk_path"],
+                 max_disk_bytes: int = RESPONSE_CACHE["disk_max_mb"] * 1024 * 1024):
+        self.ttl = ttl
+        self.max_memory_bytes = max_memory_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self._lock = threading.Lock()
+        self._disk_lock = threading.Lock()
+        # key -> (answer, expires_at, size)
+        self._items: "OrderedDict[str, Tuple[str, float, int]]" = OrderedDict()
+        self.memory_bytes = 0
+        self._disk_path = disk_path
+        self._disk: Optional[_DiskTier] = None
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @property
+    def disk(self) -> Optional[_DiskTier]:
+        if self._disk is None and self._disk_path:
+            with self._disk_lock:
+                if self._disk is None:
+                    self._disk = _DiskTier(self._disk_path, self.max_disk_bytes)
+        return self._disk
+
+    @staticmethod
+    def cacheable(temperature: float) -> bool:
+        '''
+        只缓存确定性采样的请求
+        '''
+        return RESPONSE_CACHE["enabled"] and temperature == 0
+
+    def _put_memory(self, key: str, answer: str, expires_at: float):
+        size = len(answer.encode("utf-8")) + len(key)
+        if size > self.max_memory_bytes:
+            return
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self.memory_bytes -= old[2]
+            self._items[key] = (answer, expires_at, size)
+            self.memory_bytes += size
+            while self.memory_bytes > self.max_memory_bytes:
+                _, (_, _, evicted) = self._items.popitem(last=False)
+                self.memory_bytes -= evicted
+                self.evictions += 1
+
+    def _get_memory(self, key: str) -> Optional[str]:
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                return None
+            answer, expires_at, size = item
+            if expires_at < time.time():
+                del self._items[key]
+                self.memory_bytes -= size
+                self.expirations += 1
+                return None
+            self._items.move_to_end(key)
+            return answer
+
+    def get(self, key: str) -> Optional[str]:
+        answer = self._get_memory(key)
+        if answer is not None:
+            self.hits += 1
+            return answer
+        if self.disk is not None:
+            row = self.disk.get(key)
+            if row is not None:
+                answer, expires_at = row
+                if expires_at >= time.time():
+                    self.hits += 1
+                    self.disk_hits += 1
+                    self._put_memory(key, answer, expires_at)
+                    return answer
+                self.disk.delete(key)
+                self.expirations += 1
+        self.misses += 1
+        return None
+
+    def set(self, key: str, answer: str):
+        expires_at = time.time() + self.ttl
+        self._put_memory(key, answer, expires_at)
+        if self.disk is not None:
+            self.disk.set(key, answer, expires_at)
+
+    async def aget(self, key: str) -> Optional[str]:
+        answer = self._get_memory(key)
+        if answer is not None or not self._disk_path:
+            self.hits += answer is not None
+            self.misses += answer is None
+            return answer
+        # 打开及查询磁盘层放到线程中执行，避免阻塞事件循环
+        return await asyncio.to_thread(self.get, key)
+
+    async def aset(self, key: str, answer: str):
+        if not self._disk_path:
+            self.set(key, answer)
+        else:
+            await asyncio.to_thread(self.set, key, answer)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        stats = {
+            "items": len(self._items),
+            "memory_bytes": self.memory_bytes,
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+        if self._disk is not None:
+            stats["disk_mb"] = round(self._disk.bytes / 1024 / 1024, 2)
+            stats["disk_evictions"] = self._disk.evictions
+        return stats
+
+
+def iter_replay_chunks(answer: str, chunk_size: int = RESPONSE_CACHE["replay_chunk_size"]) -> Iterator[str]:
+    '''
+    命中缓存时按固定字符数切分回答，按流式输出的帧格式回放
+    '''
+    for i in range(0, len(answer), chunk_size):
+        yield answer[i:i + chunk_size]
+
+
+response_cache = ResponseCache()
+register_stats_provider("response_cache", response_cache.stats)
@@ -0,0 +1,177 @@
+import asyncio
+import json
+import threading
+import time
+from typing import Dict, List, Optional, Tuple, Any
+
+import numpy as np
+
+from configs.basic import SEMANTIC_CACHE
+from embeddings.base import Embedder
+from utils.stats import register_stats_provider
+
+
+class _Namespace:
+    """
+    单个(模型, prompt模板, 采样参数)命名空间：问题向量矩阵及对应的回答
+    矩阵按需倍增，最多capacity行，写满后复用最久未命中(或已过期)的行
+    """
+
+    def __init__(self, dim: int, capacity: int):
+        self.capacity = capacity
+        rows = min(capacity, 64)
+        self.vectors = np.zeros((rows, dim), dtype=np.float32)
+        self.last_used = np.zeros(rows, dtype=np.float64)
+        self.expires_at = np.zeros(rows, dtype=np.float64)
+        self.answers: List[Optional[str]] = [None] * rows
+        self.size = 0
+
+    def _grow(self):
+        rows = min(self.capacity, len(self.vectors) * 2)
+        extra = rows - len(self.vectors)
+        self.vectors = np.concatenate([self.vectors, np.zeros((extra, self.vectors.shape[1]), dtype=np.float32)])
+        self.last_used = np.concatenate([self.last_used, np.zeros(extra)])
+        self.expires_at = np.concatenate([self.expires_at, np.zeros(extra)])
+        self.answers.extend([None] * extra)
+
+    def allocate(self, now: float) -> Tuple[int, bool]:
+        '''
+        返回可写入的行号及是否淘汰了有效数据
+        '''
+        if self.size < self.capacity:
+            if self.size == len(self.vectors):
+                self._grow()
+            self.size += 1
+            return self.size - 1, False
+        # 已过期的行优先复用
+        priority = np.where(self.expires_at < now, -1.0, self.last_used)
+        row = int(np.argmin(priority))
+        return row, bool(self.expires_at[row] >= now)
+
+    def search(self, queries: np.ndarray, now: float) -> Tuple[np.ndarray, np.ndarray]:
+        '''
+        批量查询，返回每个问题最相似的行号及相似度
+        '''
+        if self.size == 0:
+            return np.full(len(queries), -1), np.full(len(queries), -np.inf, dtype=np.float32)
+        scores = queries @ self.vectors[:self.size].T
+        scores[:, self.expires_at[:self.size] < now] = -np.inf
+        rows = np.argmax(scores, axis=1)
+        return rows, scores[np.arange(len(queries)), rows]
+
+
+class SemanticCache:
+    """
+    语义回答缓存
+    按(模型, prompt模板, 采样参数)划分命名空间，对问题向量做矩阵内积检索，相似度超过阈值即视为命中。
+    max_tokens等参数不同的请求回答也不同(如被截断)，不能互相命中。
+    """
+
+    def __init__(self,
+                 embedder: Embedder = None,
+                 threshold: float = SEMANTIC_CACHE["threshold"],
+                 capacity: int = SEMANTIC_CACHE["capacity"],
+                 ttl: float = SEMANTIC_CACHE["ttl"]):
+        self._embedder = embedder
+        self.threshold = threshold
+        self.capacity = capacity
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._namespaces: Dict[Tuple[str, str, str], _Namespace] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def embedder(self) -> Embedder:
+        if self._embedder is None:
+            from embeddings.base import get_embedder
+            self._embedder = get_embedder()
+        return self._embedder
+
+    @staticmethod
+    def cacheable(temperature: float) -> bool:
+        return SEMANTIC_CACHE["enabled"] and temperature == 0
+
+    def _embed(self, texts: List[str]) -> np.ndarray:
+        return np.asarray(self.embedder.embed_documents(texts), dtype=np.float32)
+
+    @staticmethod
+    def _namespace_key(model_name: str, prompt_name: str, params: Optional[Dict[str, Any]]) -> Tuple[str, str, str]:
+        return model_name, prompt_name, json.dumps(params or {}, ensure_ascii=False, sort_keys=True)
+
+    def lookup_batch(self, model_name: str, prompt_name: str, queries: List[str],
+                     params: Dict[str, Any] = None) -> List[Optional[Tuple[str, float]]]:
+        '''
+        批量查询，返回每个问题命中的(回答, 相似度)，未命中为None
+        params: 模型调用参数(如get_llm_kwargs的结果)，只与相同参数写入的回答匹配
+        '''
+        if not queries:
+            return []
+        namespace = self._namespaces.get(self._namespace_key(model_name, prompt_name, params))
+        if namespace is None:
+            self.misses += len(queries)
+            return [None] * len(queries)
+        vectors = self._embed(queries)
+        now = time.time()
+        results = []
+        with self._lock:
+            rows, scores = namespace.search(vectors, now)
+            for row, score in zip(rows.tolist(), scores.tolist()):
+                if row >= 0 and score >= self.threshold:
+                    namespace.last_used[row] = now
+                    results.append((namespace.answers[row], score))
+                    self.hits += 1
+                else:
+                    results.append(None)
+                    self.misses += 1
+        return results
+
+    def lookup(self, model_name: str, prompt_name: str, query: str,
+               params: Dict[str, Any] = None) -> Optional[Tuple[str, float]]:
+        return self.lookup_batch(model_name, prompt_name, [query], params)[0]
+
+    def add_batch(self, model_name: str, prompt_name: str, queries: List[str], answers: List[str],
+                  params: Dict[str, Any] = None):
+        if not queries:
+            return
+        vectors = self._embed(queries)
+        now = time.time()
+        key = self._namespace_key(model_name, prompt_name, params)
+        with self._lock:
+            namespace = self._namespaces.get(key)
+            if namespace is None:
+                namespace = _Namespace(vectors.shape[1], self.capacity)
+                self._namespaces[key] = namespace
+            for vector, answer in zip(vectors, answers):
+                row, evicted = namespace.allocate(now)
+                self.evictions += evicted
+                namespace.vectors[row] = vector
+                namespace.answers[row] = answer
+                namespace.last_used[row] = now
+                namespace.expires_at[row] = now + self.ttl
+
+    def add(self, model_name: str, prompt_name: str, query: str, answer: str, params: Dict[str, Any] = None):
+        self.add_batch(model_name, prompt_name, [query], [answer], params)
+
+    async def alookup(self, model_name: str, prompt_name: str, query: str,
+                      params: Dict[str, Any] = None) -> Optional[Tuple[str, float]]:
+        # 向量化计算放到线程中执行，避免阻塞事件循环
+        return await asyncio.to_thread(self.lookup, model_name, prompt_name, query, params)
+
+    async def aadd(self, model_name: str, prompt_name: str, query: str, answer: str, params: Dict[str, Any] = None):
+        await asyncio.to_thread(self.add, model_name, prompt_name, query, answer, params)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "namespaces": {f"{m}/{p}/{params}": ns.size for (m, p, params), ns in self._namespaces.items()},
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "evictions": self.evictions,
+        }
+
+
+semantic_cache = SemanticCache()
+register_stats_provider("semantic_cache", semantic_cache.stats)
@@ -0,0 +1,140 @@
+import asyncio
+import weakref
+from typing import Dict, List, Optional, Callable, AsyncIterator
+
+from configs.basic import SINGLE_FLIGHT
+from utils.stats import register_stats_provider
+
+
+class _Flight:
+    """
+    一次正在进行的上游生成：已收到的token依次追加到tokens，每次追加后唤醒等待的订阅者
+    """
+
+    def __init__(self, key: str):
+        self.key = key
+        self.tokens: List[str] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.subscribers = 0
+        self.task: Optional[asyncio.Task] = None
+        self._changed = asyncio.Event()
+
+    def notify(self):
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+
+def _leave(flight: _Flight):
+    flight.subscribers -= 1
+    if not flight.subscribers and not flight.done:
+        flight.task.cancel()
+
+
+class FlightSubscription:
+    """
+    一个订阅者对上游生成的订阅，异步迭代得到该生成的完整token流
+    close() 退订，可重复调用；读取结束、出错或中断时自动退订，从未读取就被丢弃的订阅在回收时退订
+    """
+
+    def __init__(self, flight: _Flight):
+        self._flight = flight
+        # finalize只调用一次回调，显式关闭与回收时退订不会重复计数
+        self._finalizer = weakref.finalize(self, _leave, flight)
+        self._finalizer.atexit = False
+
+    @property
+    def closed(self) -> bool:
+        return not self._finalizer.alive
+
+    def close(self):
+        self._finalizer()
+
+    async def aclose(self):
+        self.close()
+
+    def __aiter__(self) -> AsyncIterator[str]:
+        return self._iterate()
+
+    async def _iterate(self) -> AsyncIterator[str]:
+        flight = self._flight
+        i = 0
+        try:
+            while True:
+                changed = flight._changed
+                while i < len(flight.tokens):
+                    yield flight.tokens[i]
+                    i += 1
+                if flight.done:
+                    if flight.error is not None:
+                        raise flight.error
+                    return
+                await changed.wait()
+        finally:
+            self.close()
+
+
+class SingleFlight:
+    """
+    合并相同的并发请求：同一key(模型、渲染后的prompt、采样参数)在生成期间的后续请求不再请求模型，
+    而是订阅同一个上游生成，从头收到相同的token流。只用于确定性采样(temperature=0)的请求。
+    上游生成在独立任务中运行，发起请求的客户端断开不影响其它订阅者；所有订阅者都断开时取消上游生成。
+    """
+
+    def __init__(self, enabled: bool = SINGLE_FLIGHT["enabled"]):
+        self.enabled = enabled
+        self._flights: Dict[str, _Flight] = {}
+        self.leaders = 0
+        self.followers = 0
+
+    def eligible(self, temperature: float) -> bool:
+        return self.enabled and temperature == 0
+
+    def in_flight(self, key: str) -> bool:
+        return key in self._flights
+
+    def join(self, key: str, generate: Callable[[], AsyncIterator[str]],
+             on_done: Callable[[], None] = None) -> FlightSubscription:
+        '''
+        加入key对应的生成，不存在时调用generate()发起上游生成；返回该生成的订阅
+        订阅者在加入时即计数，尚未开始读取的订阅者(如响应还未开始输出)也会保持上游生成，
+        调用方不再读取时应调用订阅的close()
+        on_done: 发起上游生成时在生成结束(包括取消)后调用，加入已有生成时立即调用，用于归还模型名额
+        '''
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = _Flight(key)
+            self._flights[key] = flight
+            flight.task = asyncio.create_task(self._run(flight, generate))
+            if on_done is not None:
+                flight.task.add_done_callback(lambda _: on_done())
+            self.leaders += 1
+        else:
+            self.followers += 1
+            if on_done is not None:
+                on_done()
+        flight.subscribers += 1
+        return FlightSubscription(flight)
+
+    async def _run(self, flight: _Flight, generate: Callable[[], AsyncIterator[str]]):
+        try:
+            async for token in generate():
+                flight.tokens.append(token)
+                flight.notify()
+        except asyncio.CancelledError:
+            flight.error = RuntimeError("上游生成已取消")
+        except Exception as e:
+            flight.error = e
+        finally:
+            flight.done = True
+            if self._flights.get(flight.key) is flight:
+                del self._flights[flight.key]
+            flight.notify()
+
+    def stats(self) -> Dict[str, int]:
+        return {"in_flight": len(self._flights), "leaders": self.leaders, "followers": self.followers,
+                "subscribers": sum(f.subscribers for f in self._flights.values())}
+
+
+single_flight = SingleFlight()
+register_stats_provider("single_flight", single_flight.stats)
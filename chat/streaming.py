@@ -0,0 +1,60 @@
+import asyncio
+from typing import AsyncIterator
+
+from configs.basic import STREAM_COALESCE
+
+
+async def coalesce_tokens(tokens: AsyncIterator[str], interval_ms: float = STREAM_COALESCE["interval_ms"],
+                          max_chars: int = STREAM_COALESCE["max_chars"]) -> AsyncIterator[str]:
+    '''
+    合并相邻token：收到一帧的第一个token后，最多再等待interval_ms毫秒，期间累计超过max_chars个字符时提前输出。
+    由一个后台任务读取tokens，每帧只在等待超时时创建一次定时器，不为每个token创建任务。
+    tokens结束、出错或被取消时先输出已缓冲的内容，再结束或抛出异常；调用方停止读取或被取消时取消后台任务并等待其结束。
+    '''
+    buffer = []
+    state = {"size": 0, "done": False, "error": None}
+    has_data = asyncio.Event()
+    flush_now = asyncio.Event()
+
+    async def pump():
+        try:
+            async for token in tokens:
+                buffer.append(token)
+                state["size"] += len(token)
+                has_data.set()
+                if state["size"] >= max_chars:
+                    flush_now.set()
+        except (Exception, asyncio.CancelledError) as e:
+            # 上游被取消同样传递给调用方，不能当作正常结束
+            state["error"] = e
+        finally:
+            state["done"] = True
+            has_data.set()
+            flush_now.set()
+
+    pump_task = asyncio.create_task(pump())
+    try:
+        while True:
+            await has_data.wait()
+            if not flush_now.is_set():
+                try:
+                    await asyncio.wait_for(flush_now.wait(), interval_ms / 1000)
+                except asyncio.TimeoutError:
+                    pass
+            text = "".join(buffer)
+            buffer.clear()
+            state["size"] = 0
+            if not state["done"]:
+                has_data.clear()
+                flush_now.clear()
+            if text:
+                yield text
+            if state["done"] and not buffer:
+                break
+        if state["error"] is not None:
+            raise state["error"]
+    finally:
+        if not pump_task.done():
+            pump_task.cancel()
+            # pump捕获取消后正常结束，上游生成器的finally在此之前执行
+            await asyncio.gather(pump_task, return_exceptions=True)
@@ -3,8 +3,6 @@ import os
 from datetime import datetime
 from typing import List
 
-import torch
-
 # 项目根路径（自动计算，避免硬编码）
 PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
@@ -19,12 +17,111 @@ LLM_MODELS: List[str] = ["DeepSeek-R1-Distill-Qwen-1.5B", "bge-large-zh-v1.5"]
 EMBEDDING_MODEL = "m3e-base"
 TEXT_SPLITTER_NAME = "RecursiveCharacterTextSplitter"
 
-# 设备配置
-LLM_DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
+# Prompt模板配置
+# 除 configs/prompt.py 外，可在该目录下按 <type>/<name>.txt 存放模板文件(.jinja2 后缀按jinja2格式解析)，同名覆盖
+PROMPT_TEMPLATE_DIR = os.path.join(PROJECT_ROOT, "prompts")
+# 检查模板文件是否修改的最小间隔(秒)，设为0则每次请求都检查
+PROMPT_RELOAD_INTERVAL = 1.0
+
+# 设备配置，auto 时在首次加载模型时检测(cuda/mps/cpu)；导入配置不加载torch，入库子进程等不需要torch的进程启动更快
+LLM_DEVICE = "auto"
 EMBEDDING_DEVICE = LLM_DEVICE
 
 # 网络超时
 HTTPX_DEFAULT_TIMEOUT = 300
+# 进程内共享HTTP连接池(keep-alive)配置
+HTTPX_MAX_CONNECTIONS = 100
+HTTPX_MAX_KEEPALIVE_CONNECTIONS = 20
+HTTPX_KEEPALIVE_EXPIRY = 60
+# 调用模型服务失败时的重试次数。过载时重试会成倍增加负载，由准入控制快速返回429代替
+LLM_MAX_RETRIES = 1
 
 # 项目版本
-VERSION = "0.2.1"
\ No newline at end of file
+VERSION = "0.2.1"
+
+# 缓存目录
+CACHE_PATH = os.path.join(PROJECT_ROOT, "cache")
+
+# 回答缓存：对 temperature=0 的确定性请求，按(模型, prompt模板, 渲染后的prompt, 采样参数)缓存回答。
+# 需要请求中传入 use_cache=True 才会生效
+RESPONSE_CACHE = {
+    "enabled": True,
+    # 缓存有效期(秒)
+    "ttl": 3600,
+    # 内存缓存上限(MB)
+    "max_memory_mb": 64,
+    # 磁盘缓存(sqlite)，重启后仍可命中，设为None则只使用内存缓存
+    "disk_path": os.path.join(CACHE_PATH, "response_cache.db"),
+    # 磁盘缓存上限(MB)，超过后删除最早写入的回答
+    "disk_max_mb": 512,
+    # 磁盘缓存清理过期回答的间隔(秒)
+    "purge_interval": 600,
+    # 流式输出命中缓存时，每帧回放的字符数
+    "replay_chunk_size": 8,
+}
+
+# 语义缓存：用 EMBEDDING_MODEL 对问题向量化，与缓存中的问题相似度超过阈值时直接返回缓存的回答。
+# 与回答缓存一样只对 use_cache=True 且 temperature=0、不带历史消息的请求生效
+SEMANTIC_CACHE = {
+    "enabled": False,
+    # 余弦相似度阈值
+    "threshold": 0.92,
+    # 每个(模型, prompt模板)命名空间最多缓存的问题数，超出时淘汰最久未命中的
+    "capacity": 10000,
+    # 缓存有效期(秒)
+    "ttl": 3600,
+}
+
+# 流式输出合并：把相邻token合并为一帧SSE输出，减少每个token的序列化和写socket开销。
+# 距本帧第一个token超过interval_ms毫秒或累计超过max_chars个字符时输出一帧；请求中传入coalesce=False可逐token输出
+STREAM_COALESCE = {
+    "enabled": True,
+    "interval_ms": 30,
+    "max_chars": 64,
+}
+
+# /chat/chat 的执行引擎：
+# "langchain": 经 LLMChain + ChatOpenAI 调用模型
+# "direct": 自行渲染prompt，通过共享的httpx连接池直接流式请求 OpenAI 兼容接口，减少每个token的Python开销
+CHAT_ENGINE = "langchain"
+
+# 合并相同的并发请求：temperature=0 时，模型、渲染后的prompt及采样参数都相同的进行中请求共用一次模型生成，
+# 各请求仍分别保存自己的消息记录
+SINGLE_FLIGHT = {
+    "enabled": True,
+}
+
+# 准入控制：每个模型在API服务中的并发数取该模型worker的 limit_worker_concurrency(可在concurrency中按模型覆盖)，
+# 超出并发的请求排队，队列长度为 并发数 * queue_factor；队列已满或排队超过max_queue_time秒时返回429及Retry-After。
+# 每个API服务进程独立计数
+ADMISSION_CONTROL = {
+    "enabled": True,
+    "queue_factor": 4,
+    "max_queue_time": 30,
+    # {模型名称: 并发数}，在线API等不受worker并发限制的模型可在此设置更大的值
+    "concurrency": {},
+}
+
+# 公平调度：模型名额不足时，排队的请求按优先级类别严格先后出队，同一类别内按租户(API Key，其次对话ID，
+# 最后客户端IP)分别排队，按加权赤字轮转(DRR)出队，避免单个租户的大量请求饿死其它租户
+FAIR_SCHEDULING = {
+    "enabled": True,
+    # 识别租户的请求头，未携带时依次使用 Authorization: Bearer、对话ID、客户端IP
+    "tenant_header": "X-API-Key",
+    # 客户端自选优先级类别的请求头，只接受 header_priorities 中的类别
+    "priority_header": "X-Request-Priority",
+    # 优先级类别，靠前的先出队
+    "priorities": ["interactive", "default", "batch"],
+    "default_priority": "default",
+    # 可由请求头自行指定的类别，客户端只能借此降低自己的优先级
+    "header_priorities": ["default", "batch"],
+    # {API Key: 优先级类别}，请求头中的API Key在此配置时使用对应的类别(如 {"<WebUI的API Key>": "interactive"})
+    "tenant_priorities": {},
+    # WebUI请求携带的API Key(tenant_header)，配置在 tenant_priorities 中才能以interactive排队；
+    # 应为不公开的随机字符串，为空时WebUI按对话ID区分租户、以default排队
+    "webui_api_key": "",
+    # {租户(API Key或对话ID): 权重}，未配置的租户权重为1，权重为2的租户每轮可出队2个请求
+    "weights": {},
+    # 单个租户最多占用的排队位置比例，超出时只拒绝该租户的请求
+    "max_tenant_queue_share": 0.5,
+}
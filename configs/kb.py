@@ -0,0 +1,139 @@
+# 知识库配置
+import os
+
+from configs.basic import PROJECT_ROOT
+
+# 知识库存储路径，每个知识库一个目录：content/ 存放原始文件，vector_store/ 存放向量索引
+KB_ROOT_PATH = os.path.join(PROJECT_ROOT, "data", "knowledge_base")
+
+# 默认向量库类型
+DEFAULT_VS_TYPE = "flat"
+
+# 知识库匹配的文档数量
+VECTOR_SEARCH_TOP_K = 3
+
+# 知识库匹配相关度阈值(余弦相似度，取值范围0-1)，相似度低于该值的文档不返回
+SCORE_THRESHOLD = 0.5
+
+# 暴力检索时每次矩阵乘法处理的向量行数，控制检索时的临时内存占用
+VECTOR_SEARCH_BLOCK_SIZE = 262144
+
+# bge模型检索时需在问题前加的指令
+EMBEDDING_QUERY_INSTRUCTION = "为这个句子生成表示以用于检索相关文章："
+
+# 知识库中单段文本长度(不适用MarkdownHeaderTextSplitter)
+CHUNK_SIZE = 250
+
+# 知识库中相邻文本重合长度(不适用MarkdownHeaderTextSplitter)
+OVERLAP_SIZE = 50
+
+# 入库时并行加载、切分文件的进程数，<=1时在线程中串行处理；每次入库新建进程池，
+# 进程数过多时启动开销及内存占用超过并行收益，默认不超过4个
+KB_INGEST_WORKERS = min(4, os.cpu_count() or 1)
+
+# 已切分但尚未向量化的文件数上限，加上正在处理的文件数即为同时驻留内存的文件上限
+KB_INGEST_QUEUE_SIZE = 8
+
+# 入库进程池的启动方式，spawn避免在已有线程的服务进程中fork
+KB_INGEST_MP_CONTEXT = "spawn"
+
+# 混合检索：同时使用向量检索和BM25关键词检索，按倒数排名融合(RRF)结果，适合型号、名称等关键词较多的问题
+KB_HYBRID_SEARCH = True
+# 混合检索时每路检索取 top_k * 该倍数 个候选参与融合
+HYBRID_CANDIDATE_FACTOR = 2
+# RRF 平滑常数
+RRF_K = 60
+# BM25 参数
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+# IVF-PQ 压缩索引(vs_type="ivfpq")参数
+IVFPQ = {
+    # 倒排列表(粗聚类中心)数量上限，实际取 min(nlist, 训练样本数 // 39)
+    "nlist": 1024,
+    # 子量化器数量，每个向量压缩为 m 个uint8编码；需整除向量维度，否则取不超过该值的最大约数
+    "m": 64,
+    # 检索时探查的倒排列表数，越大召回越高、越慢
+    "nprobe": 16,
+    # 向量数达到该值时开始训练，之前以原始向量暴力检索
+    "min_train_size": 10000,
+    # 行数(含已删除)增长到上次训练时的该倍数时重新训练，倒排列表数随数据量增加
+    "retrain_factor": 4,
+    # PQ打分的前 top_k * rerank_factor 个候选用原始向量重排，0 表示不重排(召回受量化误差限制)
+    "rerank_factor": 10,
+    # 训练采样数量
+    "train_size": 100000,
+    # k-means迭代次数
+    "kmeans_iters": 20,
+}
+
+# 暴力检索索引(vs_type="flat")参数
+FLAT = {
+    # 已删除向量占比超过该值时去掉已删除的行
+    "compact_ratio": 0.2,
+}
+
+# HNSW 图索引(vs_type="hnsw")参数
+HNSW = {
+    # 每个节点在上层的邻居数，第0层为 2 * M
+    "M": 16,
+    # 建图时的候选集大小
+    "ef_construction": 100,
+    # 检索时的候选集大小，不小于 top_k
+    "ef_search": 64,
+    # 已删除节点占比超过该值时，保存前重建图
+    "compact_ratio": 0.2,
+}
+
+# 分段内存映射向量库(vs_type="segment")参数
+SEGMENT_STORE = {
+    # 段数超过该值时后台合并最小的若干段
+    "max_segments": 8,
+    # 每次合并的段数
+    "merge_factor": 4,
+    # 段内已删除向量占比超过该值时后台重写该段
+    "max_deleted_ratio": 0.3,
+}
+
+# 分层检索：入库时把每个文件中相邻的若干段文本归为一组，生成摘要(存入summary_chunk表)及摘要向量(组内向量的归一化均值)；
+# 检索时先在摘要索引中找最相关的若干组，只对这些组内的文本计算相似度
+HIERARCHICAL_SEARCH = {
+    # 入库时是否构建摘要索引
+    "build": True,
+    # 检索时是否使用分层检索
+    "enabled": False,
+    # 每组文本段数
+    "group_size": 16,
+    # 检索的摘要组数
+    "top_summaries": 16,
+}
+
+# 入库去重：切分后、向量化前用MinHash + LSH查找近似重复的文本段，重复段不再向量化，
+# 在 file_doc.meta_data["duplicate_of"] 中记录其对应的原始doc_id
+KB_DEDUP = {
+    "enabled": True,
+    # MinHash签名长度
+    "num_perm": 128,
+    # LSH分段数，每段 num_perm // bands 行；候选阈值约为 (1 / bands) ** (bands / num_perm)
+    "bands": 16,
+    # 签名估计的Jaccard相似度不低于该值才视为重复
+    "threshold": 0.9,
+    # 字符shingle长度(去除空白和标点后)
+    "shingle_size": 5,
+}
+
+# 文件对话：上传的文件在内存中建立临时索引，以file_chat_id区分会话
+FILE_CHAT = {
+    # 会话闲置超过该时间(秒)后删除
+    "ttl": 3600,
+    # 所有临时索引(向量及文本)的内存上限(MB)，超出时按最近最少使用淘汰
+    "max_memory_mb": 1024,
+    # 会话数上限
+    "max_sessions": 500,
+    # 单次上传的文件总大小上限(MB)
+    "max_upload_mb": 20,
+    # 同时进行切分、向量化的会话数
+    "max_concurrent_builds": 2,
+    # 提问时等待索引建立完成的最长时间(秒)
+    "wait_timeout": 120,
+}
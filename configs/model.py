@@ -1,6 +1,6 @@
 import os.path
 
-from configs.basic import PROJECT_ROOT
+from configs.basic import PROJECT_ROOT, CACHE_PATH
 
 MODEL_ROOT_PATH = ""
 
@@ -10,11 +10,38 @@ EMBEDDING_MODEL = "bge-large-zh-v1.5"
 # Embedding 模型运行设备。设为 "auto" 会自动检测(会有警告)，也可手动设定为 "cuda","mps","cpu","xpu" 其中之一。
 EMBEDDING_DEVICE = "auto"
 
+# Embedding 单次前向计算的最大文本数及最大长度
+EMBEDDING_BATCH_SIZE = 32
+EMBEDDING_MAX_LENGTH = 512
+
+# Embedding 服务：把并发的向量化请求合并成批，每批一次前向计算；按文本内容哈希缓存向量，相同文本不重复计算
+EMBEDDING_SERVICE = {
+    "enabled": True,
+    # 单批最大文本数
+    "max_batch_size": EMBEDDING_BATCH_SIZE,
+    # 收到第一条文本后最多等待多久凑批(毫秒)
+    "max_wait_ms": 5,
+    # 内存向量缓存上限(MB)
+    "cache_max_memory_mb": 256,
+    # 磁盘向量缓存(sqlite)，设为None则只使用内存缓存
+    "cache_disk_path": os.path.join(CACHE_PATH, "embedding_cache.db"),
+    # 磁盘向量缓存上限(MB)，超过后按写入顺序删除最早的向量
+    "cache_disk_max_mb": 2048,
+}
+
 # 选用的reranker模型
 RERANKER_MODEL = "bge-reranker-large"
 # 是否启用reranker模型
 USE_RERANKER = False
 RERANKER_MAX_LENGTH = 1024
+# reranker 单次前向计算的(问题, 文档)对数量，按长度排序后分批，减少padding
+RERANKER_BATCH_SIZE = 16
+# 启用reranker时先检索 top_k * 该倍数 个候选文档，再重排取前 top_k 个
+RERANKER_CANDIDATE_FACTOR = 4
+# 重排耗时预算(毫秒)，预计超出时只重排向量相似度最高的部分候选
+RERANKER_LATENCY_BUDGET_MS = 300
+# (问题, 文档)对得分的LRU缓存条数
+RERANKER_CACHE_SIZE = 20000
 
 # 如果需要在 EMBEDDING_MODEL 中增加自定义的关键字时配置
 EMBEDDING_KEYWORD_FILE = "keywords.txt"
@@ -33,6 +60,9 @@ HISTORY_LEN = 3
 
 MAX_TOKENS = 2048
 
+# 模型上下文长度(token)。历史消息按 上下文长度 - 生成长度(max_tokens，未指定时为MAX_TOKENS) - 当前prompt长度 的预算截取
+MAX_CONTEXT_LENGTH = 4096
+
 TEMPERATURE = 0.7
 
 ONLINE_LLM_MODEL = {
@@ -45,7 +75,12 @@ ONLINE_LLM_MODEL = {
 }
 
 MODEL_PATH = {
-    "embed_model": {},
+    "embed_model": {
+        "bge-large-zh-v1.5": os.path.join(PROJECT_ROOT, "models/bge-large-zh-v1.5"),
+    },
+    "reranker": {
+        "bge-reranker-large": os.path.join(PROJECT_ROOT, "models/bge-reranker-large"),
+    },
     "llm_model": {
         "DeepSeek-R1-Distill-Qwen-1.5B": os.path.join(PROJECT_ROOT, "models/DeepSeek-R1-Distill-Qwen-1.5B"),
         "bge-large-zh-v1.5": os.path.join(PROJECT_ROOT, "models/bge-large-zh-v1.5"),
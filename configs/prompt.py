@@ -18,4 +18,16 @@ PROMPT_TEMPLATES = {
             '你是一个聪明的代码助手，请你给我写出简单的py代码。 \n'
             '{{ input }}',
     },
+
+    "knowledge_base_chat": {
+        "default":
+            '<指令>根据已知信息，简洁和专业的来回答问题。如果无法从中得到答案，请说 “根据已知信息无法回答该问题”，'
+            '不允许在答案中添加编造成分，答案请使用中文。 </指令>\n'
+            '<已知信息>{context}</已知信息>\n'
+            '<问题>{input}</问题>\n',
+
+        "empty":  # 搜不到知识库的时候使用
+            '请你回答我的问题:\n'
+            '{input}\n\n',
+    },
 }
\ No newline at end of file
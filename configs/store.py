@@ -15,4 +15,26 @@ default_database = {
 
 def get_database_url(database_type:str="mysql"):
     database = default_database.get(database_type)
-    return f"{database_type}+{database['driver']}://{database['user']}:{database['password']}@{database['host']}:{database['port']}/{database['database']}?charset={database['charset']}"
\ No newline at end of file
+    return f"{database_type}+{database['driver']}://{database['user']}:{database['password']}@{database['host']}:{database['port']}/{database['database']}?charset={database['charset']}"
+
+# 消息写回队列：聊天消息先写入进程内队列，再按批量大小或时间间隔合并写入数据库，
+# 避免首个token返回前等待数据库写入。服务退出时会将队列中的消息全部写入。
+MESSAGE_WRITE_BEHIND = {
+    "enabled": True,
+    # 队列中的消息数达到该值时立即写入
+    "max_batch_size": 200,
+    # 最长写入间隔(秒)
+    "flush_interval": 0.5,
+    # 批量写入失败后逐条重试，单条消息写入失败达到该次数后丢弃并记录日志，避免一条坏数据阻塞整个队列
+    "max_attempts": 3,
+}
+
+# 会话历史缓存：按会话缓存最近几轮对话，活跃会话构建prompt时无需查询数据库
+HISTORY_CACHE = {
+    # 最多缓存的会话数
+    "max_conversations": 10000,
+    # 每个会话缓存的最大轮数，请求的历史轮数超过该值时直接查询数据库
+    "max_turns": 20,
+    # 缓存占用内存上限(MB)
+    "max_memory_mb": 64,
+}
@@ -1,16 +1,41 @@
 import multiprocessing as mp
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from loguru import logger
 
+from api.kb_api import list_kbs, create_kb, update_kb_docs
 from api.llm_api import list_running_models
+from api.server_api import server_stats
 from chat.chat import chat
+from chat.file_chat import upload_temp_docs, file_chat
+from chat.knowledge_base_chat import knowledge_base_chat
 from configs.basic import VERSION
 
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    from db.base import create_missing_indexes
+    try:
+        created = await create_missing_indexes()
+        if created:
+            logger.info(f"created indexes: {created}")
+    except Exception as e:
+        logger.error(f"create missing indexes failed: {e}")
+    yield
+    # 服务退出时写入队列中剩余的消息并释放共享资源
+    from db.repository.message_repository import message_write_queue
+    from utils.http import close_shared_httpx_async_clients
+    await message_write_queue.close()
+    await close_shared_httpx_async_clients()
+
+
 def create_app(run_mode: str = None):
     app = FastAPI(
         title="ChatBot API Server",
-        version=VERSION
+        version=VERSION,
+        lifespan=lifespan,
     )
     # Add CORS middleware to allow all origins
     app.add_middleware(
@@ -38,12 +63,49 @@ def mount_app_routes(app: FastAPI, run_mode: str = None):
              summary="与llm模型对话(通过LLMChain)",
              )(chat)
 
+    app.post("/chat/knowledge_base_chat",
+             tags=["Chat"],
+             summary="与知识库对话",
+             )(knowledge_base_chat)
+
+    app.post("/chat/file_chat",
+             tags=["Chat"],
+             summary="文件对话",
+             )(file_chat)
+
+    # Tag: Knowledge Base Management
+    app.get("/knowledge_base/list_knowledge_bases",
+            tags=["Knowledge Base Management"],
+            summary="获取知识库列表",
+            )(list_kbs)
+
+    app.post("/knowledge_base/create_knowledge_base",
+             tags=["Knowledge Base Management"],
+             summary="创建知识库",
+             )(create_kb)
+
+    app.post("/knowledge_base/update_docs",
+             tags=["Knowledge Base Management"],
+             summary="增量更新知识库文档",
+             )(update_kb_docs)
+
+    app.post("/knowledge_base/upload_temp_docs",
+             tags=["Knowledge Base Management"],
+             summary="上传文件到临时知识库，用于文件对话",
+             )(upload_temp_docs)
+
     # Tag: LLM Model Management
     app.post("/llm_model/list_running_models",
              tags=["LLM Model Management"],
              summary="列出当前已加载的模型",
              )(list_running_models)
 
+    # Tag: Server State
+    app.post("/server/stats",
+             tags=["Server State"],
+             summary="获取服务运行统计(缓存命中率、队列长度等)",
+             )(server_stats)
+
 
 
 def run_app(started_event: mp.Event, run_mode: str = None):
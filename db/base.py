@@ -1,3 +1,4 @@
+from sqlalchemy import inspect
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base, DeclarativeMeta
 from sqlalchemy.orm import sessionmaker
@@ -28,3 +29,30 @@ from db.models import message_model
 from db.models import knowledge_base_model
 from db.models import knowledge_file_model
 from db.models import knowledge_metadata_model
+
+
+def _create_missing_indexes(connection) -> list:
+    '''
+    为已存在的表创建模型中声明、数据库中尚不存在的索引，返回新建的索引名
+    '''
+    inspector = inspect(connection)
+    tables = set(inspector.get_table_names())
+    created = []
+    for table in Base.metadata.sorted_tables:
+        if table.name not in tables:
+            continue
+        existing = {index["name"] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing:
+                index.create(connection)
+                created.append(index.name)
+    return created
+
+
+async def create_missing_indexes() -> list:
+    '''
+    服务启动时补建升级后模型中新增的索引(如 message 表的 conversation_id, create_time 索引)，
+    已通过 alembic 迁移的数据库不会重复创建
+    '''
+    async with engine.begin() as connection:
+        return await connection.run_sync(_create_missing_indexes)
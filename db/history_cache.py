@@ -0,0 +1,167 @@
+import sys
+import threading
+from collections import OrderedDict, deque
+from typing import Dict, Any, List, Optional
+
+from configs.store import HISTORY_CACHE
+from db.utils import merge_json_patch
+
+
+def _turn_size(turn: Dict[str, Any]) -> int:
+    return (sys.getsizeof(turn.get("query") or "")
+            + sys.getsizeof(turn.get("response") or "")
+            + sys.getsizeof(turn))
+
+
+class ConversationHistoryCache:
+    """
+    会话历史LRU缓存
+    按conversation_id缓存最近max_turns轮对话，新增/更新消息时同步写入，活跃会话构建prompt时无需查询数据库。
+    会话数量超过max_conversations或占用内存超过max_memory_bytes时淘汰最久未使用的会话。
+    缓存中已完成的对话不足所需轮数时，只有缓存包含会话全部消息才直接返回，否则回退到数据库。
+    """
+
+    def __init__(self,
+                 max_conversations: int = HISTORY_CACHE["max_conversations"],
+                 max_turns: int = HISTORY_CACHE["max_turns"],
+                 max_memory_bytes: int = HISTORY_CACHE["max_memory_mb"] * 1024 * 1024):
+        self.max_conversations = max_conversations
+        self.max_turns = max_turns
+        self.max_memory_bytes = max_memory_bytes
+        self._lock = threading.Lock()
+        self._conversations: "OrderedDict[str, deque]" = OrderedDict()
+        # message_id -> conversation_id，用于按message_id更新回答
+        self._message_index: Dict[str, str] = {}
+        self._sizes: Dict[str, int] = {}
+        # 缓存了全部消息的会话(从数据库加载时消息数未超过max_turns，且之后没有丢弃过消息)
+        self._complete = set()
+        self.memory_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _new_turns(self) -> deque:
+        # 多留一个位置给正在生成回答的当前轮
+        return deque(maxlen=self.max_turns + 1)
+
+    def _append(self, conversation_id: str, turns: deque, turn: Dict[str, Any]):
+        if turns.maxlen and len(turns) == turns.maxlen:
+            dropped = turns.popleft()
+            self._message_index.pop(dropped["id"], None)
+            self._complete.discard(conversation_id)
+            self._resize(conversation_id, -_turn_size(dropped))
+        turns.append(turn)
+        self._message_index[turn["id"]] = conversation_id
+        self._resize(conversation_id, _turn_size(turn))
+
+    def _resize(self, conversation_id: str, delta: int):
+        self._sizes[conversation_id] = self._sizes.get(conversation_id, 0) + delta
+        self.memory_bytes += delta
+
+    def _drop(self, conversation_id: str):
+        turns = self._conversations.pop(conversation_id, None)
+        if turns is None:
+            return
+        for turn in turns:
+            self._message_index.pop(turn["id"], None)
+        self._complete.discard(conversation_id)
+        self.memory_bytes -= self._sizes.pop(conversation_id, 0)
+
+    def _evict(self):
+        while self._conversations and (len(self._conversations) > self.max_conversations
+                                       or self.memory_bytes > self.max_memory_bytes):
+            conversation_id = next(iter(self._conversations))
+            self._drop(conversation_id)
+            self.evictions += 1
+
+    def get(self, conversation_id: str, limit: int) -> Optional[List[Dict[str, Any]]]:
+        '''
+        获取最近limit轮已完成的对话(按时间正序)。未缓存、limit超出缓存范围，
+        或已完成的对话不足limit轮而更早的消息不在缓存中时返回None
+        '''
+        with self._lock:
+            turns = self._conversations.get(conversation_id)
+            if turns is None or limit > self.max_turns:
+                self.misses += 1
+                return None
+            done = [t for t in turns if t.get("response")]
+            if len(done) < limit and conversation_id not in self._complete:
+                self.misses += 1
+                return None
+            self._conversations.move_to_end(conversation_id)
+            self.hits += 1
+            return [dict(t) for t in done[-limit:]] if limit > 0 else []
+
+    def put(self, conversation_id: str, turns: List[Dict[str, Any]], complete: bool = False):
+        '''
+        写入从数据库加载的会话历史(按时间正序)，complete表示turns为会话的全部消息
+        '''
+        with self._lock:
+            self._drop(conversation_id)
+            cached = self._new_turns()
+            self._conversations[conversation_id] = cached
+            for turn in turns[-self.max_turns:]:
+                self._append(conversation_id, cached, dict(turn))
+            if complete and len(turns) <= self.max_turns:
+                self._complete.add(conversation_id)
+            self._evict()
+
+    def on_message_added(self, conversation_id: str, message_id: str, query: str, response: str = "",
+                         meta_data: Dict = None):
+        '''
+        新增消息时调用，只更新已缓存的会话，未缓存的会话在下次读取时从数据库加载
+        '''
+        if not conversation_id:
+            return
+        with self._lock:
+            turns = self._conversations.get(conversation_id)
+            if turns is None or message_id in self._message_index:
+                return
+            self._append(conversation_id, turns, {"id": message_id, "query": query, "response": response,
+                                                  "meta_data": meta_data or {}})
+            self._evict()
+
+    def on_message_updated(self, message_id: str, response: str = None, meta_data: Dict = None):
+        with self._lock:
+            conversation_id = self._message_index.get(message_id)
+            if conversation_id is None:
+                return
+            for turn in self._conversations[conversation_id]:
+                if turn["id"] == message_id:
+                    old_size = _turn_size(turn)
+                    if response is not None:
+                        turn["response"] = response
+                    if isinstance(meta_data, dict):
+                        turn["meta_data"] = meta_data
+                    self._resize(conversation_id, _turn_size(turn) - old_size)
+                    break
+            self._evict()
+
+    def on_metadata_merged(self, patches: Dict[str, Dict]):
+        '''
+        按message_id把patch合并到已缓存消息的meta_data中
+        '''
+        with self._lock:
+            for message_id, patch in patches.items():
+                conversation_id = self._message_index.get(message_id)
+                if conversation_id is None:
+                    continue
+                for turn in self._conversations[conversation_id]:
+                    if turn["id"] == message_id:
+                        turn["meta_data"] = merge_json_patch(turn.get("meta_data"), patch)
+                        break
+
+    def invalidate(self, conversation_id: str):
+        with self._lock:
+            self._drop(conversation_id)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "conversations": len(self._conversations),
+            "memory_bytes": self.memory_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "evictions": self.evictions,
+        }
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, Float, Boolean, JSON, func
+from sqlalchemy import Column, Integer, String, DateTime, Double, Boolean, JSON, Index, func
 
 from db.base import Base
 
@@ -8,6 +8,9 @@ class KnowledgeFileModel(Base):
     知识文件模型
     """
     __tablename__ = 'knowledge_file'
+    __table_args__ = (
+        Index("ix_knowledge_file_kb_name_file_name", "kb_name", "file_name"),
+    )
     id = Column(Integer, primary_key=True, autoincrement=True, comment='知识文件ID')
     file_name = Column(String(255), comment='文件名')
     file_ext = Column(String(10), comment='文件扩展名')
@@ -15,7 +18,8 @@ class KnowledgeFileModel(Base):
     document_loader_name = Column(String(50), comment='文档加载器名称')
     text_splitter_name = Column(String(50), comment='文本分割器名称')
     file_version = Column(Integer, default=1, comment='文件版本')
-    file_mtime = Column(Float, default=0.0, comment="文件修改时间")
+    # 双精度保存，MySQL FLOAT仅4字节，会丢失秒级以下精度导致文件被误判为已修改
+    file_mtime = Column(Double, default=0.0, comment="文件修改时间")
     file_size = Column(Integer, default=0, comment="文件大小")
     custom_docs = Column(Boolean, default=False, comment="是否自定义docs")
     docs_count = Column(Integer, default=0, comment="切分文档数量")
@@ -30,6 +34,11 @@ class FileDocModel(Base):
     文件-向量库文档模型
     """
     __tablename__ = 'file_doc'
+    __table_args__ = (
+        # 按文件删除/更新文档、按doc_id取检索结果
+        Index("ix_file_doc_kb_name_file_name", "kb_name", "file_name"),
+        Index("ix_file_doc_kb_name_doc_id", "kb_name", "doc_id"),
+    )
     id = Column(Integer, primary_key=True, autoincrement=True, comment='ID')
     kb_name = Column(String(50), comment='知识库名称')
     file_name = Column(String(255), comment='文件名称')
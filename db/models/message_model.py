@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, JSON, func
+from sqlalchemy import Column, Integer, String, DateTime, JSON, Index, func
 
 from db.base import Base
 
@@ -8,8 +8,12 @@ class MessageModel(Base):
     聊天记录模型
     """
     __tablename__ = 'message'
+    __table_args__ = (
+        # 按会话查询历史消息
+        Index("ix_message_conversation_id_create_time", "conversation_id", "create_time"),
+    )
     id = Column(String(32), primary_key=True, comment='聊天记录ID')
-    conversation_id = Column(String(32), default=None, index=True, comment='对话框ID')
+    conversation_id = Column(String(32), default=None, comment='对话框ID')
     # chat/agent_chat等
     chat_type = Column(String(50), comment='聊天类型')
     query = Column(String(4096), comment='用户问题')
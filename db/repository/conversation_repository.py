@@ -1,7 +1,11 @@
 import uuid
+from typing import Dict, Any, List
+
+from sqlalchemy import insert, update, select
+from sqlalchemy.dialects.mysql import insert as mysql_insert
 
 from db.models.conversation_model import ConversationModel
-from db.session import get_db_session
+from db.session import session_scope
 
 
 async def add_conversation_to_db(chat_type, name="", conversation_id=None):
@@ -14,12 +18,79 @@ async def add_conversation_to_db(chat_type, name="", conversation_id=None):
     """
     if not conversation_id:
         conversation_id = uuid.uuid4().hex
-    async with get_db_session() as session:
-        conversation = ConversationModel(
+    async with session_scope() as session:
+        await session.execute(insert(ConversationModel).values(
             id=conversation_id,
             chat_type=chat_type,
             name=name,
+        ))
+    return conversation_id
+
+
+async def get_conversation_by_id(conversation_id):
+    """
+    根据id获取聊天记录
+    """
+    async with session_scope() as session:
+        result = await session.execute(select(ConversationModel).where(ConversationModel.id == conversation_id))
+        return result.scalar_one_or_none()
+
+
+async def update_conversation_to_db(conversation_id, name: str = None, chat_type: str = None):
+    """
+    更新聊天记录，单条 UPDATE ... WHERE id= 语句完成
+    """
+    values = {}
+    if name is not None:
+        values["name"] = name
+    if chat_type is not None:
+        values["chat_type"] = chat_type
+    if not values:
+        return conversation_id
+    async with session_scope() as session:
+        result = await session.execute(
+            update(ConversationModel).where(ConversationModel.id == conversation_id).values(**values)
         )
-        session.add(conversation)
-        await session.commit()
-    return conversation.id
+    return conversation_id if result.rowcount else None
+
+
+async def bulk_add_conversations_to_db(rows: List[Dict[str, Any]]) -> List[str]:
+    """
+    批量新增聊天记录，rows中未给出id的自动生成
+    """
+    if not rows:
+        return []
+    rows = [{"id": uuid.uuid4().hex, **row} if not row.get("id") else row for row in rows]
+    async with session_scope() as session:
+        await session.execute(insert(ConversationModel), rows)
+    return [row["id"] for row in rows]
+
+
+async def bulk_update_conversations_to_db(rows: List[Dict[str, Any]]) -> int:
+    """
+    按主键批量更新聊天记录，每行必须包含id
+    """
+    if not rows:
+        return 0
+    async with session_scope() as session:
+        await session.execute(update(ConversationModel), rows)
+    return len(rows)
+
+
+async def upsert_conversations_to_db(rows: List[Dict[str, Any]]) -> int:
+    """
+    批量写入聊天记录，id已存在时只更新行中给出的字段
+    """
+    if not rows:
+        return 0
+    groups: Dict[tuple, List[Dict[str, Any]]] = {}
+    for row in rows:
+        groups.setdefault(tuple(sorted(row)), []).append(row)
+    async with session_scope() as session:
+        for columns, group in groups.items():
+            stmt = mysql_insert(ConversationModel.__table__)
+            stmt = stmt.on_duplicate_key_update(
+                {c: stmt.inserted[c] for c in columns if c != "id"}
+            )
+            await session.execute(stmt, group)
+    return len(rows)
@@ -0,0 +1,52 @@
+from typing import List, Optional
+
+from sqlalchemy import insert, update, select, delete
+
+from db.models.knowledge_base_model import KnowledgeBaseModel
+from db.session import session_scope
+
+
+async def add_kb_to_db(kb_name: str, kb_info: str, vs_type: str, embed_model: str):
+    """
+    新增知识库，已存在时更新简介、向量库类型及嵌入模型
+    """
+    kb = await get_kb_detail(kb_name)
+    async with session_scope() as session:
+        if kb is None:
+            await session.execute(insert(KnowledgeBaseModel).values(
+                kb_name=kb_name, kb_info=kb_info, vs_type=vs_type, embed_model=embed_model,
+            ))
+        else:
+            await session.execute(update(KnowledgeBaseModel).where(KnowledgeBaseModel.kb_name == kb_name).values(
+                kb_info=kb_info, vs_type=vs_type, embed_model=embed_model,
+            ))
+    return kb_name
+
+
+async def get_kb_detail(kb_name: str) -> Optional[KnowledgeBaseModel]:
+    """
+    获取知识库信息
+    """
+    async with session_scope() as session:
+        result = await session.execute(select(KnowledgeBaseModel).where(KnowledgeBaseModel.kb_name == kb_name))
+        return result.scalars().first()
+
+
+async def list_kbs_from_db() -> List[str]:
+    """
+    获取所有知识库名称
+    """
+    async with session_scope() as session:
+        result = await session.execute(select(KnowledgeBaseModel.kb_name))
+        return [row[0] for row in result]
+
+
+async def update_kb_file_count(kb_name: str, file_count: int):
+    async with session_scope() as session:
+        await session.execute(update(KnowledgeBaseModel).where(KnowledgeBaseModel.kb_name == kb_name)
+                              .values(file_count=file_count))
+
+
+async def delete_kb_from_db(kb_name: str):
+    async with session_scope() as session:
+        await session.execute(delete(KnowledgeBaseModel).where(KnowledgeBaseModel.kb_name == kb_name))
@@ -0,0 +1,144 @@
+from typing import Dict, Any, List, Optional, Tuple
+
+from sqlalchemy import insert, update, select, delete, func
+
+from db.models.knowledge_file_model import KnowledgeFileModel, FileDocModel
+from db.session import session_scope
+
+
+async def get_file_detail(kb_name: str, file_name: str) -> Optional[KnowledgeFileModel]:
+    """
+    获取知识文件信息
+    """
+    async with session_scope() as session:
+        result = await session.execute(
+            select(KnowledgeFileModel)
+            .where(KnowledgeFileModel.kb_name == kb_name, KnowledgeFileModel.file_name == file_name)
+        )
+        return result.scalars().first()
+
+
+async def list_files_from_db(kb_name: str) -> List[KnowledgeFileModel]:
+    """
+    获取知识库中的所有文件
+    """
+    async with session_scope() as session:
+        result = await session.execute(select(KnowledgeFileModel).where(KnowledgeFileModel.kb_name == kb_name))
+        return list(result.scalars())
+
+
+async def add_file_to_db(kb_name: str, file_name: str, file_ext: str, document_loader_name: str,
+                         text_splitter_name: str, file_mtime: float, file_size: int, docs_count: int,
+                         custom_docs: bool = False):
+    """
+    新增知识文件，已存在时更新文件信息并增加版本号
+    """
+    values = dict(
+        file_ext=file_ext,
+        document_loader_name=document_loader_name,
+        text_splitter_name=text_splitter_name,
+        file_mtime=file_mtime,
+        file_size=file_size,
+        docs_count=docs_count,
+        custom_docs=custom_docs,
+    )
+    async with session_scope() as session:
+        result = await session.execute(
+            update(KnowledgeFileModel)
+            .where(KnowledgeFileModel.kb_name == kb_name, KnowledgeFileModel.file_name == file_name)
+            .values(file_version=KnowledgeFileModel.file_version + 1, **values)
+        )
+        if not result.rowcount:
+            await session.execute(insert(KnowledgeFileModel).values(kb_name=kb_name, file_name=file_name, **values))
+    return file_name
+
+
+async def delete_file_from_db(kb_name: str, file_name: str):
+    async with session_scope() as session:
+        await session.execute(
+            delete(KnowledgeFileModel)
+            .where(KnowledgeFileModel.kb_name == kb_name, KnowledgeFileModel.file_name == file_name)
+        )
+
+
+async def count_files_from_db(kb_name: str) -> int:
+    async with session_scope() as session:
+        result = await session.execute(
+            select(func.count(KnowledgeFileModel.id)).where(KnowledgeFileModel.kb_name == kb_name)
+        )
+        return result.scalar_one()
+
+
+async def add_docs_to_db(kb_name: str, file_name: str, doc_infos: List[Dict[str, Any]]):
+    """
+    批量新增文件-向量库文档映射
+    doc_infos: [{"id": doc_id, "metadata": {...}}, ...]
+    """
+    if not doc_infos:
+        return
+    rows = [{"kb_name": kb_name, "file_name": file_name, "doc_id": str(d["id"]), "meta_data": d.get("metadata", {})}
+            for d in doc_infos]
+    async with session_scope() as session:
+        await session.execute(insert(FileDocModel), rows)
+
+
+async def list_docs_from_db(kb_name: str, file_name: str = None, doc_ids: List[str] = None) -> List[Dict[str, Any]]:
+    """
+    按文件或doc_id获取文档映射
+    """
+    stmt = select(FileDocModel.doc_id, FileDocModel.file_name, FileDocModel.meta_data) \
+        .where(FileDocModel.kb_name == kb_name)
+    if file_name is not None:
+        stmt = stmt.where(FileDocModel.file_name == file_name)
+    if doc_ids is not None:
+        if not doc_ids:
+            return []
+        stmt = stmt.where(FileDocModel.doc_id.in_([str(i) for i in doc_ids]))
+    async with session_scope() as session:
+        result = await session.execute(stmt)
+        return [dict(row._mapping) for row in result]
+
+
+async def list_doc_ids_from_db(kb_name: str) -> List[Tuple[str, str]]:
+    """
+    获取知识库全部文档映射的(file_name, doc_id)，不读取meta_data
+    """
+    async with session_scope() as session:
+        result = await session.execute(
+            select(FileDocModel.file_name, FileDocModel.doc_id).where(FileDocModel.kb_name == kb_name))
+        return [(row[0], row[1]) for row in result]
+
+
+async def delete_docs_by_ids_from_db(kb_name: str, doc_ids: List[str]):
+    if not doc_ids:
+        return
+    async with session_scope() as session:
+        await session.execute(delete(FileDocModel).where(FileDocModel.kb_name == kb_name,
+                                                         FileDocModel.doc_id.in_([str(i) for i in doc_ids])))
+
+
+async def delete_docs_from_db(kb_name: str, file_name: str = None) -> List[str]:
+    """
+    删除文件(或整个知识库)的文档映射，返回被删除的doc_id
+    """
+    conditions = [FileDocModel.kb_name == kb_name]
+    if file_name is not None:
+        conditions.append(FileDocModel.file_name == file_name)
+    async with session_scope() as session:
+        result = await session.execute(select(FileDocModel.doc_id).where(*conditions))
+        doc_ids = [row[0] for row in result]
+        await session.execute(delete(FileDocModel).where(*conditions))
+    return doc_ids
+
+
+async def update_docs_meta_in_db(kb_name: str, metas: Dict[str, Dict[str, Any]]):
+    """
+    批量更新文档映射的meta_data，metas: {doc_id: meta_data}
+    """
+    if not metas:
+        return
+    async with session_scope() as session:
+        for doc_id, meta_data in metas.items():
+            await session.execute(update(FileDocModel)
+                                  .where(FileDocModel.kb_name == kb_name, FileDocModel.doc_id == str(doc_id))
+                                  .values(meta_data=meta_data))
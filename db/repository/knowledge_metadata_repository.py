@@ -0,0 +1,51 @@
+from typing import List, Dict, Any
+
+from sqlalchemy import insert, select, delete
+
+from db.models.knowledge_metadata_model import SummaryChunkModel
+from db.session import session_scope
+
+
+async def add_summary_chunks_to_db(kb_name: str, summary_infos: List[Dict[str, Any]]):
+    """
+    批量新增chunk摘要
+    summary_infos: [{"summary_context": str, "summary_id": str, "doc_ids": [str, ...], "metadata": {...}}, ...]
+    """
+    if not summary_infos:
+        return
+    rows = [{"kb_name": kb_name, "summary_context": s["summary_context"][:255], "summary_id": str(s["summary_id"]),
+             "doc_ids": ",".join(str(i) for i in s["doc_ids"]), "meta_data": s.get("metadata", {})}
+            for s in summary_infos]
+    async with session_scope() as session:
+        await session.execute(insert(SummaryChunkModel), rows)
+
+
+async def list_summary_chunks_from_db(kb_name: str) -> List[Dict[str, Any]]:
+    async with session_scope() as session:
+        result = await session.execute(
+            select(SummaryChunkModel.summary_id, SummaryChunkModel.summary_context, SummaryChunkModel.doc_ids,
+                   SummaryChunkModel.meta_data).where(SummaryChunkModel.kb_name == kb_name))
+        return [dict(row._mapping) for row in result]
+
+
+async def delete_summary_chunks_from_db(kb_name: str, file_name: str = None) -> List[str]:
+    """
+    删除文件(或整个知识库)的chunk摘要，返回被删除的summary_id
+    文件名记录在 meta_data["file_name"] 中
+    """
+    async with session_scope() as session:
+        result = await session.execute(
+            select(SummaryChunkModel.id, SummaryChunkModel.summary_id, SummaryChunkModel.meta_data)
+            .where(SummaryChunkModel.kb_name == kb_name))
+        rows = [row for row in result if file_name is None or (row.meta_data or {}).get("file_name") == file_name]
+        if rows:
+            await session.execute(delete(SummaryChunkModel).where(SummaryChunkModel.id.in_([row.id for row in rows])))
+    return [row.summary_id for row in rows]
+
+
+async def delete_summary_chunks_by_ids_from_db(kb_name: str, summary_ids: List[str]):
+    if not summary_ids:
+        return
+    async with session_scope() as session:
+        await session.execute(delete(SummaryChunkModel).where(
+            SummaryChunkModel.kb_name == kb_name, SummaryChunkModel.summary_id.in_([str(i) for i in summary_ids])))
@@ -1,8 +1,25 @@
+import asyncio
+import contextvars
 import uuid
-from typing import Dict
+from typing import Dict, Any, List, Optional
 
+from loguru import logger
+from sqlalchemy import insert, update, select, func, bindparam, JSON
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.exc import OperationalError, InterfaceError
+
+from configs.store import MESSAGE_WRITE_BEHIND
+from db.history_cache import ConversationHistoryCache
 from db.models.message_model import MessageModel
-from db.session import get_db_session
+from db.session import session_scope
+from db.utils import merge_json_patch
+from utils.stats import register_stats_provider
+
+history_cache = ConversationHistoryCache()
+register_stats_provider("history_cache", history_cache.stats)
+
+# 数据库不可用(连接断开、超时等)时的异常，此时消息原样放回队列，不计入单条消息的失败次数
+DB_UNAVAILABLE_ERRORS = (OperationalError, InterfaceError, ConnectionError, asyncio.TimeoutError)
 
 
 async def add_message_to_db(conversation_id: str, chat_type, query, response="", message_id=None,
@@ -12,38 +29,381 @@ async def add_message_to_db(conversation_id: str, chat_type, query, response="",
     """
     if not message_id:
         message_id = uuid.uuid4().hex
-    async with get_db_session() as session:
-        message = MessageModel(
+    async with session_scope() as session:
+        await session.execute(insert(MessageModel).values(
             id=message_id,
             conversation_id=conversation_id,
             chat_type=chat_type,
             query=query,
             response=response,
             meta_data=metadata
-        )
-        session.add(message)
-        await session.commit()
-    return message.id
+        ))
+    history_cache.on_message_added(conversation_id, message_id, query, response, metadata)
+    return message_id
 
 async def get_message_by_id(message_id):
     """
-    根据id获取消息记录
+    根据id获取消息记录，写回队列中尚未落库的修改会合并到结果中
     """
-    async with get_db_session() as session:
+    pending = message_write_queue.get_pending(message_id)
+    if pending is not None and "conversation_id" in pending:
+        return MessageModel(**pending)
+    async with session_scope() as session:
         message = await session.get(MessageModel, message_id)
+    if message is not None and pending is not None:
+        for k, v in pending.items():
+            setattr(message, k, v)
     return message
 
 async def update_message_to_db(message_id, response: str = None, metadata: Dict = None):
     """
-    更新已有的聊天记录
+    更新已有的聊天记录，单条 UPDATE ... WHERE id= 语句完成，不再先查询
+    """
+    values = {}
+    if response is not None:
+        values["response"] = response
+    if isinstance(metadata, dict):
+        values["meta_data"] = metadata
+    if not values:
+        return message_id
+    async with session_scope() as session:
+        result = await session.execute(
+            update(MessageModel).where(MessageModel.id == message_id).values(**values)
+        )
+    history_cache.on_message_updated(message_id, response, metadata)
+    return message_id if result.rowcount else None
+
+
+async def filter_message(conversation_id: str, limit: int = 10, finished_only: bool = False) -> List[Dict[str, Any]]:
+    """
+    获取会话最近的limit条消息，按时间正序；finished_only为False时包含尚未完成回答的消息
+    """
+    stmt = (select(MessageModel.id, MessageModel.query, MessageModel.response, MessageModel.meta_data)
+            .where(MessageModel.conversation_id == conversation_id))
+    if finished_only:
+        stmt = stmt.where(MessageModel.response != "")
+    async with session_scope() as session:
+        result = await session.execute(stmt.order_by(MessageModel.create_time.desc()).limit(limit))
+        messages = [dict(row._mapping) for row in result]
+    messages.reverse()
+    return messages
+
+
+async def get_history_messages(conversation_id: str, limit: int) -> List[Dict[str, Any]]:
+    """
+    获取会话最近limit轮已完成的对话，按时间正序。优先读取会话历史缓存，未命中时查询数据库并写入缓存
+    """
+    if not conversation_id or limit <= 0:
+        return []
+    turns = history_cache.get(conversation_id, limit)
+    if turns is not None:
+        return turns
+    cacheable = limit <= history_cache.max_turns
+    # 多取一条，当前正在生成回答的消息不计入历史
+    fetch = (history_cache.max_turns if cacheable else limit) + 1
+    turns = await filter_message(conversation_id, fetch)
+    complete = len(turns) < fetch
+    turns = message_write_queue.merge_pending(conversation_id, turns)
+    if cacheable:
+        history_cache.put(conversation_id, turns, complete)
+    done = [t for t in turns if t.get("response")]
+    if len(done) < limit and not complete:
+        # 最近的消息中有未完成的回答，更早的已完成对话需单独查询
+        turns = await filter_message(conversation_id, limit, finished_only=True)
+        done = [t for t in message_write_queue.merge_pending(conversation_id, turns) if t.get("response")]
+    return done[-limit:]
+
+
+async def bulk_add_messages_to_db(rows: List[Dict[str, Any]]) -> List[str]:
+    """
+    批量新增消息，rows中未给出id的自动生成
+    """
+    if not rows:
+        return []
+    rows = [{"id": uuid.uuid4().hex, **row} if not row.get("id") else row for row in rows]
+    async with session_scope() as session:
+        await session.execute(insert(MessageModel), rows)
+    return [row["id"] for row in rows]
+
+
+async def bulk_update_messages_to_db(rows: List[Dict[str, Any]]) -> int:
+    """
+    按主键批量更新消息，每行必须包含id，只更新行中给出的字段
+    """
+    if not rows:
+        return 0
+    async with session_scope() as session:
+        await session.execute(update(MessageModel), rows)
+    return len(rows)
+
+
+async def upsert_messages_to_db(rows: List[Dict[str, Any]]) -> int:
+    """
+    批量写入消息，id已存在时只更新行中给出的字段(INSERT ... ON DUPLICATE KEY UPDATE)
+    """
+    if not rows:
+        return 0
+    # executemany要求每行字段相同，按字段集合分组
+    groups: Dict[tuple, List[Dict[str, Any]]] = {}
+    for row in rows:
+        groups.setdefault(tuple(sorted(row)), []).append(row)
+    async with session_scope() as session:
+        for columns, group in groups.items():
+            stmt = mysql_insert(MessageModel.__table__)
+            stmt = stmt.on_duplicate_key_update(
+                {c: stmt.inserted[c] for c in columns if c != "id"}
+            )
+            await session.execute(stmt, group)
+    return len(rows)
+
+
+class MessageWriteBehindQueue:
+    """
+    消息写回队列
+    新增/更新先合并到内存中(同一message_id的多次修改合并为一行)，由后台任务按批量大小或时间间隔
+    批量写入数据库。数据库不可用时整批放回队列；批量写入因数据错误失败时逐条重试，单条消息失败
+    max_attempts 次后丢弃并记录日志。服务退出时调用 close() 写入剩余消息。
     """
-    m = await get_message_by_id(message_id)
-    if m is not None:
+
+    def __init__(self,
+                 max_batch_size: int = MESSAGE_WRITE_BEHIND["max_batch_size"],
+                 flush_interval: float = MESSAGE_WRITE_BEHIND["flush_interval"],
+                 max_attempts: int = MESSAGE_WRITE_BEHIND["max_attempts"]):
+        self.max_batch_size = max_batch_size
+        self.flush_interval = flush_interval
+        self.max_attempts = max_attempts
+        self._pending: Dict[str, Dict[str, Any]] = {}
+        # 逐条写入失败的消息及其失败次数
+        self._attempts: Dict[str, int] = {}
+        self._wakeup: Optional[asyncio.Event] = None
+        self._flush_task: Optional[asyncio.Task] = None
+        self._flush_lock: Optional[asyncio.Lock] = None
+        self._closed = False
+        self.enqueued = 0
+        self.flushed = 0
+        self.batches = 0
+        self.errors = 0
+        self.dropped = 0
+
+    def _ensure_started(self):
+        if self._flush_task is None or self._flush_task.done():
+            self._wakeup = asyncio.Event()
+            self._flush_lock = asyncio.Lock()
+            # 使用空的上下文，后台写入不能复用触发它的请求的会话
+            self._flush_task = asyncio.get_running_loop().create_task(self._run(), context=contextvars.Context())
+
+    def _put(self, message_id: str, values: Dict[str, Any]):
+        self._ensure_started()
+        row = self._pending.setdefault(message_id, {"id": message_id})
+        row.update(values)
+        self.enqueued += 1
+        if len(self._pending) >= self.max_batch_size:
+            self._wakeup.set()
+
+    def add(self, conversation_id: str, chat_type, query, response="", message_id=None,
+            metadata: Dict = None) -> str:
+        """
+        新增消息，立即返回message_id
+        """
+        if not message_id:
+            message_id = uuid.uuid4().hex
+        self._put(message_id, {
+            "conversation_id": conversation_id,
+            "chat_type": chat_type,
+            "query": query,
+            "response": response,
+            "meta_data": metadata or {},
+        })
+        history_cache.on_message_added(conversation_id, message_id, query, response, metadata)
+        return message_id
+
+    def update(self, message_id: str, response: str = None, metadata: Dict = None) -> str:
+        values = {}
         if response is not None:
-            m.response = response
+            values["response"] = response
         if isinstance(metadata, dict):
-            m.meta_data = metadata
-    async with get_db_session() as session:
-            session.add(m)
-            await session.commit()
-            return m.id
\ No newline at end of file
+            values["meta_data"] = metadata
+        if values:
+            self._put(message_id, values)
+            history_cache.on_message_updated(message_id, response, metadata)
+        return message_id
+
+    def merge_metadata(self, message_id: str, patch: Dict[str, Any]) -> bool:
+        '''
+        消息的meta_data尚未落库时在队列中合并并返回True，否则返回False
+        '''
+        row = self._pending.get(message_id)
+        if row is None or "meta_data" not in row:
+            return False
+        row["meta_data"] = merge_json_patch(row["meta_data"], patch)
+        self.enqueued += 1
+        return True
+
+    def get_pending(self, message_id: str) -> Optional[Dict[str, Any]]:
+        row = self._pending.get(message_id)
+        return dict(row) if row is not None else None
+
+    def merge_pending(self, conversation_id: str, messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        '''
+        将尚未落库的新增/修改合并到从数据库读取的会话消息中
+        '''
+        by_id = {m["id"]: m for m in messages}
+        for message_id, row in list(self._pending.items()):
+            if message_id in by_id:
+                by_id[message_id].update({k: v for k, v in row.items() if k in ("response", "meta_data")})
+            elif row.get("conversation_id") == conversation_id:
+                message = {k: row.get(k) for k in ("id", "query", "response", "meta_data")}
+                messages.append(message)
+                by_id[message_id] = message
+        return messages
+
+    def _requeue(self, rows: List[tuple]):
+        '''
+        将写入失败的消息放回队列，期间产生的新修改优先
+        '''
+        for message_id, row in rows:
+            newer = self._pending.get(message_id)
+            if newer is not None:
+                row.update(newer)
+            self._pending[message_id] = row
+
+    async def _flush_rows(self, rows: List[tuple]) -> int:
+        '''
+        批量写入失败后逐条写入，隔离无法写入的消息。数据库不可用时将剩余消息放回队列并抛出异常
+        '''
+        written = 0
+        for i, (message_id, row) in enumerate(rows):
+            try:
+                await upsert_messages_to_db([row])
+            except DB_UNAVAILABLE_ERRORS:
+                self._requeue(rows[i:])
+                self.flushed += written
+                raise
+            except Exception as e:
+                attempts = self._attempts.pop(message_id, 0) + 1
+                if attempts < self.max_attempts:
+                    self._attempts[message_id] = attempts
+                    self._requeue([(message_id, row)])
+                    continue
+                self.dropped += 1
+                logger.error(f"drop message {message_id} of conversation {row.get('conversation_id')} "
+                             f"after {attempts} failed writes: {e}, fields: {sorted(row)}")
+            else:
+                written += 1
+                self._attempts.pop(message_id, None)
+        return written
+
+    async def flush(self) -> int:
+        if not self._pending:
+            return 0
+        async with self._flush_lock:
+            rows, self._pending = list(self._pending.items()), {}
+            try:
+                await upsert_messages_to_db([row for _, row in rows])
+            except DB_UNAVAILABLE_ERRORS as e:
+                self.errors += 1
+                logger.error(f"flush messages to db failed: {e}")
+                self._requeue(rows)
+                raise
+            except Exception as e:
+                self.errors += 1
+                logger.error(f"flush {len(rows)} messages to db failed, retrying one by one: {e}")
+                written = await self._flush_rows(rows)
+            else:
+                written = len(rows)
+                if self._attempts:
+                    for message_id, _ in rows:
+                        self._attempts.pop(message_id, None)
+            self.flushed += written
+            self.batches += 1
+            return written
+
+    async def _run(self):
+        while not self._closed:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception:
+                # 稍后重试
+                await asyncio.sleep(self.flush_interval)
+
+    async def close(self, retries: int = 3):
+        """
+        停止后台任务并写入队列中剩余的消息
+        """
+        self._closed = True
+        if self._flush_task is not None:
+            self._wakeup.set()
+            try:
+                await self._flush_task
+            except Exception:
+                pass
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+        # 逐条重试的消息需多次写入才会被写入或丢弃
+        for _ in range(max(retries, self.max_attempts)):
+            try:
+                await self.flush()
+            except Exception:
+                await asyncio.sleep(self.flush_interval)
+            if not self._pending:
+                return
+        logger.error(f"{len(self._pending)} messages were not written to db")
+
+    def stats(self) -> dict:
+        return {
+            "pending": len(self._pending),
+            "enqueued": self.enqueued,
+            "flushed": self.flushed,
+            "batches": self.batches,
+            "errors": self.errors,
+            "retrying": len(self._attempts),
+            "dropped": self.dropped,
+        }
+
+
+message_write_queue = MessageWriteBehindQueue()
+register_stats_provider("message_write_queue", message_write_queue.stats)
+
+
+async def add_message(conversation_id: str, chat_type, query, response="", message_id=None,
+                      metadata: Dict = None) -> str:
+    """
+    新增消息记录。开启写回队列时只入队，不等待数据库写入
+    """
+    if MESSAGE_WRITE_BEHIND["enabled"]:
+        return message_write_queue.add(conversation_id, chat_type, query, response, message_id, metadata)
+    return await add_message_to_db(conversation_id, chat_type, query, response, message_id, metadata or {})
+
+
+async def update_message(message_id, response: str = None, metadata: Dict = None) -> str:
+    """
+    更新消息记录。开启写回队列时只入队，不等待数据库写入
+    """
+    if MESSAGE_WRITE_BEHIND["enabled"]:
+        return message_write_queue.update(message_id, response, metadata)
+    return await update_message_to_db(message_id, response, metadata)
+
+
+async def merge_messages_metadata(patches: Dict[str, Dict[str, Any]]) -> int:
+    """
+    把patches中的键合并到各消息的meta_data中(JSON_MERGE_PATCH，嵌套的对象逐层合并)，不覆盖其他键。
+    meta_data尚未落库的消息在写回队列中合并，其余消息用一条批量UPDATE完成
+    """
+    if not patches:
+        return 0
+    rows = [{"message_id": message_id, "patch": patch} for message_id, patch in patches.items()
+            if not message_write_queue.merge_metadata(message_id, patch)]
+    if rows:
+        table = MessageModel.__table__
+        stmt = update(table).where(table.c.id == bindparam("message_id")).values(
+            meta_data=func.json_merge_patch(func.coalesce(table.c.meta_data, func.json_object()),
+                                            bindparam("patch", type_=JSON)))
+        async with session_scope() as session:
+            await session.execute(stmt, rows)
+    history_cache.on_metadata_merged(patches)
+    return len(patches)
@@ -1,13 +1,64 @@
 from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import Optional
 
-from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from db.base import AsyncSessionFactory
 
+# 请求级会话，由 request_session() 设置，同一请求内的仓储函数共享
+_request_session: ContextVar[Optional[AsyncSession]] = ContextVar("request_session", default=None)
+
+
 @asynccontextmanager
 async def get_db_session():
     session = AsyncSessionFactory()
     try:
         yield session
     finally:
-        await session.close()
\ No newline at end of file
+        await session.close()
+
+
+@asynccontextmanager
+async def session_scope():
+    """
+    事务作用域
+    处于 request_session() 中时复用请求级会话，由请求结束时统一提交；否则新建会话，退出时提交
+    """
+    session = _request_session.get()
+    if session is not None:
+        yield session
+        return
+    async with get_db_session() as session:
+        try:
+            yield session
+        except Exception:
+            await session.rollback()
+            raise
+        else:
+            await session.commit()
+
+
+@asynccontextmanager
+async def request_session():
+    """
+    请求级工作单元
+    作用域内的仓储操作共用一个会话和一次连接，退出时统一提交并归还连接。
+    首次访问数据库后即占用连接，作用域内不应包含模型生成等耗时操作
+    """
+    session = _request_session.get()
+    if session is not None:
+        yield session
+        return
+    session = AsyncSessionFactory()
+    token = _request_session.set(session)
+    try:
+        yield session
+    except Exception:
+        await session.rollback()
+        raise
+    else:
+        await session.commit()
+    finally:
+        _request_session.reset(token)
+        await session.close()
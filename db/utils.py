@@ -15,4 +15,18 @@ class SingletonMeta(type):
             with cls._lock:
                 if cls not in cls._instances:
                     cls._instances[cls] = super().__call__(*args, **kwargs)
-        return cls._instances[cls]
\ No newline at end of file
+        return cls._instances[cls]
+
+def merge_json_patch(target: dict, patch: dict) -> dict:
+    '''
+    按 JSON_MERGE_PATCH 的规则把patch合并到target的副本中：嵌套的对象逐层合并，其余值直接覆盖，值为None时删除该键
+    '''
+    merged = dict(target or {})
+    for key, value in patch.items():
+        if value is None:
+            merged.pop(key, None)
+        elif isinstance(value, dict):
+            merged[key] = merge_json_patch(merged.get(key) if isinstance(merged.get(key), dict) else {}, value)
+        else:
+            merged[key] = value
+    return merged
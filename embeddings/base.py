@@ -0,0 +1,77 @@
+from functools import lru_cache
+from typing import List
+
+import numpy as np
+
+from configs.model import EMBEDDING_MODEL, EMBEDDING_DEVICE, EMBEDDING_BATCH_SIZE, EMBEDDING_MAX_LENGTH, MODEL_PATH, \
+    EMBEDDING_SERVICE
+from utils.stats import register_stats_provider
+
+
+class Embedder:
+    """
+    文本向量化接口，返回L2归一化后的float32向量，向量内积即余弦相似度
+    """
+    model_name: str = ""
+    dim: int = 0
+
+    def embed_documents(self, texts: List[str]) -> np.ndarray:
+        raise NotImplementedError
+
+    def embed_query(self, text: str) -> np.ndarray:
+        return self.embed_documents([text])[0]
+
+
+def embedding_device(device: str = None) -> str:
+    device = device or EMBEDDING_DEVICE
+    if device not in ["cuda", "mps", "cpu", "xpu"]:
+        from chat.chat_utils import detect_device
+        device = detect_device()
+    return device
+
+
+class LocalEmbedder(Embedder):
+    """
+    本地transformers嵌入模型(bge系列)，取[CLS]向量并归一化
+    """
+
+    def __init__(self, model_name: str = EMBEDDING_MODEL, device: str = None,
+                 batch_size: int = EMBEDDING_BATCH_SIZE, max_length: int = EMBEDDING_MAX_LENGTH):
+        import torch
+        from transformers import AutoModel, AutoTokenizer
+
+        self.model_name = model_name
+        self.device = embedding_device(device)
+        self.batch_size = batch_size
+        self.max_length = max_length
+        path = MODEL_PATH["embed_model"].get(model_name, model_name)
+        self.tokenizer = AutoTokenizer.from_pretrained(path)
+        self.model = AutoModel.from_pretrained(path).to(self.device).eval()
+        self.dim = self.model.config.hidden_size
+        self._torch = torch
+
+    def embed_documents(self, texts: List[str]) -> np.ndarray:
+        if not texts:
+            return np.zeros((0, self.dim), dtype=np.float32)
+        outputs = []
+        with self._torch.inference_mode():
+            for i in range(0, len(texts), self.batch_size):
+                inputs = self.tokenizer(texts[i:i + self.batch_size], padding=True, truncation=True,
+                                        max_length=self.max_length, return_tensors="pt").to(self.device)
+                vectors = self.model(**inputs).last_hidden_state[:, 0]
+                vectors = self._torch.nn.functional.normalize(vectors, p=2, dim=1)
+                outputs.append(vectors.float().cpu().numpy())
+        return np.concatenate(outputs).astype(np.float32, copy=False)
+
+
+@lru_cache(maxsize=4)
+def get_embedder(model_name: str = EMBEDDING_MODEL) -> Embedder:
+    '''
+    获取嵌入模型，每个进程每个模型只加载一次；启用EMBEDDING_SERVICE时包装为动态批处理并带向量缓存
+    '''
+    embedder = LocalEmbedder(model_name)
+    if EMBEDDING_SERVICE["enabled"]:
+        from embeddings.service import BatchingEmbedder
+        embedder = BatchingEmbedder(embedder)
+        register_stats_provider(f"embedding:{model_name}", embedder.stats)
+    return embedder
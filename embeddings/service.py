@@ -0,0 +1,270 @@
+import hashlib
+import math
+import os
+import queue
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from loguru import logger
+
+from configs.model import EMBEDDING_SERVICE
+from embeddings.base import Embedder
+
+
+def make_embedding_key(model_name: str, text: str) -> str:
+    return hashlib.sha256(f"{model_name}\0{text}".encode("utf-8")).hexdigest()
+
+
+class _VectorDiskTier:
+    """
+    sqlite磁盘向量缓存，重新入库或服务重启后仍可命中
+    向量占用超过max_bytes时按写入顺序(rowid，重复写入的向量排到最后)删除最早的向量，降到上限的90%
+    """
+
+    def __init__(self, path: str, max_bytes: int = 0):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("CREATE TABLE IF NOT EXISTS embedding_cache (key TEXT PRIMARY KEY, vector BLOB NOT NULL)")
+        self._conn.commit()
+        self.bytes = self._total_bytes()
+        self.evictions = 0
+
+    def _total_bytes(self) -> int:
+        return self._conn.execute("SELECT COALESCE(SUM(LENGTH(vector)), 0) FROM embedding_cache").fetchone()[0]
+
+    def _evict(self):
+        count = self._conn.execute("SELECT COUNT(*) FROM embedding_cache").fetchone()[0]
+        self.bytes = self._total_bytes()
+        target = int(0.9 * self.max_bytes)
+        if count and self.bytes > target:
+            n = math.ceil((self.bytes - target) / (self.bytes / count))
+            self._conn.execute("DELETE FROM embedding_cache WHERE rowid IN "
+                               "(SELECT rowid FROM embedding_cache ORDER BY rowid LIMIT ?)", (n,))
+            self.evictions += n
+            self.bytes = self._total_bytes()
+
+    def get_many(self, keys: List[str]) -> Dict[str, np.ndarray]:
+        rows = []
+        with self._lock:
+            # sqlite单条语句的参数个数有限制，分批查询
+            for i in range(0, len(keys), 500):
+                chunk = keys[i:i + 500]
+                rows += self._conn.execute(
+                    f"SELECT key, vector FROM embedding_cache WHERE key IN ({','.join('?' * len(chunk))})",
+                    chunk).fetchall()
+        return {key: np.frombuffer(blob, dtype=np.float32) for key, blob in rows}
+
+    def set_many(self, items: Dict[str, np.ndarray]):
+        rows = [(key, vector.astype(np.float32).tobytes()) for key, vector in items.items()]
+        with self._lock:
+            self._conn.executemany("INSERT OR REPLACE INTO embedding_cache VALUES (?, ?)", rows)
+            # 覆盖写入的向量会重复计入，淘汰时重新统计
+            self.bytes += sum(len(blob) for _, blob in rows)
+            if self.max_bytes and self.bytes > self.max_bytes:
+                self._evict()
+            self._conn.commit()
+
+
+class EmbeddingCache:
+    """
+    按文本内容哈希缓存向量：内存LRU按占用字节数淘汰，可选sqlite磁盘层(按写入顺序淘汰)，
+    内存未命中时查询磁盘并回填内存
+    """
+
+    def __init__(self,
+                 max_memory_bytes: int = EMBEDDING_SERVICE["cache_max_memory_mb"] * 1024 * 1024,
+                 disk_path: Optional[str] = EMBEDDING_SERVICE["cache_disk_path"],
+                 max_disk_bytes: int = EMBEDDING_SERVICE["cache_disk_max_mb"] * 1024 * 1024):
+        self.max_memory_bytes = max_memory_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self._lock = threading.Lock()
+        self._items: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self.memory_bytes = 0
+        self._disk_path = disk_path
+        self._disk: Optional[_VectorDiskTier] = None
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def disk(self) -> Optional[_VectorDiskTier]:
+        if self._disk is None and self._disk_path:
+            self._disk = _VectorDiskTier(self._disk_path, self.max_disk_bytes)
+        return self._disk
+
+    def _put_memory(self, items: Dict[str, np.ndarray]):
+        with self._lock:
+            for key, vector in items.items():
+                old = self._items.pop(key, None)
+                if old is not None:
+                    self.memory_bytes -= old.nbytes
+                self._items[key] = vector
+                self.memory_bytes += vector.nbytes
+            while self.memory_bytes > self.max_memory_bytes and self._items:
+                _, evicted = self._items.popitem(last=False)
+                self.memory_bytes -= evicted.nbytes
+                self.evictions += 1
+
+    def get_many(self, keys: List[str]) -> Dict[str, np.ndarray]:
+        found = {}
+        with self._lock:
+            for key in keys:
+                vector = self._items.get(key)
+                if vector is not None:
+                    self._items.move_to_end(key)
+                    found[key] = vector
+        self.hits += len(found)
+        missing = [key for key in keys if key not in found]
+        if missing and self.disk is not None:
+            from_disk = self.disk.get_many(missing)
+            if from_disk:
+                self._put_memory(from_disk)
+                found.update(from_disk)
+                self.hits += len(from_disk)
+                self.disk_hits += len(from_disk)
+        self.misses += len(keys) - len(found)
+        return found
+
+    def set_many(self, items: Dict[str, np.ndarray]):
+        if not items:
+            return
+        self._put_memory(items)
+        if self.disk is not None:
+            self.disk.set_many(items)
+
+    def stats(self) -> Dict[str, float]:
+        total = self.hits + self.misses
+        stats = {
+            "items": len(self._items),
+            "memory_mb": round(self.memory_bytes / 1024 / 1024, 2),
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            "evictions": self.evictions,
+        }
+        if self._disk is not None:
+            stats["disk_mb"] = round(self._disk.bytes / 1024 / 1024, 2)
+            stats["disk_evictions"] = self._disk.evictions
+        return stats
+
+
+class BatchingEmbedder(Embedder):
+    """
+    动态批处理的向量化服务
+    各线程的embed_documents请求先查缓存，未命中的文本进入队列；后台线程收到第一条文本后最多等待max_wait秒，
+    凑够max_batch_size条或超时即做一次前向计算，先把结果分发回各请求，再写入缓存。
+    正在计算中的相同文本只计算一次，写入缓存完成前仍可从已完成的Future取得结果。
+    """
+
+    def __init__(self, embedder: Embedder,
+                 max_batch_size: int = EMBEDDING_SERVICE["max_batch_size"],
+                 max_wait: float = EMBEDDING_SERVICE["max_wait_ms"] / 1000,
+                 cache: Optional[EmbeddingCache] = None):
+        self.embedder = embedder
+        self.model_name = embedder.model_name
+        self.dim = embedder.dim
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.cache = cache if cache is not None else EmbeddingCache()
+        self._queue: "queue.Queue[Tuple[str, str]]" = queue.Queue()
+        self._lock = threading.Lock()
+        # key -> 正在排队或计算中的Future
+        self._pending: Dict[str, Future] = {}
+        self._worker: Optional[threading.Thread] = None
+        self.requests = 0
+        self.texts = 0
+        self.batches = 0
+        self.batched_texts = 0
+        self.max_batch = 0
+
+    def _ensure_worker(self):
+        if self._worker is None or not self._worker.is_alive():
+            with self._lock:
+                if self._worker is None or not self._worker.is_alive():
+                    self._worker = threading.Thread(target=self._run, name=f"embedding-{self.model_name}",
+                                                    daemon=True)
+                    self._worker.start()
+
+    def _next_batch(self) -> List[Tuple[str, str]]:
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.monotonic()
+            try:
+                batch.append(self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            keys = [key for key, _ in batch]
+            try:
+                vectors = np.asarray(self.embedder.embed_documents([text for _, text in batch]), dtype=np.float32)
+                error = None
+            except Exception as e:
+                vectors, error = None, e
+            self.batches += 1
+            self.batched_texts += len(batch)
+            self.max_batch = max(self.max_batch, len(batch))
+            with self._lock:
+                futures = [self._pending[key] for key in keys]
+            for i, future in enumerate(futures):
+                if error is None:
+                    future.set_result(vectors[i])
+                else:
+                    future.set_exception(error)
+            # 请求不等待缓存写入(磁盘层需提交事务)；写入完成前相同文本的请求取已完成的Future
+            try:
+                if error is None:
+                    self.cache.set_many(dict(zip(keys, vectors)))
+            except Exception as e:
+                logger.error(f"write embedding cache failed: {e}")
+            finally:
+                with self._lock:
+                    for key in keys:
+                        self._pending.pop(key, None)
+
+    def embed_documents(self, texts: List[str]) -> np.ndarray:
+        if not texts:
+            return np.zeros((0, self.dim), dtype=np.float32)
+        self.requests += 1
+        self.texts += len(texts)
+        keys = [make_embedding_key(self.model_name, text) for text in texts]
+        found = self.cache.get_many(list(dict.fromkeys(keys)))
+        futures: Dict[str, Future] = {}
+        with self._lock:
+            for key, text in zip(keys, texts):
+                if key in found or key in futures:
+                    continue
+                future = self._pending.get(key)
+                if future is None:
+                    future = self._pending[key] = Future()
+                    self._queue.put((key, text))
+                futures[key] = future
+        if futures:
+            self._ensure_worker()
+            for key, future in futures.items():
+                found[key] = future.result()
+        return np.stack([found[key] for key in keys])
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "requests": self.requests,
+            "texts": self.texts,
+            "batches": self.batches,
+            "avg_batch_size": round(self.batched_texts / self.batches, 2) if self.batches else 0.0,
+            "max_batch_size": self.max_batch,
+            "queued": self._queue.qsize(),
+            "cache": self.cache.stats(),
+        }
@@ -0,0 +1,202 @@
+import json
+import math
+import os
+import re
+import threading
+from collections import Counter
+from typing import List, Tuple, Dict
+
+import numpy as np
+
+from configs.kb import BM25_K1, BM25_B
+from knowledge_base.vector_store.base import atomic_save_json
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+(?:[-_./][a-z0-9]+)*|[\u3400-\u4dbf\u4e00-\u9fff]+")
+_SPLIT_RE = re.compile(r"[-_./]")
+
+
+def tokenize(text: str) -> List[str]:
+    '''
+    中文按字bigram切分(单字保留)，英文数字按词切分；型号、编号类的词(如 ab-123)同时保留整体和各部分
+    '''
+    tokens = []
+    for match in _TOKEN_RE.findall(text.lower()):
+        if match[0].isascii():
+            tokens.append(match)
+            if _SPLIT_RE.search(match):
+                tokens.extend(_SPLIT_RE.split(match))
+        elif len(match) == 1:
+            tokens.append(match)
+        else:
+            tokens.extend(match[i:i + 2] for i in range(len(match) - 1))
+    return tokens
+
+
+class BM25Index:
+    """
+    BM25 倒排索引
+    倒排表以CSR数组存储：indptr[t]:indptr[t+1] 为词t的posting区间，rows/tfs 为对应的文档行号及词频。
+    新增文档先记入待合并的posting，删除只打标记，检索或保存前统一重建CSR并去掉已删除的文档。
+    """
+
+    def __init__(self, path: str, k1: float = BM25_K1, b: float = BM25_B):
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.RLock()
+        self._reset()
+
+    def _reset(self):
+        self.vocab: Dict[str, int] = {}
+        self.terms: List[str] = []
+        self.doc_ids = np.zeros(0, dtype=np.int64)
+        self.doc_len = np.zeros(0, dtype=np.float32)
+        self.alive = np.zeros(0, dtype=bool)
+        self.indptr = np.zeros(1, dtype=np.int64)
+        self.rows = np.zeros(0, dtype=np.int32)
+        self.tfs = np.zeros(0, dtype=np.float32)
+        # 待合并的 (词id, 行号, 词频)
+        self._pending: List[Tuple[np.ndarray, np.ndarray, np.ndarray]] = []
+        self._dirty = False
+
+    @property
+    def size(self) -> int:
+        return int(self.alive.sum())
+
+    def _term_id(self, term: str) -> int:
+        term_id = self.vocab.get(term)
+        if term_id is None:
+            term_id = self.vocab[term] = len(self.terms)
+            self.terms.append(term)
+        return term_id
+
+    def add(self, ids: np.ndarray, texts: List[str]):
+        with self._lock:
+            start = len(self.doc_ids)
+            term_ids, rows, tfs, lengths = [], [], [], []
+            for i, text in enumerate(texts):
+                counts = Counter(tokenize(text))
+                lengths.append(sum(counts.values()))
+                for term, tf in counts.items():
+                    term_ids.append(self._term_id(term))
+                    rows.append(start + i)
+                    tfs.append(tf)
+            self.doc_ids = np.concatenate([self.doc_ids, np.asarray(ids, dtype=np.int64)])
+            self.doc_len = np.concatenate([self.doc_len, np.asarray(lengths, dtype=np.float32)])
+            self.alive = np.concatenate([self.alive, np.ones(len(texts), dtype=bool)])
+            self._pending.append((np.asarray(term_ids, dtype=np.int64), np.asarray(rows, dtype=np.int32),
+                                  np.asarray(tfs, dtype=np.float32)))
+            self._dirty = True
+
+    def delete(self, ids: np.ndarray) -> int:
+        with self._lock:
+            mask = np.isin(self.doc_ids, np.asarray(ids, dtype=np.int64)) & self.alive
+            deleted = int(mask.sum())
+            if deleted:
+                self.alive[mask] = False
+                self._dirty = True
+            return deleted
+
+    def _build(self):
+        '''
+        合并待合并的posting，去掉已删除的文档并重新编号，重建CSR
+        '''
+        if not self._dirty:
+            return
+        term_ids = [np.repeat(np.arange(len(self.indptr) - 1, dtype=np.int64), np.diff(self.indptr))]
+        rows, tfs = [self.rows], [self.tfs]
+        for t, r, f in self._pending:
+            term_ids.append(t)
+            rows.append(r)
+            tfs.append(f)
+        term_ids, rows, tfs = np.concatenate(term_ids), np.concatenate(rows), np.concatenate(tfs)
+        keep = self.alive[rows]
+        term_ids, rows, tfs = term_ids[keep], rows[keep], tfs[keep]
+        new_rows = np.cumsum(self.alive, dtype=np.int64) - 1
+        rows = new_rows[rows].astype(np.int32)
+        order = np.argsort(term_ids, kind="stable")
+        counts = np.bincount(term_ids, minlength=len(self.terms))
+        self.indptr = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+        self.rows, self.tfs = rows[order], tfs[order]
+        self.doc_ids = self.doc_ids[self.alive]
+        self.doc_len = self.doc_len[self.alive]
+        self.alive = np.ones(len(self.doc_ids), dtype=bool)
+        self._pending = []
+        self._dirty = False
+
+    def search(self, query: str, top_k: int) -> Tuple[np.ndarray, np.ndarray]:
+        '''
+        返回(scores, ids)，按BM25得分从高到低排序，只包含至少命中一个词的文档
+        '''
+        with self._lock:
+            self._build()
+            n = len(self.doc_ids)
+            query_terms = Counter(t for t in tokenize(query) if t in self.vocab)
+            if not n or not query_terms:
+                return np.zeros(0, dtype=np.float32), np.zeros(0, dtype=np.int64)
+            avgdl = max(float(self.doc_len.mean()), 1.0)
+            rows, weights = [], []
+            for term, qtf in query_terms.items():
+                term_id = self.vocab[term]
+                start, end = self.indptr[term_id], self.indptr[term_id + 1]
+                df = end - start
+                if not df:
+                    continue
+                idf = math.log(1 + (n - df + 0.5) / (df + 0.5))
+                term_rows = self.rows[start:end]
+                tf = self.tfs[start:end]
+                norm = self.k1 * (1 - self.b + self.b * self.doc_len[term_rows] / avgdl)
+                rows.append(term_rows)
+                weights.append(qtf * idf * tf * (self.k1 + 1) / (tf + norm))
+            if not rows:
+                return np.zeros(0, dtype=np.float32), np.zeros(0, dtype=np.int64)
+            candidates, inverse = np.unique(np.concatenate(rows), return_inverse=True)
+            scores = np.bincount(inverse, weights=np.concatenate(weights)).astype(np.float32)
+            k = min(top_k, len(scores))
+            top = np.argpartition(-scores, k - 1)[:k] if k < len(scores) else np.arange(len(scores))
+            top = top[np.argsort(-scores[top])]
+            return scores[top], self.doc_ids[candidates[top]]
+
+    def search_batch(self, queries: List[str], top_k: int) -> List[Tuple[np.ndarray, np.ndarray]]:
+        return [self.search(query, top_k) for query in queries]
+
+    def save(self):
+        with self._lock:
+            self._build()
+            os.makedirs(self.path, exist_ok=True)
+            # 词表只增不减，先写词表，索引文件写入中断时旧索引仍可用
+            atomic_save_json(os.path.join(self.path, "vocab.json"), {"terms": self.terms})
+            tmp = os.path.join(self.path, "index.tmp.npz")
+            np.savez(tmp, doc_ids=self.doc_ids, doc_len=self.doc_len, indptr=self.indptr, rows=self.rows,
+                     tfs=self.tfs)
+            os.replace(tmp, os.path.join(self.path, "index.npz"))
+
+    def load(self) -> bool:
+        with self._lock:
+            self._reset()
+            index_path = os.path.join(self.path, "index.npz")
+            if not os.path.exists(index_path):
+                return False
+            with open(os.path.join(self.path, "vocab.json"), encoding="utf-8") as f:
+                self.terms = json.load(f)["terms"]
+            self.vocab = {term: i for i, term in enumerate(self.terms)}
+            with np.load(index_path) as data:
+                self.doc_ids, self.doc_len = data["doc_ids"], data["doc_len"]
+                self.indptr, self.rows, self.tfs = data["indptr"], data["rows"], data["tfs"]
+            self.alive = np.ones(len(self.doc_ids), dtype=bool)
+            # 词表可能比索引新，补齐indptr
+            if len(self.indptr) - 1 < len(self.terms):
+                pad = np.full(len(self.terms) + 1 - len(self.indptr), self.indptr[-1], dtype=np.int64)
+                self.indptr = np.concatenate([self.indptr, pad])
+            return True
+
+
+def reciprocal_rank_fusion(rankings: List[List[str]], k: int) -> List[Tuple[str, float]]:
+    '''
+    倒数排名融合：每个结果的得分为其在各排序列表中 1 / (k + 名次) 之和，返回按得分从高到低排列的(id, 得分)
+    '''
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (k + rank + 1)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
@@ -0,0 +1,156 @@
+import os
+import re
+import threading
+import zlib
+from typing import List, Dict, Optional, Set
+
+import numpy as np
+
+from configs.kb import KB_DEDUP
+from knowledge_base.vector_store.base import save_arrays, load_arrays
+
+_NORMALIZE_RE = re.compile(r"[\s\W_]+", re.UNICODE)
+
+
+class DedupIndex:
+    """
+    近似重复文本段索引(MinHash + LSH)
+    只有原始段(已向量化)进入LSH分桶；重复段记录其原始段id。原始段被删除时，由调用方把它的一个重复段提升为新的原始段。
+    签名、分桶键及重复关系以数组保存在单个文件中，加载时重建分桶。
+    """
+
+    def __init__(self, path: str, num_perm: int = KB_DEDUP["num_perm"], bands: int = KB_DEDUP["bands"],
+                 threshold: float = KB_DEDUP["threshold"], shingle_size: int = KB_DEDUP["shingle_size"]):
+        self.path = path
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.threshold = threshold
+        self.shingle_size = shingle_size
+        rng = np.random.default_rng(20240601)
+        # multiply-shift 哈希：((a * x + b) mod 2^64) >> 32，a为奇数
+        self._a = rng.integers(1, 2 ** 63, num_perm, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+        self._b = rng.integers(0, 2 ** 63, num_perm, dtype=np.uint64)
+        self._band_mult = rng.integers(1, 2 ** 63, self.rows, dtype=np.uint64) | np.uint64(1)
+        self._lock = threading.RLock()
+        self._reset()
+
+    def _reset(self):
+        self.signatures: Dict[int, np.ndarray] = {}
+        self.buckets: Dict[int, List[int]] = {}
+        # 原始段id -> 重复段id集合，重复段id -> 原始段id
+        self.duplicates: Dict[int, Set[int]] = {}
+        self.canonical_of: Dict[int, int] = {}
+        # 已删除但仍有重复段的原始段签名，等待提升新的原始段
+        self._orphaned: Dict[int, np.ndarray] = {}
+
+    @property
+    def file_path(self) -> str:
+        return os.path.join(self.path, "dedup.arr")
+
+    def signature(self, text: str) -> np.ndarray:
+        normalized = _NORMALIZE_RE.sub("", text.lower())
+        k = self.shingle_size
+        shingles = {normalized[i:i + k] for i in range(max(len(normalized) - k + 1, 1))}
+        hashes = np.fromiter((zlib.crc32(s.encode("utf-8")) for s in shingles), dtype=np.uint64, count=len(shingles))
+        with np.errstate(over="ignore"):
+            values = (hashes[:, None] * self._a + self._b) >> np.uint64(32)
+        return values.min(axis=0).astype(np.uint32)
+
+    def _band_keys(self, signature: np.ndarray) -> List[int]:
+        bands = signature.astype(np.uint64).reshape(self.bands, self.rows)
+        with np.errstate(over="ignore"):
+            keys = (bands * self._band_mult).sum(axis=1) + np.arange(self.bands, dtype=np.uint64)
+        return keys.tolist()
+
+    def find(self, signature: np.ndarray) -> Optional[int]:
+        '''
+        查找与签名近似重复的原始段，返回其id，没有时返回None
+        '''
+        with self._lock:
+            candidates = {doc_id for key in self._band_keys(signature) for doc_id in self.buckets.get(key, ())}
+            best, best_score = None, self.threshold
+            for doc_id in candidates:
+                score = float(np.mean(self.signatures[doc_id] == signature))
+                if score >= best_score:
+                    best, best_score = doc_id, score
+            return best
+
+    def add_canonical(self, doc_id: int, signature: np.ndarray):
+        with self._lock:
+            self.signatures[doc_id] = signature
+            for key in self._band_keys(signature):
+                self.buckets.setdefault(key, []).append(doc_id)
+
+    def add_duplicate(self, doc_id: int, canonical_id: int):
+        with self._lock:
+            self.duplicates.setdefault(canonical_id, set()).add(doc_id)
+            self.canonical_of[doc_id] = canonical_id
+
+    def remove(self, doc_ids: List[int]) -> Dict[int, List[int]]:
+        '''
+        删除文本段，返回失去原始段的重复段 {被删除的原始段id: [剩余的重复段id, ...]}
+        '''
+        doc_ids = set(doc_ids)
+        orphans = {}
+        with self._lock:
+            for doc_id in doc_ids:
+                canonical_id = self.canonical_of.pop(doc_id, None)
+                if canonical_id is not None:
+                    self.duplicates.get(canonical_id, set()).discard(doc_id)
+            for doc_id in doc_ids:
+                signature = self.signatures.pop(doc_id, None)
+                if signature is None:
+                    continue
+                for key in self._band_keys(signature):
+                    bucket = self.buckets.get(key)
+                    if bucket is not None:
+                        bucket.remove(doc_id)
+                        if not bucket:
+                            del self.buckets[key]
+                remaining = sorted(self.duplicates.pop(doc_id, set()))
+                if remaining:
+                    orphans[doc_id] = remaining
+                    self._orphaned[doc_id] = signature
+        return orphans
+
+    def promote(self, old_id: int, new_id: int, others: List[int]):
+        '''
+        把重复段new_id提升为原始段，others改为指向它
+        '''
+        with self._lock:
+            signature = self._orphaned.pop(old_id)
+            self.canonical_of.pop(new_id, None)
+            self.add_canonical(new_id, signature)
+            for doc_id in others:
+                self.add_duplicate(doc_id, new_id)
+
+    def stats(self) -> Dict[str, int]:
+        return {"canonical": len(self.signatures), "duplicates": len(self.canonical_of)}
+
+    def save(self):
+        with self._lock:
+            os.makedirs(self.path, exist_ok=True)
+            doc_ids = np.asarray(list(self.signatures), dtype=np.int64)
+            signatures = np.stack([self.signatures[i] for i in doc_ids.tolist()]) if len(doc_ids) \
+                else np.zeros((0, self.num_perm), dtype=np.uint32)
+            save_arrays(self.file_path, {
+                "doc_ids": doc_ids,
+                "signatures": signatures,
+                "duplicate_ids": np.asarray(list(self.canonical_of), dtype=np.int64),
+                "canonical_ids": np.asarray(list(self.canonical_of.values()), dtype=np.int64),
+            }, meta={"num_perm": self.num_perm, "bands": self.bands})
+
+    def load(self) -> bool:
+        with self._lock:
+            self._reset()
+            if not os.path.exists(self.file_path):
+                return False
+            arrays, meta = load_arrays(self.file_path, mmap=False)
+            if meta["num_perm"] != self.num_perm or meta["bands"] != self.bands:
+                raise ValueError("去重索引参数与配置不一致，请重建知识库")
+            for doc_id, signature in zip(arrays["doc_ids"].tolist(), arrays["signatures"]):
+                self.add_canonical(doc_id, signature)
+            for doc_id, canonical_id in zip(arrays["duplicate_ids"].tolist(), arrays["canonical_ids"].tolist()):
+                self.add_duplicate(doc_id, canonical_id)
+            return True
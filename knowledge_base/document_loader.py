@@ -0,0 +1,80 @@
+import os
+from typing import Dict, Any, List
+
+from configs.basic import TEXT_SPLITTER_NAME
+from configs.kb import CHUNK_SIZE, OVERLAP_SIZE
+
+# 文档加载器 -> 支持的文件扩展名
+LOADER_DICT = {
+    "UnstructuredHTMLLoader": [".html", ".htm"],
+    "UnstructuredMarkdownLoader": [".md"],
+    "JSONLoader": [".json"],
+    "JSONLinesLoader": [".jsonl"],
+    "CSVLoader": [".csv"],
+    "PyPDFLoader": [".pdf"],
+    "Docx2txtLoader": [".docx"],
+    "UnstructuredPowerPointLoader": [".ppt", ".pptx"],
+    "UnstructuredExcelLoader": [".xlsx", ".xls"],
+    "TextLoader": [".txt", ".py", ".log", ".xml", ".yaml", ".yml"],
+}
+SUPPORTED_EXTS = [ext for exts in LOADER_DICT.values() for ext in exts]
+
+
+def get_loader_name(file_ext: str) -> str:
+    for loader_name, exts in LOADER_DICT.items():
+        if file_ext.lower() in exts:
+            return loader_name
+    return "UnstructuredFileLoader"
+
+
+def get_loader(loader_name: str, file_path: str):
+    '''
+    根据加载器名称创建langchain文档加载器
+    '''
+    import langchain_community.document_loaders as loaders
+
+    if loader_name in ("JSONLoader", "JSONLinesLoader"):
+        return loaders.JSONLoader(file_path, jq_schema=".", text_content=False,
+                                  json_lines=loader_name == "JSONLinesLoader")
+    if loader_name == "CSVLoader":
+        return loaders.CSVLoader(file_path, encoding="utf-8")
+    if loader_name == "TextLoader":
+        return loaders.TextLoader(file_path, autodetect_encoding=True)
+    return getattr(loaders, loader_name)(file_path)
+
+
+def get_text_splitter(splitter_name: str = TEXT_SPLITTER_NAME, chunk_size: int = CHUNK_SIZE,
+                      chunk_overlap: int = OVERLAP_SIZE):
+    import langchain.text_splitter as splitters
+
+    if splitter_name == "RecursiveCharacterTextSplitter":
+        # 中文按段落、句末标点优先切分
+        return splitters.RecursiveCharacterTextSplitter(
+            separators=["\n\n", "\n", "。|！|？", r"\.\s|\!\s|\?\s", "；|;\s", "，|,\s", ""],
+            is_separator_regex=True,
+            chunk_size=chunk_size,
+            chunk_overlap=chunk_overlap,
+        )
+    return getattr(splitters, splitter_name)(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+
+
+def load_and_split(file_path: str, file_name: str, loader_name: str, splitter_name: str = TEXT_SPLITTER_NAME,
+                   chunk_size: int = CHUNK_SIZE, chunk_overlap: int = OVERLAP_SIZE) -> List[Dict[str, Any]]:
+    '''
+    加载文件并切分，返回 [{"page_content": str, "metadata": dict}, ...]
+    只使用可序列化的参数和返回值，便于在子进程中执行
+    '''
+    docs = get_loader(loader_name, file_path).load()
+    docs = get_text_splitter(splitter_name, chunk_size, chunk_overlap).split_documents(docs)
+    chunks = []
+    for doc in docs:
+        if not doc.page_content.strip():
+            continue
+        metadata = {k: v for k, v in doc.metadata.items() if isinstance(v, (str, int, float, bool))}
+        metadata["source"] = file_name
+        chunks.append({"page_content": doc.page_content, "metadata": metadata})
+    return chunks
+
+
+def file_ext(file_name: str) -> str:
+    return os.path.splitext(file_name)[-1].lower()
@@ -0,0 +1,225 @@
+import asyncio
+import os
+import sys
+import tempfile
+import time
+import uuid
+from collections import OrderedDict
+from typing import List, Dict, Any, Tuple, Optional
+
+import numpy as np
+
+from configs.basic import TEXT_SPLITTER_NAME
+from configs.kb import FILE_CHAT, CHUNK_SIZE, OVERLAP_SIZE, EMBEDDING_QUERY_INSTRUCTION, VECTOR_SEARCH_TOP_K, \
+    SCORE_THRESHOLD
+from configs.model import EMBEDDING_MODEL
+from embeddings.service import BatchingEmbedder
+from knowledge_base.document_loader import get_loader_name, load_and_split, file_ext
+from knowledge_base.vector_store.base import topk_inner_product
+from utils.stats import register_stats_provider
+
+
+class FileChatSession:
+    """
+    一个文件对话会话的临时索引：文本段及其向量都只保存在内存中
+    status: pending(正在切分、向量化) / ready / failed
+    """
+
+    def __init__(self, file_chat_id: str, file_names: List[str]):
+        self.id = file_chat_id
+        self.file_names = file_names
+        self.status = "pending"
+        self.error: Optional[str] = None
+        self.docs: List[Dict[str, Any]] = []
+        self.vectors = np.zeros((0, 0), dtype=np.float32)
+        self.memory = 0
+        self.last_access = time.monotonic()
+        self.ready = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+
+    def set_index(self, docs: List[Dict[str, Any]], vectors: np.ndarray):
+        self.docs = docs
+        self.vectors = np.asarray(vectors, dtype=np.float32)
+        self.memory = self.vectors.nbytes + sum(sys.getsizeof(d["page_content"]) for d in docs)
+        self.status = "ready"
+
+    def search(self, query_vector: np.ndarray, top_k: int = VECTOR_SEARCH_TOP_K,
+               score_threshold: float = SCORE_THRESHOLD) -> List[Dict[str, Any]]:
+        '''
+        返回与 KBService.search 相同格式的文档
+        '''
+        scores, rows = topk_inner_product(query_vector, self.vectors, top_k)
+        results = []
+        for score, row in zip(scores[0].tolist(), rows[0].tolist()):
+            if score < score_threshold:
+                continue
+            doc = self.docs[row]
+            results.append({"doc_id": f"{self.id}-{row}", "file_name": doc["metadata"].get("file_name", ""),
+                            "page_content": doc["page_content"], "metadata": doc["metadata"], "score": score})
+        return results
+
+    def info(self) -> Dict[str, Any]:
+        return {"id": self.id, "status": self.status, "error": self.error, "files": self.file_names,
+                "chunks": len(self.docs)}
+
+
+class FileChatManager:
+    """
+    文件对话临时索引管理：上传的文件在后台任务中切分、向量化，会话闲置超过ttl后删除，
+    全部会话的内存占用超过上限时按最近最少使用(LRU)淘汰。只在API进程内存中保存，服务重启后失效。
+    """
+
+    def __init__(self, ttl: float = FILE_CHAT["ttl"], max_memory_mb: float = FILE_CHAT["max_memory_mb"],
+                 max_sessions: int = FILE_CHAT["max_sessions"],
+                 max_concurrent_builds: int = FILE_CHAT["max_concurrent_builds"],
+                 embed_model: str = EMBEDDING_MODEL, embedder=None):
+        self.ttl = ttl
+        self.max_memory = int(max_memory_mb * 1024 * 1024)
+        self.max_sessions = max_sessions
+        self.max_concurrent_builds = max_concurrent_builds
+        self.embed_model = embed_model
+        self._embedder = embedder
+        self._sessions: "OrderedDict[str, FileChatSession]" = OrderedDict()
+        self._build_semaphore: Optional[asyncio.Semaphore] = None
+        self.memory = 0
+        self.expired = 0
+        self.evicted = 0
+
+    @property
+    def embedder(self) -> BatchingEmbedder:
+        '''
+        与知识库共用动态批处理的向量化服务；重新上传相同文件时文本段向量直接取自缓存
+        '''
+        if self._embedder is None:
+            from embeddings.base import get_embedder
+            self._embedder = get_embedder(self.embed_model)
+        if not isinstance(self._embedder, BatchingEmbedder):
+            self._embedder = BatchingEmbedder(self._embedder)
+        return self._embedder
+
+    def embed_documents(self, texts: List[str]) -> np.ndarray:
+        return self.embedder.embed_documents(texts)
+
+    def embed_queries(self, queries: List[str]) -> np.ndarray:
+        return self.embedder.embed_documents([EMBEDDING_QUERY_INSTRUCTION + q for q in queries])
+
+    def get(self, file_chat_id: str) -> Optional[FileChatSession]:
+        self.expire()
+        session = self._sessions.get(file_chat_id)
+        if session is not None:
+            session.last_access = time.monotonic()
+            self._sessions.move_to_end(file_chat_id)
+        return session
+
+    def create(self, files: List[Tuple[str, bytes]], file_chat_id: str = None) -> FileChatSession:
+        '''
+        新建会话(file_chat_id已存在时替换原会话)，并在后台任务中建立索引
+        files: [(文件名, 文件内容), ...]
+        '''
+        if file_chat_id:
+            self.remove(file_chat_id)
+        session = FileChatSession(file_chat_id or uuid.uuid4().hex, [name for name, _ in files])
+        # 建立索引前按上传文件大小计入内存占用
+        upload_size = sum(len(content) for _, content in files)
+        if upload_size > self.max_memory:
+            # 单个会话即超出上限时直接拒绝，不淘汰其它会话
+            session.status, session.error = "failed", "文件过大，超出文件对话的内存上限"
+            session.ready.set()
+            return session
+        session.memory = upload_size
+        self._sessions[session.id] = session
+        self.memory += session.memory
+        self.expire()
+        self._evict()
+        session.task = asyncio.create_task(self._build(session, files))
+        return session
+
+    def remove(self, file_chat_id: str) -> bool:
+        session = self._sessions.pop(file_chat_id, None)
+        if session is None:
+            return False
+        if session.task is not None and not session.task.done():
+            session.task.cancel()
+            session.status, session.error = "failed", "会话已删除"
+            # 任务可能在开始执行前就被取消，需在此唤醒等待者
+            session.ready.set()
+        self.memory -= session.memory
+        return True
+
+    async def _build(self, session: FileChatSession, files: List[Tuple[str, bytes]]):
+        if self._build_semaphore is None:
+            self._build_semaphore = asyncio.Semaphore(self.max_concurrent_builds)
+        try:
+            async with self._build_semaphore:
+                docs = []
+                with tempfile.TemporaryDirectory() as tmp_dir:
+                    for file_name, content in files:
+                        path = os.path.join(tmp_dir, os.path.basename(file_name))
+                        with open(path, "wb") as f:
+                            f.write(content)
+                        ext = file_ext(file_name)
+                        chunks = await asyncio.to_thread(load_and_split, path, file_name, get_loader_name(ext),
+                                                         TEXT_SPLITTER_NAME, CHUNK_SIZE, OVERLAP_SIZE)
+                        for chunk in chunks:
+                            chunk["metadata"]["file_name"] = file_name
+                        docs.extend(chunks)
+                vectors = await asyncio.to_thread(self.embed_documents, [d["page_content"] for d in docs])
+            self.memory -= session.memory
+            session.set_index(docs, vectors)
+            if session.memory > self.max_memory:
+                # 单个会话即超出上限时直接拒绝，不淘汰其它会话
+                self._sessions.pop(session.id, None)
+                session.status, session.error = "failed", "文件过大，超出文件对话的内存上限"
+                session.memory = 0
+                return
+            self.memory += session.memory
+            self._evict()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            session.status, session.error = "failed", str(e)
+            self.memory -= session.memory
+            session.memory = 0
+        finally:
+            session.ready.set()
+
+    def expire(self):
+        '''
+        删除闲置超过ttl的会话
+        '''
+        deadline = time.monotonic() - self.ttl
+        for file_chat_id in [k for k, s in self._sessions.items() if s.last_access < deadline]:
+            self.remove(file_chat_id)
+            self.expired += 1
+
+    def _evict(self):
+        '''
+        内存或会话数超出上限时，从最近最少使用的会话开始淘汰
+        '''
+        for file_chat_id, session in list(self._sessions.items()):
+            over_memory, over_count = self.memory > self.max_memory, len(self._sessions) > self.max_sessions
+            if not over_memory and not over_count:
+                break
+            self.remove(file_chat_id)
+            self.evicted += 1
+
+    async def search(self, session: FileChatSession, query: str, top_k: int = VECTOR_SEARCH_TOP_K,
+                     score_threshold: float = SCORE_THRESHOLD) -> List[Dict[str, Any]]:
+        if not session.docs:
+            return []
+        query_vector = await asyncio.to_thread(self.embed_queries, [query])
+        return session.search(query_vector, top_k, score_threshold)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "sessions": len(self._sessions),
+            "pending": sum(s.status == "pending" for s in self._sessions.values()),
+            "memory_mb": round(self.memory / 1024 / 1024, 2),
+            "max_memory_mb": round(self.max_memory / 1024 / 1024, 2),
+            "expired": self.expired,
+            "evicted": self.evicted,
+        }
+
+
+file_chat_manager = FileChatManager()
+register_stats_provider("file_chat", file_chat_manager.stats)
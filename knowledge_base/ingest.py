@@ -0,0 +1,214 @@
+import asyncio
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field, asdict
+from typing import Dict, List, Tuple, Optional, AsyncIterator
+
+from configs.basic import TEXT_SPLITTER_NAME
+from configs.kb import KB_INGEST_WORKERS, KB_INGEST_QUEUE_SIZE, KB_INGEST_MP_CONTEXT
+from db.repository.knowledge_base_repository import update_kb_file_count
+from db.repository.knowledge_file_repository import list_files_from_db, add_file_to_db, delete_file_from_db, \
+    count_files_from_db
+from db.session import request_session
+from knowledge_base.document_loader import SUPPORTED_EXTS, get_loader_name, load_and_split, file_ext
+from knowledge_base.kb_service import KBService, get_kb_service, get_content_path
+
+# 文件修改时间比较的容差(秒)
+MTIME_TOLERANCE = 1e-3
+
+
+@dataclass
+class FileInfo:
+    file_name: str
+    path: str
+    mtime: float
+    size: int
+
+
+@dataclass
+class IngestReport:
+    kb_name: str
+    added: List[str] = field(default_factory=list)
+    updated: List[str] = field(default_factory=list)
+    deleted: List[str] = field(default_factory=list)
+    failed: Dict[str, str] = field(default_factory=dict)
+    unchanged: int = 0
+    chunks: int = 0
+    # 近似重复而跳过向量化的文本段数及其占比
+    duplicates: int = 0
+    dedup_ratio: float = 0.0
+    # 向量化耗时，及按平均每段耗时估算的去重节省时间(秒)
+    embedding_time: float = 0.0
+    embedding_time_saved: float = 0.0
+    elapsed: float = 0.0
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+def scan_kb_folder(kb_name: str) -> Dict[str, FileInfo]:
+    '''
+    扫描知识库content目录，返回 {相对路径: FileInfo}；只stat不读取文件内容
+    '''
+    root = get_content_path(kb_name)
+    files = {}
+    stack = [root]
+    while stack:
+        folder = stack.pop()
+        if not os.path.isdir(folder):
+            continue
+        for entry in os.scandir(folder):
+            if entry.name.startswith((".", "~$")):
+                continue
+            if entry.is_dir(follow_symlinks=False):
+                stack.append(entry.path)
+            elif entry.is_file() and file_ext(entry.name) in SUPPORTED_EXTS:
+                st = entry.stat()
+                file_name = os.path.relpath(entry.path, root).replace(os.sep, "/")
+                files[file_name] = FileInfo(file_name, entry.path, st.st_mtime, st.st_size)
+    return files
+
+
+async def plan_ingestion(kb_name: str, force: bool = False) -> Tuple[List[FileInfo], List[FileInfo], List[str], int]:
+    '''
+    对比目录与knowledge_file表中的file_mtime/file_size，返回(新增文件, 修改过的文件, 已删除的文件, 未变化的文件数)
+    '''
+    files = await asyncio.to_thread(scan_kb_folder, kb_name)
+    records = {r.file_name: r for r in await list_files_from_db(kb_name)}
+    added, modified, unchanged = [], [], 0
+    for file_name, info in files.items():
+        record = records.get(file_name)
+        if record is None:
+            added.append(info)
+        elif (force or record.file_size != info.size
+              or abs((record.file_mtime or 0.0) - info.mtime) > MTIME_TOLERANCE):
+            modified.append(info)
+        else:
+            unchanged += 1
+    deleted = [file_name for file_name in records if file_name not in files]
+    return added, modified, deleted, unchanged
+
+
+async def iter_load_and_split(infos: List[FileInfo], max_workers: int = KB_INGEST_WORKERS,
+                              queue_size: int = KB_INGEST_QUEUE_SIZE
+                              ) -> AsyncIterator[Tuple[FileInfo, Optional[List[dict]], Optional[Exception]]]:
+    '''
+    在进程池中并行加载、切分文件，按完成顺序产出 (文件, 切分结果, 异常)。
+    已提交但未被消费的文件数不超过 max_workers + queue_size，向量化较慢时加载阶段会等待，内存占用保持平稳。
+    '''
+    if not infos:
+        return
+    loop = asyncio.get_running_loop()
+    workers = max(1, min(max_workers, len(infos)))
+    executor = None
+    if workers > 1:
+        executor = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context(KB_INGEST_MP_CONTEXT))
+    queue = asyncio.Queue(maxsize=queue_size)
+    slots = asyncio.Semaphore(workers + queue_size)
+
+    async def run(info: FileInfo):
+        try:
+            docs = await loop.run_in_executor(executor, load_and_split, info.path, info.file_name,
+                                              get_loader_name(file_ext(info.file_name)))
+            await queue.put((info, docs, None))
+        except Exception as e:
+            await queue.put((info, None, e))
+
+    async def produce():
+        tasks = []
+        for info in infos:
+            await slots.acquire()
+            tasks.append(asyncio.create_task(run(info)))
+        await asyncio.gather(*tasks)
+        await queue.put(None)
+
+    producer = asyncio.create_task(produce())
+    try:
+        while (item := await queue.get()) is not None:
+            slots.release()
+            yield item
+    finally:
+        producer.cancel()
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+async def ingest_file(kb: KBService, info: FileInfo, docs: List[dict]) -> int:
+    '''
+    替换文件在向量库中的内容：删除旧的向量及file_doc映射，写入新的切分结果
+    '''
+    async with request_session():
+        await kb.delete_file_docs(info.file_name)
+        await kb.add_documents(info.file_name, docs)
+    return len(docs)
+
+
+async def ingest_kb(kb_name: str, force: bool = False, max_workers: int = KB_INGEST_WORKERS,
+                    wait_background: bool = False) -> IngestReport:
+    '''
+    增量更新知识库：跳过未修改的文件，只对新增或修改过的文件重新切分、向量化，并删除已不存在文件的向量。
+    文件加载、切分在进程池中进行，与向量化流水线并行。
+    向量索引保存后才更新knowledge_file记录，中途失败时下次运行会重新处理这些文件；
+    删除按索引状态中记录的文件id进行，并在开始时清理索引中没有的file_doc映射。
+    wait_background: 等待保存后触发的后台任务(如段合并)完成，独立运行的入库脚本退出前需要等待
+    '''
+    start = time.perf_counter()
+    report = IngestReport(kb_name=kb_name)
+    kb = await get_kb_service(kb_name)
+    if kb is None:
+        raise ValueError(f"未找到知识库 {kb_name}")
+    kb.ensure_loaded()
+    # 清理上次运行在保存索引前中断时已提交的映射
+    await kb.reconcile_db()
+    stats_before = dict(kb.ingest_stats)
+    added, modified, deleted, report.unchanged = await plan_ingestion(kb_name, force)
+
+    for file_name in deleted:
+        await kb.delete_file_docs(file_name)
+
+    done: List[Tuple[FileInfo, int]] = []
+    async for info, docs, error in iter_load_and_split(added + modified, max_workers):
+        try:
+            if error is not None:
+                raise error
+            done.append((info, await ingest_file(kb, info, docs)))
+        except Exception as e:
+            report.failed[info.file_name] = str(e)
+
+    if deleted or done:
+        await asyncio.to_thread(kb.save)
+
+    async with request_session():
+        for file_name in deleted:
+            await delete_file_from_db(kb_name, file_name)
+        for info, docs_count in done:
+            await add_file_to_db(kb_name, info.file_name, file_ext(info.file_name),
+                                 get_loader_name(file_ext(info.file_name)), TEXT_SPLITTER_NAME,
+                                 info.mtime, info.size, docs_count)
+        await update_kb_file_count(kb_name, await count_files_from_db(kb_name))
+
+    added_names = {i.file_name for i in added}
+    for info, docs_count in done:
+        (report.added if info.file_name in added_names else report.updated).append(info.file_name)
+        report.chunks += docs_count
+    report.deleted = deleted
+    stats = {k: v - stats_before[k] for k, v in kb.ingest_stats.items()}
+    report.duplicates = stats["duplicates"]
+    report.dedup_ratio = stats["duplicates"] / stats["chunks"] if stats["chunks"] else 0.0
+    report.embedding_time = stats["embedding_time"]
+    if stats["embedded"]:
+        report.embedding_time_saved = stats["embedding_time"] / stats["embedded"] * stats["duplicates"]
+    if wait_background:
+        await asyncio.to_thread(kb.store.wait_background)
+    report.elapsed = time.perf_counter() - start
+    return report
+
+
+if __name__ == '__main__':
+    import sys
+    import json
+
+    result = asyncio.run(ingest_kb(sys.argv[1], force="--force" in sys.argv, wait_background=True))
+    print(json.dumps(result.to_dict(), ensure_ascii=False, indent=2))
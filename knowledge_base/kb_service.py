@@ -0,0 +1,413 @@
+import asyncio
+import json
+import os
+import threading
+import time
+from typing import Dict, Any, List, Optional
+
+import numpy as np
+
+from configs.kb import KB_ROOT_PATH, DEFAULT_VS_TYPE, VECTOR_SEARCH_TOP_K, SCORE_THRESHOLD, \
+    EMBEDDING_QUERY_INSTRUCTION, KB_HYBRID_SEARCH, HYBRID_CANDIDATE_FACTOR, RRF_K, HIERARCHICAL_SEARCH, KB_DEDUP
+from configs.model import EMBEDDING_MODEL
+from db.repository.knowledge_base_repository import get_kb_detail
+from db.repository.knowledge_file_repository import add_docs_to_db, delete_docs_from_db, list_docs_from_db, \
+    update_docs_meta_in_db, list_doc_ids_from_db, delete_docs_by_ids_from_db
+from db.repository.knowledge_metadata_repository import add_summary_chunks_to_db, delete_summary_chunks_from_db, \
+    list_summary_chunks_from_db, delete_summary_chunks_by_ids_from_db
+from embeddings.base import Embedder
+from knowledge_base.bm25 import BM25Index, reciprocal_rank_fusion
+from knowledge_base.dedup import DedupIndex
+from knowledge_base.summary import SummaryIndex, group_chunks, summarize_group, summary_vectors
+from knowledge_base.vector_store.base import VectorStore, atomic_save_json
+from knowledge_base.vector_store.flat import FlatVectorStore
+from knowledge_base.vector_store.hnsw import HNSWVectorStore
+from knowledge_base.vector_store.ivfpq import IVFPQVectorStore
+from knowledge_base.vector_store.segment import SegmentVectorStore
+
+# 向量库类型 -> 实现
+VS_TYPES: Dict[str, type] = {
+    FlatVectorStore.vs_type: FlatVectorStore,
+    IVFPQVectorStore.vs_type: IVFPQVectorStore,
+    HNSWVectorStore.vs_type: HNSWVectorStore,
+    SegmentVectorStore.vs_type: SegmentVectorStore,
+}
+
+
+def get_kb_path(kb_name: str) -> str:
+    return os.path.join(KB_ROOT_PATH, kb_name)
+
+
+def get_content_path(kb_name: str) -> str:
+    return os.path.join(get_kb_path(kb_name), "content")
+
+
+def get_vs_path(kb_name: str, vs_type: str) -> str:
+    return os.path.join(get_kb_path(kb_name), "vector_store", vs_type)
+
+
+class KBService:
+    """
+    知识库服务：管理一个知识库的向量索引及BM25索引，负责文档的向量化入库、删除及检索
+    向量id为int64，以字符串形式存入 file_doc.doc_id，文档原文存于 file_doc.meta_data["page_content"]
+    近似重复的文本段不写入向量及BM25索引，只在 file_doc.meta_data["duplicate_of"] 中记录原始段的doc_id
+    """
+
+    def __init__(self, kb_name: str, vs_type: str = DEFAULT_VS_TYPE, embed_model: str = EMBEDDING_MODEL,
+                 embedder: Embedder = None):
+        if vs_type not in VS_TYPES:
+            raise ValueError(f"不支持的向量库类型: {vs_type}")
+        self.kb_name = kb_name
+        self.vs_type = vs_type
+        self.embed_model = embed_model
+        self._embedder = embedder
+        self.store: VectorStore = VS_TYPES[vs_type](get_vs_path(kb_name, vs_type))
+        self.bm25 = BM25Index(os.path.join(get_kb_path(kb_name), "vector_store", "bm25"))
+        self.summaries = SummaryIndex(os.path.join(get_kb_path(kb_name), "vector_store", "summary"))
+        self.dedup = DedupIndex(os.path.join(get_kb_path(kb_name), "vector_store", "dedup"))
+        # 累计的入库统计，入库脚本按前后差值计算每次运行的去重率及节省的向量化时间
+        self.ingest_stats = {"chunks": 0, "duplicates": 0, "embedded": 0, "embedding_time": 0.0}
+        self._lock = threading.RLock()
+        self._state_path = os.path.join(get_kb_path(kb_name), "vector_store", "state.json")
+        self._next_id = 0
+        # 每个文件在索引中的id(文本段及摘要)，与next_id一起原子写入state.json；删除文件时按它从索引中删除，
+        # 不依赖可能先于索引提交的file_doc映射。旧版本的state.json没有该字段时为None，由reconcile_db从数据库重建
+        self._file_ids: Optional[Dict[str, List[int]]] = {}
+        self._loaded_version = None
+
+    @property
+    def embedder(self) -> Embedder:
+        if self._embedder is None:
+            from embeddings.base import get_embedder
+            self._embedder = get_embedder(self.embed_model)
+        return self._embedder
+
+    def _version(self):
+        if not os.path.exists(self._state_path):
+            return None
+        st = os.stat(self._state_path)
+        return st.st_mtime_ns, st.st_size
+
+    def ensure_loaded(self):
+        '''
+        索引可能由其它进程(如入库脚本)更新，state.json变化时重新加载
+        '''
+        version = self._version()
+        if version == self._loaded_version:
+            return
+        with self._lock:
+            if version == self._loaded_version:
+                return
+            if version is not None:
+                with open(self._state_path, encoding="utf-8") as f:
+                    state = json.load(f)
+                self._next_id = state.get("next_id", 0)
+                self._file_ids = state.get("files")
+                self.store.load()
+                self.bm25.load()
+                self.summaries.load()
+                self.dedup.load()
+            self._loaded_version = version
+
+    def save(self):
+        with self._lock:
+            # 重建的索引构建完成后整体替换，不持锁的检索继续使用旧索引
+            compacted = self.store.compacted()
+            if compacted is not None:
+                self.store = compacted
+            self.store.save()
+            self.bm25.save()
+            self.summaries.save()
+            self.dedup.save()
+            os.makedirs(os.path.dirname(self._state_path), exist_ok=True)
+            atomic_save_json(self._state_path, {"next_id": self._next_id, "vs_type": self.vs_type,
+                                                "embed_model": self.embed_model, "files": self._file_ids})
+            self._loaded_version = self._version()
+
+    def _record_file_ids(self, file_name: str, ids: np.ndarray):
+        with self._lock:
+            if self._file_ids is not None:
+                self._file_ids.setdefault(file_name, []).extend(np.asarray(ids).tolist())
+
+    async def reconcile_db(self):
+        '''
+        入库进程在保存索引前退出时，file_doc/summary_chunk中可能已提交了索引中没有的映射：
+        删除索引状态中没有记录的映射行，这些文件的knowledge_file记录未更新，下次入库会重新处理。
+        旧版本的索引状态没有文件记录时从数据库重建
+        '''
+        self.ensure_loaded()
+        docs = await list_doc_ids_from_db(self.kb_name)
+        summaries = await list_summary_chunks_from_db(self.kb_name)
+        with self._lock:
+            if self._file_ids is None:
+                self._file_ids = {}
+                for file_name, doc_id in docs:
+                    self._file_ids.setdefault(file_name, []).append(int(doc_id))
+                for summary in summaries:
+                    file_name = (summary["meta_data"] or {}).get("file_name")
+                    if file_name:
+                        self._file_ids.setdefault(file_name, []).append(int(summary["summary_id"]))
+                return
+            known = {i for ids in self._file_ids.values() for i in ids}
+        await delete_docs_by_ids_from_db(self.kb_name, [doc_id for _, doc_id in docs if int(doc_id) not in known])
+        await delete_summary_chunks_by_ids_from_db(
+            self.kb_name, [s["summary_id"] for s in summaries if int(s["summary_id"]) not in known])
+
+    def allocate_ids(self, n: int) -> np.ndarray:
+        with self._lock:
+            ids = np.arange(self._next_id, self._next_id + n, dtype=np.int64)
+            self._next_id += n
+            return ids
+
+    def embed_documents(self, texts: List[str]) -> np.ndarray:
+        return self.embedder.embed_documents(texts)
+
+    def embed_queries(self, queries: List[str]) -> np.ndarray:
+        return self.embedder.embed_documents([EMBEDDING_QUERY_INSTRUCTION + q for q in queries])
+
+    def add_vectors(self, vectors: np.ndarray, ids: np.ndarray = None) -> np.ndarray:
+        '''
+        写入向量，返回id；未指定ids时分配新id
+        '''
+        self.ensure_loaded()
+        with self._lock:
+            if ids is None:
+                ids = self.allocate_ids(len(vectors))
+            if len(ids):
+                self.store.add(ids, vectors)
+            return ids
+
+    def delete_vectors(self, ids: List) -> int:
+        self.ensure_loaded()
+        ids = np.asarray([int(i) for i in ids], dtype=np.int64)
+        with self._lock:
+            self.bm25.delete(ids)
+            return self.store.delete(ids)
+
+    def search_vectors(self, queries: np.ndarray, top_k: int, hierarchical: bool = False):
+        # 检索不持锁，避免被入库及保存阻塞；各向量库保证与写入并发时读到一致的数据
+        self.ensure_loaded()
+        store = self.store
+        if hierarchical and self.summaries.size:
+            try:
+                return self.summaries.search(queries, top_k, store.get_vectors,
+                                             HIERARCHICAL_SEARCH["top_summaries"])
+            except NotImplementedError:
+                pass
+        return store.search(queries, top_k)
+
+    def find_duplicates(self, ids: np.ndarray, docs: List[Dict[str, Any]]) -> Dict[int, int]:
+        '''
+        在去重索引中查找近似重复的文本段，返回 {重复段id: 原始段id}；其余文本段作为原始段加入索引，
+        因此同一批文档内部的重复也会被找出
+        '''
+        signatures = [self.dedup.signature(d["page_content"]) for d in docs]
+        duplicate_of = {}
+        with self._lock:
+            for doc_id, signature in zip(ids.tolist(), signatures):
+                canonical_id = self.dedup.find(signature)
+                if canonical_id is None:
+                    self.dedup.add_canonical(doc_id, signature)
+                else:
+                    self.dedup.add_duplicate(doc_id, canonical_id)
+                    duplicate_of[doc_id] = canonical_id
+        return duplicate_of
+
+    async def add_documents(self, file_name: str, docs: List[Dict[str, Any]],
+                            vectors: np.ndarray = None, dedup: bool = KB_DEDUP["enabled"]) -> List[str]:
+        '''
+        向量化并写入文档，docs: [{"page_content": str, "metadata": dict}, ...]
+        dedup为True(且未传入vectors)时，与已入库文本段近似重复的段跳过向量化，只写入file_doc映射
+        '''
+        if not docs:
+            return []
+        self.ensure_loaded()
+        ids = self.allocate_ids(len(docs))
+        duplicate_of = {}
+        if dedup and vectors is None:
+            duplicate_of = await asyncio.to_thread(self.find_duplicates, ids, docs)
+        canonical = [i for i, doc_id in enumerate(ids.tolist()) if doc_id not in duplicate_of]
+        canonical_ids, canonical_docs = ids[canonical], [docs[i] for i in canonical]
+        try:
+            if vectors is None:
+                start = time.perf_counter()
+                vectors = await asyncio.to_thread(self.embed_documents, [d["page_content"] for d in canonical_docs]) \
+                    if canonical_docs else np.zeros((0, self.store.dim or 0), dtype=np.float32)
+                self.ingest_stats["embedding_time"] += time.perf_counter() - start
+                self.ingest_stats["embedded"] += len(canonical_docs)
+        except Exception:
+            with self._lock:
+                self.dedup.remove(ids.tolist())
+            raise
+        self.ingest_stats["chunks"] += len(docs)
+        self.ingest_stats["duplicates"] += len(duplicate_of)
+        self.add_vectors(vectors, canonical_ids)
+        with self._lock:
+            self.bm25.add(canonical_ids, [d["page_content"] for d in canonical_docs])
+        await add_docs_to_db(self.kb_name, file_name, [
+            {"id": doc_id, "metadata": {**d.get("metadata", {}), "page_content": d["page_content"],
+                                        **({"duplicate_of": str(duplicate_of[doc_id])} if doc_id in duplicate_of
+                                           else {})}}
+            for doc_id, d in zip(ids.tolist(), docs)
+        ])
+        self._record_file_ids(file_name, ids)
+        if HIERARCHICAL_SEARCH["build"] and canonical_docs:
+            await self.add_summaries(file_name, canonical_docs, canonical_ids, vectors)
+        return [str(i) for i in ids]
+
+    async def add_summaries(self, file_name: str, docs: List[Dict[str, Any]], ids: np.ndarray, vectors: np.ndarray):
+        '''
+        把文件的文本段分组，写入摘要索引及summary_chunk表
+        '''
+        groups = group_chunks(docs)
+        summary_ids = self.allocate_ids(len(groups))
+        with self._lock:
+            self.summaries.add(summary_ids, summary_vectors(vectors, groups), [ids[group] for group in groups])
+        self._record_file_ids(file_name, summary_ids)
+        await add_summary_chunks_to_db(self.kb_name, [
+            {"summary_context": summarize_group([docs[i]["page_content"] for i in group]),
+             "summary_id": int(summary_id), "doc_ids": ids[group].tolist(), "metadata": {"file_name": file_name}}
+            for summary_id, group in zip(summary_ids, groups)
+        ])
+
+    async def delete_file_docs(self, file_name: str) -> List[str]:
+        '''
+        删除文件对应的全部向量及文档映射
+        '''
+        self.ensure_loaded()
+        doc_ids = await delete_docs_from_db(self.kb_name, file_name)
+        summary_ids = await delete_summary_chunks_from_db(self.kb_name, file_name)
+        with self._lock:
+            # 按索引状态中记录的id删除，数据库中的映射在崩溃后可能与索引不一致
+            ids = self._file_ids.pop(file_name, None) if self._file_ids is not None else None
+            if ids is None:
+                ids = [int(i) for i in doc_ids + summary_ids]
+            orphans = self.dedup.remove(ids)
+        old_vectors = {}
+        if orphans:
+            try:
+                found_ids, found_vectors = self.store.get_vectors(np.asarray(list(orphans), dtype=np.int64))
+                old_vectors = dict(zip(found_ids.tolist(), found_vectors))
+            except NotImplementedError:
+                pass
+        self.delete_vectors(ids)
+        with self._lock:
+            self.summaries.delete(ids)
+        if orphans:
+            await self.promote_duplicates(orphans, old_vectors)
+        return doc_ids
+
+    async def promote_duplicates(self, orphans: Dict[int, List[int]], old_vectors: Dict[int, np.ndarray]):
+        '''
+        原始段被删除后，把其它文件中的第一个重复段提升为新的原始段：写入向量(优先复用原始段的向量，
+        取不到时重新向量化)及BM25索引，其余重复段的duplicate_of改为指向它
+        '''
+        rows = await list_docs_from_db(self.kb_name, doc_ids=[i for dups in orphans.values() for i in dups])
+        rows = {int(row["doc_id"]): row for row in rows}
+        promoted = [(old_id, dups[0], dups[1:]) for old_id, dups in orphans.items() if dups[0] in rows]
+        if not promoted:
+            return
+        texts = [rows[new_id]["meta_data"]["page_content"] for _, new_id, _ in promoted]
+        missing = [i for i, (old_id, _, _) in enumerate(promoted) if old_id not in old_vectors]
+        embedded = await asyncio.to_thread(self.embed_documents, [texts[i] for i in missing]) if missing else []
+        vectors = [old_vectors.get(old_id) for old_id, _, _ in promoted]
+        for i, vector in zip(missing, embedded):
+            vectors[i] = vector
+        vectors = np.stack(vectors).astype(np.float32)
+        new_ids = np.asarray([new_id for _, new_id, _ in promoted], dtype=np.int64)
+        self.add_vectors(vectors, new_ids)
+        metas = {}
+        with self._lock:
+            self.bm25.add(new_ids, texts)
+            for old_id, new_id, others in promoted:
+                self.dedup.promote(old_id, new_id, others)
+                metas[new_id] = {k: v for k, v in rows[new_id]["meta_data"].items() if k != "duplicate_of"}
+                for doc_id in others:
+                    if doc_id in rows:
+                        metas[doc_id] = {**rows[doc_id]["meta_data"], "duplicate_of": str(new_id)}
+        await update_docs_meta_in_db(self.kb_name, metas)
+        if HIERARCHICAL_SEARCH["build"]:
+            by_file: Dict[str, List[int]] = {}
+            for i, new_id in enumerate(new_ids.tolist()):
+                by_file.setdefault(rows[new_id]["file_name"], []).append(i)
+            for file_name, positions in by_file.items():
+                docs = [{"page_content": texts[i], "metadata": metas[int(new_ids[i])]} for i in positions]
+                await self.add_summaries(file_name, docs, new_ids[positions], vectors[positions])
+
+    def search_lexical(self, queries: List[str], top_k: int) -> List[List[tuple]]:
+        self.ensure_loaded()
+        return [[(str(i), float(s)) for s, i in zip(scores.tolist(), ids.tolist())]
+                for scores, ids in self.bm25.search_batch(queries, top_k)]
+
+    async def search_batch(self, queries: List[str], top_k: int = VECTOR_SEARCH_TOP_K,
+                           score_threshold: float = SCORE_THRESHOLD,
+                           hybrid: bool = KB_HYBRID_SEARCH,
+                           hierarchical: bool = HIERARCHICAL_SEARCH["enabled"]) -> List[List[Dict[str, Any]]]:
+        '''
+        批量检索，返回每个问题相似度不低于score_threshold的文档(按相似度从高到低)
+        hybrid为True时再做BM25检索，与向量检索结果按RRF融合后取前top_k个；只被关键词命中的文档score为0
+        hierarchical为True时向量检索先经摘要索引缩小范围
+        '''
+        if not queries:
+            return []
+        candidates = top_k * HYBRID_CANDIDATE_FACTOR if hybrid else top_k
+        vectors = await asyncio.to_thread(self.embed_queries, queries)
+        scores, ids = await asyncio.to_thread(self.search_vectors, vectors, candidates, hierarchical)
+        hits = [[(str(i), float(s)) for s, i in zip(row_scores, row_ids) if s >= score_threshold]
+                for row_scores, row_ids in zip(scores.tolist(), ids.tolist())]
+        if hybrid:
+            lexical = await asyncio.to_thread(self.search_lexical, queries, candidates)
+            fused_hits = []
+            for vector_row, lexical_row in zip(hits, lexical):
+                vector_scores, bm25_scores = dict(vector_row), dict(lexical_row)
+                fused = reciprocal_rank_fusion([[i for i, _ in vector_row], [i for i, _ in lexical_row]], RRF_K)
+                fused_hits.append([(doc_id, vector_scores.get(doc_id, 0.0),
+                                    {"bm25_score": bm25_scores.get(doc_id, 0.0), "rrf_score": rrf_score})
+                                   for doc_id, rrf_score in fused[:top_k]])
+            hits = fused_hits
+        else:
+            hits = [[(doc_id, score, {}) for doc_id, score in row] for row in hits]
+        docs = await list_docs_from_db(self.kb_name, doc_ids=list({hit[0] for row in hits for hit in row}))
+        docs = {d["doc_id"]: d for d in docs}
+        results = []
+        for row in hits:
+            results.append([{**self._to_result(docs[doc_id], score), **extra}
+                            for doc_id, score, extra in row if doc_id in docs])
+        return results
+
+    async def search(self, query: str, top_k: int = VECTOR_SEARCH_TOP_K,
+                     score_threshold: float = SCORE_THRESHOLD,
+                     hybrid: bool = KB_HYBRID_SEARCH,
+                     hierarchical: bool = HIERARCHICAL_SEARCH["enabled"]) -> List[Dict[str, Any]]:
+        return (await self.search_batch([query], top_k, score_threshold, hybrid, hierarchical))[0]
+
+    @staticmethod
+    def _to_result(doc: Dict[str, Any], score: float) -> Dict[str, Any]:
+        metadata = dict(doc.get("meta_data") or {})
+        return {
+            "doc_id": doc["doc_id"],
+            "file_name": doc["file_name"],
+            "page_content": metadata.pop("page_content", ""),
+            "metadata": metadata,
+            "score": score,
+        }
+
+
+_kb_services: Dict[str, KBService] = {}
+
+
+async def get_kb_service(kb_name: str) -> Optional[KBService]:
+    '''
+    获取知识库服务，知识库不存在时返回None；每个知识库每个进程只创建一个实例
+    '''
+    kb = await get_kb_detail(kb_name)
+    if kb is None:
+        _kb_services.pop(kb_name, None)
+        return None
+    service = _kb_services.get(kb_name)
+    vs_type = kb.vs_type or DEFAULT_VS_TYPE
+    embed_model = kb.embed_model or EMBEDDING_MODEL
+    if service is None or service.vs_type != vs_type or service.embed_model != embed_model:
+        service = KBService(kb_name, vs_type, embed_model)
+        _kb_services[kb_name] = service
+    return service
@@ -0,0 +1,158 @@
+import asyncio
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from typing import List, Dict, Any, Tuple, Optional
+
+import numpy as np
+
+from configs.model import RERANKER_MODEL, RERANKER_MAX_LENGTH, RERANKER_BATCH_SIZE, RERANKER_LATENCY_BUDGET_MS, \
+    RERANKER_CACHE_SIZE, MODEL_PATH
+from utils.stats import register_stats_provider
+
+
+class Reranker:
+    """
+    交叉编码器重排：对(问题, 文档)对打分，按得分重新排序检索结果
+    按文本长度排序后分批计算，同一批内长度相近，padding浪费最少；得分按(模型, 问题, 文档)缓存。
+    耗时预算按历史每对平均耗时估计，预计超出时只重排向量相似度最高的部分候选，其余候选丢弃。
+    """
+
+    def __init__(self, model_name: str = RERANKER_MODEL, device: str = None,
+                 batch_size: int = RERANKER_BATCH_SIZE, max_length: int = RERANKER_MAX_LENGTH,
+                 cache_size: int = RERANKER_CACHE_SIZE):
+        self.model_name = model_name
+        self.device = device
+        self.batch_size = batch_size
+        self.max_length = max_length
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[str, float]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._model = None
+        self._tokenizer = None
+        # 每对平均耗时(秒)的指数移动平均，用于估计重排耗时
+        self.seconds_per_pair: Optional[float] = None
+        self.requests = 0
+        self.pairs_scored = 0
+        self.cache_hits = 0
+        self.truncated = 0
+
+    def _load(self):
+        import torch
+        from transformers import AutoModelForSequenceClassification, AutoTokenizer
+        from embeddings.base import embedding_device
+
+        path = MODEL_PATH["reranker"].get(self.model_name, self.model_name)
+        self.device = embedding_device(self.device)
+        self._tokenizer = AutoTokenizer.from_pretrained(path)
+        self._model = AutoModelForSequenceClassification.from_pretrained(path).to(self.device).eval()
+        self._torch = torch
+
+    def compute_scores(self, pairs: List[Tuple[str, str]]) -> np.ndarray:
+        '''
+        对一批长度相近的(问题, 文档)对做一次前向计算，返回0-1之间的相关度
+        '''
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    self._load()
+        with self._torch.inference_mode():
+            inputs = self._tokenizer(pairs, padding=True, truncation=True, max_length=self.max_length,
+                                     return_tensors="pt").to(self.device)
+            logits = self._model(**inputs).logits.view(-1).float()
+            return self._torch.sigmoid(logits).cpu().numpy()
+
+    def _cache_key(self, query: str, text: str) -> str:
+        return hashlib.sha256(f"{self.model_name}\0{query}\0{text}".encode("utf-8")).hexdigest()
+
+    def score_pairs(self, pairs: List[Tuple[str, str]]) -> np.ndarray:
+        '''
+        按长度排序分批计算，返回与pairs顺序一致的得分
+        '''
+        scores = np.zeros(len(pairs), dtype=np.float32)
+        if not pairs:
+            return scores
+        order = sorted(range(len(pairs)), key=lambda i: len(pairs[i][0]) + len(pairs[i][1]), reverse=True)
+        start = time.perf_counter()
+        for i in range(0, len(order), self.batch_size):
+            batch = order[i:i + self.batch_size]
+            scores[batch] = self.compute_scores([pairs[j] for j in batch])
+        per_pair = (time.perf_counter() - start) / len(pairs)
+        self.seconds_per_pair = per_pair if self.seconds_per_pair is None \
+            else 0.8 * self.seconds_per_pair + 0.2 * per_pair
+        self.pairs_scored += len(pairs)
+        return scores
+
+    def rerank(self, query: str, docs: List[Dict[str, Any]], top_n: int,
+               budget_ms: float = RERANKER_LATENCY_BUDGET_MS) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+        '''
+        docs为按向量相似度从高到低排列的检索结果，返回(重排后的前top_n个文档, 重排信息)
+        文档中增加relevance_score字段
+        '''
+        start = time.perf_counter()
+        self.requests += 1
+        keys = [self._cache_key(query, doc["page_content"]) for doc in docs]
+        scores: Dict[int, float] = {}
+        with self._lock:
+            for i, key in enumerate(keys):
+                score = self._cache.get(key)
+                if score is not None:
+                    self._cache.move_to_end(key)
+                    scores[i] = score
+        cached = len(scores)
+        self.cache_hits += cached
+
+        missing = [i for i in range(len(docs)) if i not in scores]
+        dropped = 0
+        if missing and budget_ms and self.seconds_per_pair:
+            allowed = max(top_n, int(budget_ms / 1000 / self.seconds_per_pair))
+            if len(missing) > allowed:
+                dropped = len(missing) - allowed
+                missing = missing[:allowed]
+                self.truncated += 1
+        if missing:
+            computed = self.score_pairs([(query, docs[i]["page_content"]) for i in missing])
+            with self._lock:
+                for i, score in zip(missing, computed.tolist()):
+                    scores[i] = score
+                    self._cache[keys[i]] = score
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+
+        ranked = sorted(scores, key=lambda i: scores[i], reverse=True)[:top_n]
+        results = [{**docs[i], "relevance_score": scores[i]} for i in ranked]
+        info = {
+            "model": self.model_name,
+            "candidates": len(docs),
+            "scored": len(missing),
+            "cached": cached,
+            "dropped": dropped,
+            "rerank_time": time.perf_counter() - start,
+        }
+        return results, info
+
+    async def arerank(self, query: str, docs: List[Dict[str, Any]], top_n: int,
+                      budget_ms: float = RERANKER_LATENCY_BUDGET_MS) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+        if not docs:
+            return [], {"model": self.model_name, "candidates": 0, "scored": 0, "cached": 0, "dropped": 0,
+                        "rerank_time": 0.0}
+        return await asyncio.to_thread(self.rerank, query, docs, top_n, budget_ms)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "requests": self.requests,
+            "pairs_scored": self.pairs_scored,
+            "cache_hits": self.cache_hits,
+            "cache_items": len(self._cache),
+            "truncated_requests": self.truncated,
+            "ms_per_pair": round(self.seconds_per_pair * 1000, 3) if self.seconds_per_pair else None,
+        }
+
+
+@lru_cache(maxsize=2)
+def get_reranker(model_name: str = RERANKER_MODEL) -> Reranker:
+    reranker = Reranker(model_name)
+    register_stats_provider(f"reranker:{model_name}", reranker.stats)
+    return reranker
@@ -0,0 +1,140 @@
+import os
+import re
+import threading
+from typing import List, Dict, Any, Tuple, Callable
+
+import numpy as np
+
+from configs.kb import HIERARCHICAL_SEARCH
+from knowledge_base.vector_store.base import save_arrays, load_arrays
+from knowledge_base.vector_store.flat import FlatVectorStore
+
+_SENTENCE_END_RE = re.compile(r"(?<=[。！？!?；;\n])")
+
+
+def group_chunks(docs: List[Dict[str, Any]], group_size: int = HIERARCHICAL_SEARCH["group_size"]) -> List[List[int]]:
+    '''
+    把一个文件中相邻的文本段分组，每组最多group_size段；有页码(metadata["page"])时尽量不跨页拆分同一页
+    '''
+    groups, current, current_page = [], [], None
+    for i, doc in enumerate(docs):
+        page = doc.get("metadata", {}).get("page")
+        if current and (len(current) >= group_size or (page != current_page and len(current) >= group_size // 2)):
+            groups.append(current)
+            current = []
+        current.append(i)
+        current_page = page
+    if current:
+        groups.append(current)
+    return groups
+
+
+def summarize_group(texts: List[str], max_length: int = 255) -> str:
+    '''
+    抽取式摘要：依次取每段文本的首句，直到达到max_length
+    '''
+    summary = ""
+    for text in texts:
+        sentence = next((s.strip() for s in _SENTENCE_END_RE.split(text) if s.strip()), "")
+        if not sentence:
+            continue
+        if len(summary) + len(sentence) > max_length:
+            summary = summary or sentence[:max_length]
+            break
+        summary += sentence
+    return summary
+
+
+def summary_vectors(vectors: np.ndarray, groups: List[List[int]]) -> np.ndarray:
+    '''
+    摘要向量取组内文本向量的归一化均值，无需额外向量化
+    '''
+    centroids = np.stack([vectors[group].mean(axis=0) for group in groups]).astype(np.float32)
+    return centroids / np.maximum(np.linalg.norm(centroids, axis=1, keepdims=True), 1e-12)
+
+
+def hierarchical_search(queries: np.ndarray, summary_store, members: Callable[[np.ndarray], np.ndarray],
+                        get_vectors: Callable[[np.ndarray], Tuple[np.ndarray, np.ndarray]],
+                        top_k: int, top_summaries: int) -> Tuple[np.ndarray, np.ndarray]:
+    '''
+    两级检索：先在摘要索引中取最相关的top_summaries组，再只对这些组内的文本向量计算相似度
+    members(summary_ids) 返回这些组包含的文本id，get_vectors(ids) 返回(ids, 向量)
+    返回与 VectorStore.search 相同形状的(scores, ids)，不足top_k时以-inf、-1补齐
+    '''
+    queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+    _, summary_ids = summary_store.search(queries, top_summaries)
+    out_scores = np.full((len(queries), top_k), -np.inf, dtype=np.float32)
+    out_ids = np.full((len(queries), top_k), -1, dtype=np.int64)
+    for qi, row in enumerate(summary_ids):
+        ids, vectors = get_vectors(members(row[row >= 0]))
+        if not len(ids):
+            continue
+        scores = vectors @ queries[qi]
+        n = min(top_k, len(scores))
+        top = np.argpartition(-scores, n - 1)[:n] if n < len(scores) else np.arange(n)
+        top = top[np.argsort(-scores[top])]
+        out_scores[qi, :n] = scores[top]
+        out_ids[qi, :n] = ids[top]
+    return out_scores, out_ids
+
+
+class SummaryIndex:
+    """
+    摘要向量索引：摘要向量存于一个flat索引，摘要id -> 组内文本id 的映射以CSR数组保存在同目录的 groups.arr 中
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.store = FlatVectorStore(path)
+        self._groups: Dict[int, np.ndarray] = {}
+        self._lock = threading.RLock()
+
+    @property
+    def size(self) -> int:
+        return self.store.size
+
+    def add(self, summary_ids: np.ndarray, vectors: np.ndarray, groups: List[np.ndarray]):
+        with self._lock:
+            self.store.add(summary_ids, vectors)
+            for summary_id, doc_ids in zip(np.asarray(summary_ids).tolist(), groups):
+                self._groups[summary_id] = np.asarray(doc_ids, dtype=np.int64)
+
+    def delete(self, summary_ids: List) -> int:
+        summary_ids = np.asarray([int(i) for i in summary_ids], dtype=np.int64)
+        with self._lock:
+            for summary_id in summary_ids.tolist():
+                self._groups.pop(summary_id, None)
+            return self.store.delete(summary_ids)
+
+    def members(self, summary_ids: np.ndarray) -> np.ndarray:
+        groups = [self._groups[i] for i in np.asarray(summary_ids).tolist() if i in self._groups]
+        return np.concatenate(groups) if groups else np.zeros(0, dtype=np.int64)
+
+    def search(self, queries: np.ndarray, top_k: int, get_vectors, top_summaries: int) -> Tuple[np.ndarray, np.ndarray]:
+        with self._lock:
+            return hierarchical_search(queries, self.store, self.members, get_vectors, top_k, top_summaries)
+
+    def save(self):
+        with self._lock:
+            self.store.save()
+            summary_ids = np.asarray(list(self._groups), dtype=np.int64)
+            lengths = [len(self._groups[i]) for i in summary_ids.tolist()]
+            save_arrays(os.path.join(self.path, "groups.arr"), {
+                "summary_ids": summary_ids,
+                "indptr": np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64),
+                "members": np.concatenate(list(self._groups.values())) if self._groups
+                else np.zeros(0, dtype=np.int64),
+            })
+
+    def load(self) -> bool:
+        with self._lock:
+            self.store = FlatVectorStore(self.path)
+            self._groups = {}
+            groups_path = os.path.join(self.path, "groups.arr")
+            if not self.store.load() or not os.path.exists(groups_path):
+                return False
+            arrays, _ = load_arrays(groups_path, mmap=False)
+            indptr, members = arrays["indptr"], arrays["members"]
+            for i, summary_id in enumerate(arrays["summary_ids"].tolist()):
+                self._groups[summary_id] = members[indptr[i]:indptr[i + 1]]
+            return True
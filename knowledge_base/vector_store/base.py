@@ -0,0 +1,182 @@
+import json
+import os
+from typing import Tuple, Dict, Optional
+
+import numpy as np
+
+from configs.kb import VECTOR_SEARCH_BLOCK_SIZE
+
+
+def topk_inner_product(queries: np.ndarray, vectors: np.ndarray, top_k: int,
+                       block_size: int = VECTOR_SEARCH_BLOCK_SIZE,
+                       exclude: np.ndarray = None) -> Tuple[np.ndarray, np.ndarray]:
+    '''
+    批量暴力检索：按块做矩阵乘法，每块用argpartition取top_k后与已有结果合并
+    exclude 为不参与检索的行(如已删除)的标记，这些行的得分为-inf，top_k超过其余行数时才会出现在结果中
+    返回(scores, rows)，形状均为(查询数, k)，按相似度从高到低排序
+    '''
+    queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+    n = len(vectors)
+    k = min(top_k, n)
+    if k <= 0:
+        return np.zeros((len(queries), 0), dtype=np.float32), np.zeros((len(queries), 0), dtype=np.int64)
+    best_scores = best_rows = None
+    for start in range(0, n, block_size):
+        scores = queries @ vectors[start:start + block_size].T
+        if exclude is not None:
+            excluded = exclude[start:start + block_size]
+            if excluded.any():
+                scores[:, excluded] = -np.inf
+        if scores.shape[1] > k:
+            rows = np.argpartition(scores, -k, axis=1)[:, -k:]
+            scores = np.take_along_axis(scores, rows, axis=1)
+        else:
+            rows = np.broadcast_to(np.arange(scores.shape[1]), scores.shape)
+        rows = rows + start
+        if best_scores is None:
+            best_scores, best_rows = scores, rows
+            continue
+        scores = np.concatenate([best_scores, scores], axis=1)
+        rows = np.concatenate([best_rows, rows], axis=1)
+        top = np.argpartition(scores, -k, axis=1)[:, -k:]
+        best_scores = np.take_along_axis(scores, top, axis=1)
+        best_rows = np.take_along_axis(rows, top, axis=1)
+    order = np.argsort(-best_scores, axis=1)
+    return np.take_along_axis(best_scores, order, axis=1), np.take_along_axis(best_rows, order, axis=1).astype(np.int64)
+
+
+def kmeans(x: np.ndarray, k: int, iters: int = 20, seed: int = 0,
+           block_size: int = VECTOR_SEARCH_BLOCK_SIZE) -> Tuple[np.ndarray, np.ndarray]:
+    '''
+    L2距离的k-means(Lloyd)，返回(聚类中心, 每个样本所属的类)；空簇用随机样本重新初始化
+    '''
+    x = np.asarray(x, dtype=np.float32)
+    rng = np.random.default_rng(seed)
+    k = min(k, len(x))
+    centroids = x[rng.choice(len(x), k, replace=False)].copy()
+    assign = np.zeros(len(x), dtype=np.int64)
+    for _ in range(iters):
+        # argmin ||x - c||^2 = argmin (||c||^2 - 2 x·c)
+        half_norms = 0.5 * np.einsum("ij,ij->i", centroids, centroids)
+        for start in range(0, len(x), block_size):
+            assign[start:start + block_size] = np.argmax(x[start:start + block_size] @ centroids.T - half_norms, axis=1)
+        counts = np.bincount(assign, minlength=k)
+        empty = counts == 0
+        order = np.argsort(assign, kind="stable")
+        starts = np.concatenate([[0], np.cumsum(counts)[:-1]])[~empty]
+        centroids[~empty] = np.add.reduceat(x[order], starts, axis=0) / counts[~empty, None]
+        if empty.any():
+            centroids[empty] = x[rng.choice(len(x), int(empty.sum()), replace=False)]
+    return centroids, assign
+
+
+def atomic_save_npy(path: str, array: np.ndarray):
+    tmp = f"{path}.tmp.npy"
+    np.save(tmp, array)
+    os.replace(tmp, path)
+
+
+def atomic_save_json(path: str, data: dict):
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp, path)
+
+
+_ARRAY_FILE_MAGIC = b"KBARRAYS"
+_ARRAY_FILE_ALIGN = 64
+
+
+def save_arrays(path: str, arrays: Dict[str, np.ndarray], meta: dict = None):
+    '''
+    把多个数组写入单个文件：8字节魔数 + 8字节头长度 + JSON头(各数组的dtype、shape、偏移及meta) + 按64字节对齐的数组数据。
+    先写临时文件再替换，已映射旧文件的进程不受影响
+    '''
+    layout, offset = {}, 0
+    for name, array in arrays.items():
+        layout[name] = {"dtype": array.dtype.str, "shape": list(array.shape), "offset": offset}
+        offset += -(-array.nbytes // _ARRAY_FILE_ALIGN) * _ARRAY_FILE_ALIGN
+    header = json.dumps({"arrays": layout, "meta": meta or {}}).encode("utf-8")
+    data_start = -(-(16 + len(header)) // _ARRAY_FILE_ALIGN) * _ARRAY_FILE_ALIGN
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(_ARRAY_FILE_MAGIC + len(header).to_bytes(8, "little") + header)
+        for name, array in arrays.items():
+            f.seek(data_start + layout[name]["offset"])
+            f.write(np.ascontiguousarray(array).tobytes())
+        f.truncate(data_start + offset)
+    os.replace(tmp, path)
+
+
+def load_arrays(path: str, mmap: bool = True) -> Tuple[Dict[str, np.ndarray], dict]:
+    '''
+    读取 save_arrays 写入的文件，mmap为True时各数组为只读的numpy.memmap，多个进程共享页缓存
+    '''
+    with open(path, "rb") as f:
+        if f.read(8) != _ARRAY_FILE_MAGIC:
+            raise ValueError(f"无效的索引文件: {path}")
+        header_len = int.from_bytes(f.read(8), "little")
+        header = json.loads(f.read(header_len))
+    data_start = -(-(16 + header_len) // _ARRAY_FILE_ALIGN) * _ARRAY_FILE_ALIGN
+    arrays = {}
+    for name, info in header["arrays"].items():
+        dtype, shape = np.dtype(info["dtype"]), tuple(info["shape"])
+        offset = data_start + info["offset"]
+        if int(np.prod(shape)) == 0:
+            arrays[name] = np.zeros(shape, dtype=dtype)
+        elif mmap:
+            arrays[name] = np.memmap(path, dtype=dtype, mode="r", offset=offset, shape=shape)
+        else:
+            arrays[name] = np.fromfile(path, dtype=dtype, count=int(np.prod(shape)), offset=offset).reshape(shape)
+    return arrays, header["meta"]
+
+
+class VectorStore:
+    """
+    向量索引接口
+    向量均为L2归一化的float32，相似度为内积；每个向量对应一个int64 id，与 file_doc.doc_id 一一对应
+    """
+    vs_type: str = ""
+
+    def __init__(self, path: str, dim: int = None):
+        self.path = path
+        self.dim = dim
+
+    @property
+    def size(self) -> int:
+        raise NotImplementedError
+
+    def add(self, ids: np.ndarray, vectors: np.ndarray):
+        raise NotImplementedError
+
+    def delete(self, ids: np.ndarray) -> int:
+        raise NotImplementedError
+
+    def search(self, queries: np.ndarray, top_k: int) -> Tuple[np.ndarray, np.ndarray]:
+        '''
+        返回(scores, ids)，形状均为(查询数, k)，按相似度从高到低排序；索引中向量不足k个时列数相应减少
+        '''
+        raise NotImplementedError
+
+    def get_vectors(self, ids: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        '''
+        按id取原始向量，返回(找到的ids, 向量)；不保存原始向量的索引不支持
+        '''
+        raise NotImplementedError
+
+    def compacted(self) -> Optional["VectorStore"]:
+        '''
+        需要重建时(如删除过多)返回重建后的新索引，否则返回None；不修改当前索引，由调用方整体替换
+        '''
+        return None
+
+    def save(self):
+        raise NotImplementedError
+
+    def load(self) -> bool:
+        raise NotImplementedError
+
+    def wait_background(self):
+        '''
+        等待后台维护任务(如段合并)完成，写入进程退出前调用
+        '''
@@ -0,0 +1,145 @@
+import json
+import os
+from typing import Tuple
+
+import numpy as np
+
+from configs.kb import FLAT
+from knowledge_base.vector_store.base import VectorStore, topk_inner_product, atomic_save_json, save_arrays, \
+    load_arrays
+
+
+class FlatVectorStore(VectorStore):
+    """
+    暴力检索向量索引
+    全部向量保存在一个float32矩阵中，检索为分块矩阵乘法 + top-k，结果精确。
+    向量和id按倍数预留容量，新增只写入快照行数之外的行；删除只打墓碑标记，已删除行占比超过 compact_ratio 时
+    去掉已删除的行。写入完成后整体替换快照 (行数, vectors, ids, 墓碑, 已删除数, 按id排序的行号)，
+    检索无需加锁也不会读到新旧不一致的数据；写入方之间需自行加锁。
+    get_vectors 按id排序的行号二分查找，耗时与所取的id数成正比，排序在每次写入后首次查找时计算
+    """
+    vs_type = "flat"
+
+    def __init__(self, path: str, dim: int = None, compact_ratio: float = FLAT["compact_ratio"]):
+        super().__init__(path, dim)
+        self.compact_ratio = compact_ratio
+        self._set_data(np.zeros((0, dim or 0), dtype=np.float32), np.zeros(0, dtype=np.int64))
+
+    def _set_data(self, vectors: np.ndarray, ids: np.ndarray):
+        '''
+        用给定的向量和id(均为未删除的行)替换索引内容
+        '''
+        self._vectors, self._ids = vectors, ids
+        self._deleted = np.zeros(len(ids), dtype=bool)
+        self.n = len(ids)
+        self.n_deleted = 0
+        self._publish()
+
+    def _publish(self):
+        # 最后一项存放按id排序的未删除行号，首次get_vectors时计算
+        self._snapshot: Tuple[int, np.ndarray, np.ndarray, np.ndarray, int, list] = \
+            (self.n, self._vectors, self._ids, self._deleted, self.n_deleted, [None])
+
+    def _reserve(self, n: int):
+        '''
+        按倍数扩容，避免每次写入都复制整个矩阵；扩容生成新数组，旧快照不受影响
+        '''
+        if n > len(self._ids):
+            capacity = max(n, 2 * len(self._ids), 1024)
+            vectors = np.zeros((capacity, self.dim), dtype=np.float32)
+            ids = np.full(capacity, -1, dtype=np.int64)
+            deleted = np.zeros(capacity, dtype=bool)
+            vectors[:self.n], ids[:self.n], deleted[:self.n] = \
+                self._vectors[:self.n], self._ids[:self.n], self._deleted[:self.n]
+            self._vectors, self._ids, self._deleted = vectors, ids, deleted
+
+    @property
+    def vectors(self) -> np.ndarray:
+        n, vectors, _, deleted, n_deleted, _ = self._snapshot
+        return vectors[:n][~deleted[:n]] if n_deleted else vectors[:n]
+
+    @property
+    def ids(self) -> np.ndarray:
+        n, _, ids, deleted, n_deleted, _ = self._snapshot
+        return ids[:n][~deleted[:n]] if n_deleted else ids[:n]
+
+    @property
+    def size(self) -> int:
+        n, _, _, _, n_deleted, _ = self._snapshot
+        return n - n_deleted
+
+    def add(self, ids: np.ndarray, vectors: np.ndarray):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if self.dim is None or not self.size:
+            self.dim = vectors.shape[1]
+            self._set_data(np.zeros((0, self.dim), dtype=np.float32), np.zeros(0, dtype=np.int64))
+        self._reserve(self.n + len(vectors))
+        self._vectors[self.n:self.n + len(vectors)] = vectors
+        self._ids[self.n:self.n + len(vectors)] = np.asarray(ids, dtype=np.int64)
+        self.n += len(vectors)
+        self._publish()
+
+    def delete(self, ids: np.ndarray) -> int:
+        n = self.n
+        mask = np.isin(self._ids[:n], np.asarray(ids, dtype=np.int64)) & ~self._deleted[:n]
+        deleted = int(mask.sum())
+        if not deleted:
+            return 0
+        self.n_deleted += deleted
+        if self.n_deleted > self.compact_ratio * n:
+            keep = ~(self._deleted[:n] | mask)
+            self._set_data(self._vectors[:n][keep], self._ids[:n][keep])
+        else:
+            # 墓碑数组很小，复制后修改，检索中的旧快照不受影响
+            self._deleted = self._deleted.copy()
+            self._deleted[:n] |= mask
+            self._publish()
+        return deleted
+
+    def search(self, queries: np.ndarray, top_k: int) -> Tuple[np.ndarray, np.ndarray]:
+        n, vectors, ids, deleted, n_deleted, _ = self._snapshot
+        scores, rows = topk_inner_product(queries, vectors[:n], min(top_k, n - n_deleted),
+                                          exclude=deleted[:n] if n_deleted else None)
+        return scores, ids[rows]
+
+    def get_vectors(self, ids: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        n, vectors, store_ids, deleted, n_deleted, lookup = self._snapshot
+        ids = np.asarray(ids, dtype=np.int64)
+        if n == n_deleted or not len(ids):
+            return store_ids[:0], vectors[:0]
+        if lookup[0] is None:
+            rows = np.flatnonzero(~deleted[:n]) if n_deleted else np.arange(n)
+            # id通常递增分配，稳定排序(timsort)对基本有序的数组接近线性
+            rows = rows[np.argsort(store_ids[rows], kind="stable")]
+            lookup[0] = (store_ids[rows], rows)
+        sorted_ids, order = lookup[0]
+        positions = np.minimum(np.searchsorted(sorted_ids, ids), len(order) - 1)
+        # 按行号排序去重，与索引中的顺序一致
+        rows = np.unique(order[positions[sorted_ids[positions] == ids]])
+        return store_ids[rows], vectors[rows]
+
+    def save(self):
+        os.makedirs(self.path, exist_ok=True)
+        vectors, ids = self.vectors, self.ids
+        # 向量与id写入同一个文件，崩溃时不会留下不匹配的两个文件
+        save_arrays(os.path.join(self.path, "flat.arr"), {"vectors": vectors, "ids": ids},
+                    meta={"vs_type": self.vs_type, "dim": self.dim})
+        atomic_save_json(os.path.join(self.path, "meta.json"), {"vs_type": self.vs_type, "dim": self.dim})
+        for name in ("vectors.npy", "ids.npy"):
+            if os.path.exists(os.path.join(self.path, name)):
+                os.remove(os.path.join(self.path, name))
+
+    def load(self) -> bool:
+        meta_path = os.path.join(self.path, "meta.json")
+        if not os.path.exists(meta_path):
+            return False
+        with open(meta_path, encoding="utf-8") as f:
+            self.dim = json.load(f)["dim"]
+        data_path = os.path.join(self.path, "flat.arr")
+        if os.path.exists(data_path):
+            arrays, _ = load_arrays(data_path, mmap=False)
+            self._set_data(arrays["vectors"], arrays["ids"])
+        else:
+            # 旧版本分别保存的 vectors.npy / ids.npy
+            self._set_data(np.load(os.path.join(self.path, "vectors.npy")), np.load(os.path.join(self.path, "ids.npy")))
+        return True
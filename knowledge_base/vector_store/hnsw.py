@@ -0,0 +1,263 @@
+import heapq
+import math
+import os
+from typing import Tuple, List, Optional
+
+import numpy as np
+
+from configs.kb import HNSW
+from knowledge_base.vector_store.base import VectorStore, save_arrays, load_arrays
+
+
+class HNSWVectorStore(VectorStore):
+    """
+    HNSW 图索引，近似检索，单条查询延迟与向量总数近似成对数关系
+    邻居表均为定长int32数组(不足以-1补齐)：第0层 neighbors0[node] 长度 2M；
+    上层节点的各层邻居连续存放在 upper_neighbors 中，upper_offsets[node] 为其第1层所在行。
+    删除只打墓碑标记，节点仍参与图遍历但不出现在结果中；墓碑占比超过 compact_ratio 时由 compacted() 重建为新索引，
+    调用方整体替换，进行中的检索继续使用旧索引。
+    索引保存为单个文件，加载时以memmap只读映射，首次写入时才复制到内存。
+    """
+    vs_type = "hnsw"
+
+    def __init__(self, path: str, dim: int = None, M: int = HNSW["M"], ef_construction: int = HNSW["ef_construction"],
+                 ef_search: int = HNSW["ef_search"], compact_ratio: float = HNSW["compact_ratio"], seed: int = 0):
+        super().__init__(path, dim)
+        self.M = M
+        self.M0 = 2 * M
+        self.ef_construction = ef_construction
+        self.ef_search = ef_search
+        self.compact_ratio = compact_ratio
+        self._level_mult = 1 / math.log(M)
+        self._rng = np.random.default_rng(seed)
+        self._reset(dim or 0)
+
+    def _reset(self, dim: int):
+        self.n = 0
+        self.vectors = np.zeros((0, dim), dtype=np.float32)
+        self.ids = np.zeros(0, dtype=np.int64)
+        self.levels = np.zeros(0, dtype=np.int8)
+        self.deleted = np.zeros(0, dtype=bool)
+        self.neighbors0 = np.zeros((0, self.M0), dtype=np.int32)
+        self.upper_offsets = np.zeros(0, dtype=np.int64)
+        self.upper_neighbors = np.zeros((0, self.M), dtype=np.int32)
+        self.n_upper = 0
+        self.entry_point = -1
+        self.max_level = -1
+        self.n_deleted = 0
+        self._writable = True
+
+    @property
+    def size(self) -> int:
+        return self.n - self.n_deleted
+
+    @property
+    def file_path(self) -> str:
+        return os.path.join(self.path, "index.hnsw")
+
+    def _ensure_writable(self):
+        '''
+        memmap加载的数组只读，写入前复制到内存
+        '''
+        if not self._writable:
+            for name in ("vectors", "ids", "levels", "deleted", "neighbors0", "upper_offsets", "upper_neighbors"):
+                setattr(self, name, np.array(getattr(self, name)))
+            self._writable = True
+
+    def _reserve(self, n: int, n_upper: int):
+        '''
+        按倍数扩容，避免每次插入都复制数组
+        '''
+        if n > len(self.ids):
+            capacity = max(n, 2 * len(self.ids), 1024)
+            grow = capacity - len(self.ids)
+            self.vectors = np.concatenate([self.vectors, np.zeros((grow, self.dim), dtype=np.float32)])
+            self.ids = np.concatenate([self.ids, np.full(grow, -1, dtype=np.int64)])
+            self.levels = np.concatenate([self.levels, np.zeros(grow, dtype=np.int8)])
+            self.deleted = np.concatenate([self.deleted, np.zeros(grow, dtype=bool)])
+            self.neighbors0 = np.concatenate([self.neighbors0, np.full((grow, self.M0), -1, dtype=np.int32)])
+            self.upper_offsets = np.concatenate([self.upper_offsets, np.full(grow, -1, dtype=np.int64)])
+        if n_upper > len(self.upper_neighbors):
+            grow = max(n_upper, 2 * len(self.upper_neighbors), 256) - len(self.upper_neighbors)
+            self.upper_neighbors = np.concatenate([self.upper_neighbors, np.full((grow, self.M), -1, dtype=np.int32)])
+
+    def _neighbors(self, node: int, level: int) -> np.ndarray:
+        row = self.neighbors0[node] if level == 0 else self.upper_neighbors[self.upper_offsets[node] + level - 1]
+        return row[row >= 0]
+
+    def _set_neighbors(self, node: int, level: int, neighbors: np.ndarray):
+        row = self.neighbors0[node] if level == 0 else self.upper_neighbors[self.upper_offsets[node] + level - 1]
+        # 一次整行写入，并发的检索不会读到清空了一半的邻居表
+        padded = np.full(len(row), -1, dtype=np.int32)
+        padded[:len(neighbors)] = neighbors
+        row[:] = padded
+
+    def _search_layer(self, query: np.ndarray, entry_points: List[int], ef: int, level: int) -> List[Tuple[float, int]]:
+        '''
+        在一层中做best-first搜索，返回按相似度从高到低排列的(相似度, 节点)，最多ef个
+        '''
+        visited = set(entry_points)
+        sims = self.vectors[entry_points] @ query
+        candidates = [(-s, p) for s, p in zip(sims.tolist(), entry_points)]
+        heapq.heapify(candidates)
+        results = [(s, p) for s, p in zip(sims.tolist(), entry_points)]
+        heapq.heapify(results)
+        while len(results) > ef:
+            heapq.heappop(results)
+        while candidates:
+            neg_sim, node = heapq.heappop(candidates)
+            if -neg_sim < results[0][0] and len(results) >= ef:
+                break
+            neighbors = [p for p in self._neighbors(node, level).tolist() if p not in visited]
+            if not neighbors:
+                continue
+            visited.update(neighbors)
+            for s, p in zip((self.vectors[neighbors] @ query).tolist(), neighbors):
+                if len(results) < ef or s > results[0][0]:
+                    heapq.heappush(candidates, (-s, p))
+                    heapq.heappush(results, (s, p))
+                    if len(results) > ef:
+                        heapq.heappop(results)
+        return sorted(results, reverse=True)
+
+    def _select_neighbors(self, vector: np.ndarray, candidates: List[Tuple[float, int]], m: int) -> np.ndarray:
+        '''
+        启发式选邻居：候选按相似度从高到低，仅当它与问题的相似度高于与已选邻居的相似度时保留，使邻居分布在不同方向；
+        不足m个时用被跳过的候选补齐
+        '''
+        selected, skipped = [], []
+        for sim, node in candidates:
+            if len(selected) >= m:
+                break
+            if selected and (self.vectors[selected] @ self.vectors[node]).max() > sim:
+                skipped.append(node)
+            else:
+                selected.append(node)
+        selected += skipped[:m - len(selected)]
+        return np.asarray(selected, dtype=np.int32)
+
+    def _insert(self, node: int):
+        vector = self.vectors[node]
+        level = int(self.levels[node])
+        if self.entry_point < 0:
+            self.entry_point, self.max_level = node, level
+            return
+        entry = [self.entry_point]
+        for lv in range(self.max_level, level, -1):
+            entry = [self._search_layer(vector, entry, 1, lv)[0][1]]
+        for lv in range(min(level, self.max_level), -1, -1):
+            candidates = self._search_layer(vector, entry, self.ef_construction, lv)
+            max_neighbors = self.M0 if lv == 0 else self.M
+            neighbors = self._select_neighbors(vector, candidates, self.M)
+            self._set_neighbors(node, lv, neighbors)
+            for other in neighbors.tolist():
+                links = self._neighbors(other, lv)
+                if len(links) < max_neighbors:
+                    self._set_neighbors(other, lv, np.append(links, node))
+                    continue
+                links = np.append(links, node)
+                sims = self.vectors[links] @ self.vectors[other]
+                order = np.argsort(-sims)
+                self._set_neighbors(other, lv, self._select_neighbors(
+                    self.vectors[other], list(zip(sims[order].tolist(), links[order].tolist())), max_neighbors))
+            entry = [p for _, p in candidates]
+        if level > self.max_level:
+            self.entry_point, self.max_level = node, level
+
+    def add(self, ids: np.ndarray, vectors: np.ndarray):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if self.dim is None or self.n == 0:
+            self.dim = vectors.shape[1]
+            self._reset(self.dim)
+        self._ensure_writable()
+        levels = np.minimum((-np.log(1 - self._rng.random(len(vectors))) * self._level_mult).astype(np.int64), 127)
+        self._reserve(self.n + len(vectors), self.n_upper + int(levels.sum()))
+        for vector, doc_id, level in zip(vectors, np.asarray(ids, dtype=np.int64), levels.tolist()):
+            node = self.n
+            self.vectors[node] = vector
+            self.ids[node] = doc_id
+            self.levels[node] = level
+            if level:
+                self.upper_offsets[node] = self.n_upper
+                self.n_upper += level
+            self.n += 1
+            self._insert(node)
+
+    def delete(self, ids: np.ndarray) -> int:
+        mask = np.isin(self.ids[:self.n], np.asarray(ids, dtype=np.int64)) & ~self.deleted[:self.n]
+        deleted = int(mask.sum())
+        if deleted:
+            self._ensure_writable()
+            self.deleted[:self.n] |= mask
+            self.n_deleted += deleted
+        return deleted
+
+    def compacted(self) -> Optional["HNSWVectorStore"]:
+        '''
+        墓碑占比超过compact_ratio时，把其余向量按原顺序插入一个新索引并返回，否则返回None；
+        当前索引不做修改，重建期间的检索不受影响
+        '''
+        if not self.n_deleted or self.n_deleted <= self.compact_ratio * self.n:
+            return None
+        alive = np.flatnonzero(~self.deleted[:self.n])
+        fresh = HNSWVectorStore(self.path, self.dim, self.M, self.ef_construction, self.ef_search, self.compact_ratio)
+        if len(alive):
+            fresh.add(np.array(self.ids[alive]), np.array(self.vectors[alive]))
+        return fresh
+
+    def search(self, queries: np.ndarray, top_k: int, ef: int = None) -> Tuple[np.ndarray, np.ndarray]:
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        k = min(top_k, self.size)
+        out_scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        out_ids = np.full((len(queries), k), -1, dtype=np.int64)
+        if k <= 0:
+            return out_scores, out_ids
+        # 已删除节点会占用候选位置，按墓碑比例放大候选集
+        ef = max(ef or self.ef_search, k)
+        ef = int(ef * self.n / max(self.size, 1)) + 1 if self.n_deleted else ef
+        # 插入时先更新入口点再更新最高层，先读最高层可保证入口点至少有这么多层
+        max_level = self.max_level
+        entry_point = self.entry_point
+        if entry_point < 0:
+            return out_scores[:, :0], out_ids[:, :0]
+        for qi, query in enumerate(queries):
+            entry = [entry_point]
+            for lv in range(max_level, 0, -1):
+                entry = [self._search_layer(query, entry, 1, lv)[0][1]]
+            hits = [(s, p) for s, p in self._search_layer(query, entry, ef, 0) if not self.deleted[p]][:k]
+            out_scores[qi, :len(hits)] = [s for s, _ in hits]
+            out_ids[qi, :len(hits)] = self.ids[[p for _, p in hits]]
+        return out_scores, out_ids
+
+    def get_vectors(self, ids: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        rows = np.flatnonzero(np.isin(self.ids[:self.n], ids) & ~self.deleted[:self.n])
+        return np.asarray(self.ids[rows]), np.asarray(self.vectors[rows])
+
+    def save(self):
+        os.makedirs(self.path, exist_ok=True)
+        save_arrays(self.file_path, {
+            "vectors": self.vectors[:self.n],
+            "ids": self.ids[:self.n],
+            "levels": self.levels[:self.n],
+            "deleted": self.deleted[:self.n],
+            "neighbors0": self.neighbors0[:self.n],
+            "upper_offsets": self.upper_offsets[:self.n],
+            "upper_neighbors": self.upper_neighbors[:self.n_upper],
+        }, meta={"vs_type": self.vs_type, "dim": self.dim, "M": self.M, "entry_point": self.entry_point,
+                 "max_level": self.max_level, "n_deleted": self.n_deleted})
+
+    def load(self) -> bool:
+        if not os.path.exists(self.file_path):
+            return False
+        arrays, meta = load_arrays(self.file_path, mmap=True)
+        self.M, self.M0 = meta["M"], 2 * meta["M"]
+        self._level_mult = 1 / math.log(self.M)
+        self.dim = meta["dim"]
+        for name, array in arrays.items():
+            setattr(self, name, array)
+        self.n = len(self.ids)
+        self.n_upper = len(self.upper_neighbors)
+        self.entry_point, self.max_level = meta["entry_point"], meta["max_level"]
+        self.n_deleted = meta["n_deleted"]
+        self._writable = False
+        return True
@@ -0,0 +1,295 @@
+import os
+from typing import Tuple, Optional, List
+
+import numpy as np
+
+from configs.kb import IVFPQ
+from knowledge_base.vector_store.base import VectorStore, topk_inner_product, kmeans, save_arrays, load_arrays
+
+
+def _num_subquantizers(dim: int, m: int) -> int:
+    while dim % m:
+        m -= 1
+    return m
+
+
+class IVFPQVectorStore(VectorStore):
+    """
+    倒排 + 乘积量化(IVF-PQ)压缩索引
+    粗聚类中心把向量分到nlist个倒排列表，向量相对聚类中心的残差按m个子空间各用256个码字量化，每个向量只存m字节编码。
+    检索时只探查与问题最相近的nprobe个列表；内积 q·(c + r) = q·c + Σ q_j·codebook_j[code_j]，
+    后一项对每个问题查一次 (m, 256) 的查找表即可，与所在列表无关。
+    PQ打分的前 top_k * rerank_factor 个候选再用原始向量算精确内积重排，召回不受量化误差限制；
+    原始向量随索引保存，加载时以memmap只读映射，检索只读取重排用到的行。
+    向量数不足 min_train_size 时尚未训练，以原始向量暴力检索(删除时直接去掉)；此后行数(含已删除)每增长到上次训练时的
+    retrain_factor 倍就用全部向量重新训练，倒排列表数随数据量增加，已删除的行同时去掉。
+    每个倒排列表为(编码, 行号, 数量)，新编码写入预留的容量后替换该列表的元组；
+    检索读取写入完成后发布的快照，不受并发写入影响。
+    """
+    vs_type = "ivfpq"
+
+    def __init__(self, path: str, dim: int = None, nlist: int = IVFPQ["nlist"], m: int = IVFPQ["m"],
+                 nprobe: int = IVFPQ["nprobe"], min_train_size: int = IVFPQ["min_train_size"],
+                 train_size: int = IVFPQ["train_size"], kmeans_iters: int = IVFPQ["kmeans_iters"],
+                 retrain_factor: float = IVFPQ["retrain_factor"], rerank_factor: int = IVFPQ["rerank_factor"]):
+        super().__init__(path, dim)
+        self.nlist = nlist
+        self.m = m
+        self.nprobe = nprobe
+        self.min_train_size = min_train_size
+        self.train_size = train_size
+        self.kmeans_iters = kmeans_iters
+        self.retrain_factor = retrain_factor
+        self.rerank_factor = rerank_factor
+        self._reset(dim or 0)
+
+    def _reset(self, dim: int):
+        # 按写入顺序存放的原始向量及id，删除只打墓碑标记，重新训练时去掉
+        self.n = 0
+        self.vectors = np.zeros((0, dim), dtype=np.float32)
+        self.ids = np.zeros(0, dtype=np.int64)
+        self.deleted = np.zeros(0, dtype=bool)
+        self.n_deleted = 0
+        # 每行所在的倒排列表，删除时用来找到需要更新的列表
+        self.assign = np.zeros(0, dtype=np.int32)
+        # 训练结果：粗聚类中心 (nlist, dim)，码本 (m, 256, dsub)，各倒排列表 (编码, 行号, 数量)
+        self.centroids: Optional[np.ndarray] = None
+        self.codebooks: Optional[np.ndarray] = None
+        self.lists: Optional[List[Tuple[np.ndarray, np.ndarray, int]]] = None
+        self.trained_size = 0
+        self._writable = True
+        self._publish()
+
+    def _publish(self):
+        '''
+        发布检索使用的快照：写入只修改快照行数之外的行和列表预留的容量，完成后整体替换快照
+        '''
+        trained = None if self.lists is None else (self.centroids, self.codebooks, list(self.lists))
+        self._snapshot = (self.n, self.vectors, self.ids, self.deleted, trained)
+
+    @property
+    def trained(self) -> bool:
+        return self.centroids is not None
+
+    @property
+    def size(self) -> int:
+        return self.n - self.n_deleted
+
+    @property
+    def nbytes(self) -> int:
+        '''
+        检索时常驻内存的大小：编码、行号、id及训练结果，不含memmap映射、只读取重排行的原始向量
+        '''
+        total = self.ids[:self.n].nbytes + self.deleted[:self.n].nbytes
+        if self.trained:
+            total += self.centroids.nbytes + self.codebooks.nbytes
+            total += sum(codes[:count].nbytes + rows[:count].nbytes for codes, rows, count in self.lists)
+        else:
+            total += self.vectors[:self.n].nbytes
+        return total
+
+    @property
+    def file_path(self) -> str:
+        return os.path.join(self.path, "index.ivfpq")
+
+    def _ensure_writable(self):
+        '''
+        memmap加载的数组只读，写入前复制到内存；倒排列表追加时总会扩容复制，不需要处理
+        '''
+        if not self._writable:
+            self.vectors, self.ids, self.deleted = np.array(self.vectors), np.array(self.ids), np.array(self.deleted)
+            self._writable = True
+
+    def _reserve(self, n: int):
+        '''
+        按倍数扩容，避免每次写入都复制数组
+        '''
+        if n > len(self.ids):
+            grow = max(n, 2 * len(self.ids), 1024) - len(self.ids)
+            self.vectors = np.concatenate([self.vectors, np.zeros((grow, self.dim), dtype=np.float32)])
+            self.ids = np.concatenate([self.ids, np.full(grow, -1, dtype=np.int64)])
+            self.deleted = np.concatenate([self.deleted, np.zeros(grow, dtype=bool)])
+            self.assign = np.concatenate([self.assign, np.full(grow, -1, dtype=np.int32)])
+
+    def _train(self):
+        '''
+        用全部未删除的向量训练聚类中心和码本，倒排列表数取 min(nlist, 训练样本数 // 39)；
+        重新编码全部向量并重建倒排列表，已删除的行同时去掉
+        '''
+        alive = np.flatnonzero(~self.deleted[:self.n])
+        vectors, ids = np.array(self.vectors[alive]), np.array(self.ids[alive])
+        rng = np.random.default_rng(0)
+        sample = vectors if len(vectors) <= self.train_size else vectors[rng.choice(len(vectors), self.train_size,
+                                                                                     replace=False)]
+        nlist = max(1, min(self.nlist, len(sample) // 39))
+        self.centroids, sample_assign = kmeans(sample, nlist, self.kmeans_iters)
+        residuals = sample - self.centroids[sample_assign]
+        m = _num_subquantizers(self.dim, self.m)
+        dsub = self.dim // m
+        self.codebooks = np.stack([
+            kmeans(residuals[:, j * dsub:(j + 1) * dsub], 256, self.kmeans_iters, seed=j)[0] for j in range(m)
+        ])
+        self.m = m
+        self.n, self.n_deleted, self.trained_size = len(ids), 0, len(ids)
+        self.vectors, self.ids = vectors, ids
+        self.deleted = np.zeros(len(ids), dtype=bool)
+        self.assign = np.full(len(ids), -1, dtype=np.int32)
+        self.lists = [(np.zeros((0, m), dtype=np.uint8), np.zeros(0, dtype=np.int64), 0)
+                      for _ in range(len(self.centroids))]
+        self._append_codes(np.arange(len(ids)), vectors)
+
+    def _assign(self, vectors: np.ndarray) -> np.ndarray:
+        half_norms = 0.5 * np.einsum("ij,ij->i", self.centroids, self.centroids)
+        return np.argmax(vectors @ self.centroids.T - half_norms, axis=1)
+
+    def encode(self, vectors: np.ndarray, assign: np.ndarray) -> np.ndarray:
+        residuals = vectors - self.centroids[assign]
+        m, _, dsub = self.codebooks.shape
+        codes = np.empty((len(vectors), m), dtype=np.uint8)
+        for j in range(m):
+            sub = residuals[:, j * dsub:(j + 1) * dsub]
+            book = self.codebooks[j]
+            codes[:, j] = np.argmax(sub @ book.T - 0.5 * np.einsum("ij,ij->i", book, book), axis=1)
+        return codes
+
+    def _append_codes(self, rows: np.ndarray, vectors: np.ndarray):
+        '''
+        编码并追加到各自的倒排列表末尾，容量不足时按倍数扩容；只复制写入涉及的列表
+        '''
+        assign = self._assign(vectors)
+        codes = self.encode(vectors, assign)
+        self.assign[rows] = assign
+        order = np.argsort(assign, kind="stable")
+        touched, starts = np.unique(assign[order], return_index=True)
+        for c, part in zip(touched.tolist(), np.split(order, starts[1:])):
+            list_codes, list_rows, count = self.lists[c]
+            end = count + len(part)
+            if end > len(list_rows):
+                grow = max(end, 2 * len(list_rows), 16) - count
+                list_codes = np.concatenate([list_codes[:count], np.zeros((grow, self.m), dtype=np.uint8)])
+                list_rows = np.concatenate([list_rows[:count], np.full(grow, -1, dtype=np.int64)])
+            list_codes[count:end] = codes[part]
+            list_rows[count:end] = rows[part]
+            self.lists[c] = (list_codes, list_rows, end)
+
+    def add(self, ids: np.ndarray, vectors: np.ndarray):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        ids = np.asarray(ids, dtype=np.int64)
+        if self.dim is None or self.n == 0:
+            self.dim = vectors.shape[1]
+            self._reset(self.dim)
+        self._ensure_writable()
+        self._reserve(self.n + len(ids))
+        rows = np.arange(self.n, self.n + len(ids))
+        self.vectors[rows] = vectors
+        self.ids[rows] = ids
+        self.n += len(ids)
+        if not self.trained:
+            if self.size >= self.min_train_size:
+                self._train()
+        elif self.n >= self.retrain_factor * self.trained_size:
+            self._train()
+        else:
+            self._append_codes(rows, vectors)
+        self._publish()
+
+    def delete(self, ids: np.ndarray) -> int:
+        rows = np.flatnonzero(np.isin(self.ids[:self.n], np.asarray(ids, dtype=np.int64)) & ~self.deleted[:self.n])
+        if not len(rows):
+            return 0
+        self._ensure_writable()
+        if not self.trained:
+            # 训练前的向量不多，直接去掉
+            keep = np.ones(self.n, dtype=bool)
+            keep[rows] = False
+            self.vectors, self.ids = self.vectors[:self.n][keep], self.ids[:self.n][keep]
+            self.deleted, self.assign = self.deleted[:self.n][keep], self.assign[:self.n][keep]
+            self.n = len(self.ids)
+            self._publish()
+            return len(rows)
+        self.deleted[rows] = True
+        self.n_deleted += len(rows)
+        for c in np.unique(self.assign[rows]).tolist():
+            list_codes, list_rows, count = self.lists[c]
+            keep = ~self.deleted[list_rows[:count]]
+            self.lists[c] = (list_codes[:count][keep], list_rows[:count][keep], int(keep.sum()))
+        self._publish()
+        return len(rows)
+
+    def search(self, queries: np.ndarray, top_k: int, nprobe: int = None,
+               rerank_factor: int = None) -> Tuple[np.ndarray, np.ndarray]:
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        n, vectors, ids, deleted, trained = self._snapshot
+        if trained is None:
+            scores, rows = topk_inner_product(queries, vectors[:n], top_k)
+            return scores, ids[rows]
+        centroids, codebooks, lists = trained
+        nprobe = min(nprobe or self.nprobe, len(centroids))
+        rerank_factor = self.rerank_factor if rerank_factor is None else rerank_factor
+        m, _, dsub = codebooks.shape
+        coarse = queries @ centroids.T
+        probes = np.argpartition(-coarse, nprobe - 1, axis=1)[:, :nprobe] if nprobe < coarse.shape[1] \
+            else np.broadcast_to(np.arange(coarse.shape[1]), coarse.shape)
+        # (查询数, m, 256)
+        luts = np.einsum("qjd,jcd->qjc", queries.reshape(len(queries), m, dsub), codebooks)
+        sub_index = np.arange(m)
+        k = min(top_k, sum(count for _, _, count in lists))
+        # 探查的列表中向量不足k个时以-inf补齐，id为-1
+        out_scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        out_ids = np.full((len(queries), k), -1, dtype=np.int64)
+        for qi in range(len(queries)):
+            probed = [lists[c] for c in probes[qi].tolist()]
+            counts = [count for _, _, count in probed]
+            rows = np.concatenate([list_rows[:count] for _, list_rows, count in probed])
+            codes = np.concatenate([list_codes[:count] for list_codes, _, count in probed])
+            scores = np.repeat(coarse[qi, probes[qi]], counts) + luts[qi][sub_index, codes].sum(axis=1)
+            n_candidates = min(len(scores), max(k, k * rerank_factor))
+            top = np.argpartition(-scores, n_candidates - 1)[:n_candidates] if 0 < n_candidates < len(scores) \
+                else np.arange(n_candidates)
+            rows, scores = rows[top], scores[top]
+            if rerank_factor:
+                scores = np.asarray(vectors[rows]) @ queries[qi]
+            top = np.argsort(-scores)[:k]
+            out_scores[qi, :len(top)] = scores[top]
+            out_ids[qi, :len(top)] = ids[rows[top]]
+        return out_scores, out_ids
+
+    def get_vectors(self, ids: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        n, vectors, all_ids, deleted, _ = self._snapshot
+        rows = np.flatnonzero(np.isin(all_ids[:n], ids) & ~deleted[:n])
+        return np.asarray(all_ids[rows]), np.asarray(vectors[rows])
+
+    def save(self):
+        os.makedirs(self.path, exist_ok=True)
+        arrays = {"vectors": self.vectors[:self.n], "ids": self.ids[:self.n], "deleted": self.deleted[:self.n]}
+        if self.trained:
+            arrays.update({
+                "centroids": self.centroids,
+                "codebooks": self.codebooks,
+                "codes": np.concatenate([codes[:count] for codes, _, count in self.lists]),
+                "rows": np.concatenate([rows[:count] for _, rows, count in self.lists]),
+                "offsets": np.concatenate([[0], np.cumsum([count for _, _, count in self.lists])]).astype(np.int64),
+            })
+        save_arrays(self.file_path, arrays, meta={"vs_type": self.vs_type, "dim": self.dim, "m": self.m,
+                                                  "trained": self.trained, "trained_size": self.trained_size,
+                                                  "n_deleted": self.n_deleted})
+
+    def load(self) -> bool:
+        if not os.path.exists(self.file_path):
+            return False
+        arrays, meta = load_arrays(self.file_path, mmap=True)
+        self.dim, self.m = meta["dim"], meta["m"]
+        self.vectors, self.ids, self.deleted = arrays["vectors"], arrays["ids"], arrays["deleted"]
+        self.n, self.n_deleted, self.trained_size = len(self.ids), meta["n_deleted"], meta["trained_size"]
+        self.assign = np.full(self.n, -1, dtype=np.int32)
+        if meta["trained"]:
+            self.centroids, self.codebooks = np.array(arrays["centroids"]), np.array(arrays["codebooks"])
+            offsets, codes, rows = arrays["offsets"], arrays["codes"], arrays["rows"]
+            self.lists = [(codes[start:end], rows[start:end], int(end - start))
+                          for start, end in zip(offsets[:-1].tolist(), offsets[1:].tolist())]
+            self.assign[rows] = np.repeat(np.arange(len(offsets) - 1, dtype=np.int32), np.diff(offsets))
+        else:
+            self.centroids = self.codebooks = self.lists = None
+        self._writable = False
+        self._publish()
+        return True
@@ -0,0 +1,261 @@
+import json
+import os
+import threading
+import uuid
+from typing import Tuple, List, Dict, Optional
+
+import numpy as np
+
+from configs.kb import SEGMENT_STORE
+from knowledge_base.vector_store.base import VectorStore, topk_inner_product, save_arrays, load_arrays, \
+    atomic_save_npy, atomic_save_json
+
+
+class _Segment:
+    """
+    一个只读段：vectors/ids 为memmap，dead 为段内已删除行的标记
+    """
+
+    def __init__(self, name: str, vectors: np.ndarray, ids: np.ndarray):
+        self.name = name
+        self.vectors = vectors
+        self.ids = ids
+        self.dead = np.zeros(len(ids), dtype=bool)
+
+    @property
+    def size(self) -> int:
+        return len(self.ids)
+
+    @property
+    def n_dead(self) -> int:
+        return int(self.dead.sum())
+
+
+class SegmentVectorStore(VectorStore):
+    """
+    分段内存映射向量库
+    新增向量先在内存中缓冲，保存时写成一个只追加的段文件(头 + 向量 + id)；各进程以numpy.memmap只读打开段文件，
+    多个uvicorn worker共享页缓存，启动时无需把向量读入内存。
+    manifest.json 记录当前有效的段及墓碑文件，先写新文件再用 os.replace 原子替换 manifest。
+    删除只记墓碑；段过多或段内删除过多时在后台线程合并重写，只应由写入方(入库进程)触发，
+    写入进程退出前需调用 wait_background() 等待合并完成。
+    """
+    vs_type = "segment"
+
+    def __init__(self, path: str, dim: int = None, max_segments: int = SEGMENT_STORE["max_segments"],
+                 merge_factor: int = SEGMENT_STORE["merge_factor"],
+                 max_deleted_ratio: float = SEGMENT_STORE["max_deleted_ratio"]):
+        super().__init__(path, dim)
+        self.max_segments = max_segments
+        self.merge_factor = merge_factor
+        self.max_deleted_ratio = max_deleted_ratio
+        self.segments: List[_Segment] = []
+        self.tombstones = np.zeros(0, dtype=np.int64)
+        self._buffer_vectors: List[np.ndarray] = []
+        self._buffer_ids: List[np.ndarray] = []
+        self._lock = threading.RLock()
+        self._merge_thread: Optional[threading.Thread] = None
+
+    @property
+    def manifest_path(self) -> str:
+        return os.path.join(self.path, "manifest.json")
+
+    @property
+    def size(self) -> int:
+        return sum(s.size - s.n_dead for s in self.segments) + sum(len(i) for i in self._buffer_ids)
+
+    def _open_segment(self, name: str) -> _Segment:
+        arrays, meta = load_arrays(os.path.join(self.path, name), mmap=True)
+        self.dim = meta["dim"]
+        segment = _Segment(name, arrays["vectors"], arrays["ids"])
+        segment.dead = np.isin(segment.ids, self.tombstones)
+        return segment
+
+    def _write_segment(self, vectors: np.ndarray, ids: np.ndarray) -> _Segment:
+        name = f"seg_{uuid.uuid4().hex}.seg"
+        save_arrays(os.path.join(self.path, name), {"vectors": vectors, "ids": ids},
+                    meta={"vs_type": self.vs_type, "dim": self.dim})
+        return self._open_segment(name)
+
+    def _write_manifest(self):
+        tombstone_file = None
+        if len(self.tombstones):
+            tombstone_file = f"tombstones_{uuid.uuid4().hex}.npy"
+            atomic_save_npy(os.path.join(self.path, tombstone_file), self.tombstones)
+        atomic_save_json(self.manifest_path, {"vs_type": self.vs_type, "dim": self.dim,
+                                              "segments": [s.name for s in self.segments],
+                                              "tombstones": tombstone_file})
+        self._remove_unreferenced()
+
+    def _remove_unreferenced(self):
+        '''
+        删除manifest不再引用的段及墓碑文件；其它进程已映射的旧文件在其重新加载前仍可正常读取
+        '''
+        with open(self.manifest_path, encoding="utf-8") as f:
+            manifest = json.load(f)
+        referenced = set(manifest["segments"]) | {manifest["tombstones"]}
+        for name in os.listdir(self.path):
+            if name.startswith(("seg_", "tombstones_")) and name not in referenced and not name.endswith(".tmp"):
+                os.remove(os.path.join(self.path, name))
+
+    def add(self, ids: np.ndarray, vectors: np.ndarray):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        with self._lock:
+            if self.dim is None or self.size == 0:
+                self.dim = vectors.shape[1]
+            self._buffer_vectors.append(vectors)
+            self._buffer_ids.append(np.asarray(ids, dtype=np.int64))
+
+    def delete(self, ids: np.ndarray) -> int:
+        ids = np.asarray(ids, dtype=np.int64)
+        deleted = 0
+        with self._lock:
+            for i, buffer_ids in enumerate(self._buffer_ids):
+                keep = ~np.isin(buffer_ids, ids)
+                if not keep.all():
+                    deleted += int(len(keep) - keep.sum())
+                    self._buffer_ids[i], self._buffer_vectors[i] = buffer_ids[keep], self._buffer_vectors[i][keep]
+            new_dead = []
+            for segment in self.segments:
+                mask = np.isin(segment.ids, ids) & ~segment.dead
+                if mask.any():
+                    segment.dead |= mask
+                    deleted += int(mask.sum())
+                    new_dead.append(segment.ids[mask])
+            if new_dead:
+                self.tombstones = np.union1d(self.tombstones, np.concatenate(new_dead))
+        return deleted
+
+    def search(self, queries: np.ndarray, top_k: int) -> Tuple[np.ndarray, np.ndarray]:
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        with self._lock:
+            parts = [(s.vectors, s.ids, s.dead, s.n_dead) for s in self.segments]
+            if self._buffer_ids:
+                ids = np.concatenate(self._buffer_ids)
+                parts.append((np.concatenate(self._buffer_vectors), ids, np.zeros(len(ids), dtype=bool), 0))
+        all_scores, all_ids = [], []
+        for vectors, ids, dead, n_dead in parts:
+            if not len(ids):
+                continue
+            # 多取段内已删除的数量，过滤后仍能保证top_k
+            scores, rows = topk_inner_product(queries, vectors, top_k + n_dead)
+            scores = np.where(dead[rows], -np.inf, scores)
+            all_scores.append(scores)
+            all_ids.append(ids[rows])
+        k = min(top_k, self.size)
+        if not all_scores or k <= 0:
+            return np.zeros((len(queries), 0), dtype=np.float32), np.zeros((len(queries), 0), dtype=np.int64)
+        scores, ids = np.concatenate(all_scores, axis=1), np.concatenate(all_ids, axis=1)
+        top = np.argsort(-scores, axis=1)[:, :k]
+        return np.take_along_axis(scores, top, axis=1), np.take_along_axis(ids, top, axis=1)
+
+    def get_vectors(self, ids: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        with self._lock:
+            parts = [(s.vectors, s.ids, s.dead) for s in self.segments]
+            if self._buffer_ids:
+                buffer_ids = np.concatenate(self._buffer_ids)
+                parts.append((np.concatenate(self._buffer_vectors), buffer_ids, np.zeros(len(buffer_ids), dtype=bool)))
+        found_ids, found_vectors = [np.zeros(0, dtype=np.int64)], [np.zeros((0, self.dim or 0), dtype=np.float32)]
+        for vectors, segment_ids, dead in parts:
+            rows = np.flatnonzero(np.isin(segment_ids, ids) & ~dead)
+            if len(rows):
+                found_ids.append(np.asarray(segment_ids[rows]))
+                found_vectors.append(np.asarray(vectors[rows]))
+        return np.concatenate(found_ids), np.concatenate(found_vectors)
+
+    def save(self):
+        with self._lock:
+            os.makedirs(self.path, exist_ok=True)
+            if self._buffer_ids:
+                ids = np.concatenate(self._buffer_ids)
+                vectors = np.concatenate(self._buffer_vectors)
+                if len(ids):
+                    self.segments.append(self._write_segment(vectors, ids))
+                self._buffer_ids, self._buffer_vectors = [], []
+            self._write_manifest()
+        self.maybe_merge()
+
+    def load(self) -> bool:
+        if not os.path.exists(self.manifest_path):
+            return False
+        with open(self.manifest_path, encoding="utf-8") as f:
+            manifest = json.load(f)
+        with self._lock:
+            self.dim = manifest["dim"]
+            self.tombstones = np.load(os.path.join(self.path, manifest["tombstones"])) \
+                if manifest["tombstones"] else np.zeros(0, dtype=np.int64)
+            opened = {s.name: s for s in self.segments}
+            segments = []
+            for name in manifest["segments"]:
+                segment = opened.get(name) or self._open_segment(name)
+                segment.dead = np.isin(segment.ids, self.tombstones)
+                segments.append(segment)
+            self.segments = segments
+            self._buffer_ids, self._buffer_vectors = [], []
+        return True
+
+    def _merge_candidates(self) -> List[_Segment]:
+        with self._lock:
+            dirty = [s for s in self.segments if s.size and s.n_dead > self.max_deleted_ratio * s.size]
+            if dirty:
+                return dirty
+            if len(self.segments) > self.max_segments:
+                return sorted(self.segments, key=lambda s: s.size)[:self.merge_factor]
+        return []
+
+    def merge(self, segments: List[_Segment]):
+        '''
+        把若干段中未删除的向量写成一个新段，再原子替换manifest
+        '''
+        if not segments:
+            return
+        # 段文件只读，合并时不持锁，期间新增的段和删除在替换时保留
+        alive = [~s.dead.copy() for s in segments]
+        vectors = np.concatenate([s.vectors[mask] for s, mask in zip(segments, alive)])
+        ids = np.concatenate([s.ids[mask] for s, mask in zip(segments, alive)])
+        name = f"seg_{uuid.uuid4().hex}.seg"
+        path = os.path.join(self.path, name)
+        if len(ids):
+            # 先写成临时文件：合并期间的save()清理未引用文件时会跳过.tmp，持锁改名后再写入manifest
+            save_arrays(f"{path}.tmp", {"vectors": vectors, "ids": ids},
+                        meta={"vs_type": self.vs_type, "dim": self.dim})
+        with self._lock:
+            merged = None
+            if len(ids):
+                os.replace(f"{path}.tmp", path)
+                merged = self._open_segment(name)
+            names = {s.name for s in segments}
+            self.segments = [s for s in self.segments if s.name not in names] + ([merged] if merged else [])
+            # 合并期间新产生的删除
+            if merged is not None:
+                merged.dead = np.isin(merged.ids, self.tombstones)
+            # 墓碑只需保留仍在段中的id
+            present = np.concatenate([s.ids[s.dead] for s in self.segments]) if self.segments else np.zeros(0)
+            self.tombstones = np.intersect1d(self.tombstones, present)
+            self._write_manifest()
+
+    def maybe_merge(self, background: bool = True):
+        if self._merge_thread is not None and self._merge_thread.is_alive():
+            return
+        candidates = self._merge_candidates()
+        if not candidates:
+            return
+        if not background:
+            self.merge(candidates)
+            return
+
+        def run():
+            self.merge(candidates)
+            # 一次合并后可能仍超出段数限制
+            self.maybe_merge(background=False)
+
+        self._merge_thread = threading.Thread(target=run, name="segment-merge", daemon=True)
+        self._merge_thread.start()
+
+    def wait_background(self):
+        thread = self._merge_thread
+        if thread is not None:
+            thread.join()
+
+    def stats(self) -> Dict[str, int]:
+        return {"segments": len(self.segments), "size": self.size, "tombstones": len(self.tombstones)}
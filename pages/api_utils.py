@@ -5,7 +5,8 @@ from typing import *
 from loguru import logger
 from pydantic import BaseModel, Field
 
-from configs.basic import PROJECT_ROOT, LLM_MODELS, HTTPX_DEFAULT_TIMEOUT
+from configs.basic import PROJECT_ROOT, LLM_MODELS, HTTPX_DEFAULT_TIMEOUT, FAIR_SCHEDULING
+from configs.kb import VECTOR_SEARCH_TOP_K, SCORE_THRESHOLD
 from configs.fastchat import get_api_server_addr
 # 此处导入的配置为发起请求（如WEBUI）机器上的配置，主要用于为前端设置默认值。分布式部署时可以与服务器上的不同
 from utils.http import set_httpx_config
@@ -60,10 +61,13 @@ class ApiRequest:
             base_url: str = get_api_server_addr(),
             timeout: float = HTTPX_DEFAULT_TIMEOUT,
             use_async: bool = False,
+            api_key: str = FAIR_SCHEDULING["webui_api_key"],
     ):
         self.base_url = base_url
         self.timeout = timeout
         self.use_async = use_async
+        # 优先级由服务端按API Key配置(tenant_priorities)决定，WebUI的Key配置为interactive时优先于批处理请求
+        self.headers = {FAIR_SCHEDULING["tenant_header"]: api_key} if api_key else {}
         self._client = None
 
     @property
@@ -79,9 +83,9 @@ class ApiRequest:
     def _create_client(self):
         '''根据同步/异步模式创建对应的HTTP客户端'''
         if self.use_async:
-            return httpx.AsyncClient(base_url=self.base_url, timeout=self.timeout)
+            return httpx.AsyncClient(base_url=self.base_url, timeout=self.timeout, headers=self.headers)
         else:
-            return httpx.Client(base_url=self.base_url, timeout=self.timeout)
+            return httpx.Client(base_url=self.base_url, timeout=self.timeout, headers=self.headers)
 
     def close(self):
         '''关闭HTTP客户端释放资源'''
@@ -109,7 +113,8 @@ class ApiRequest:
         try:
             if stream:
                 # 使用httpx.stream进行流式请求
-                return httpx.stream(method, f"{self.base_url}{url}", timeout=self.timeout, **kwargs)
+                return httpx.stream(method, f"{self.base_url}{url}", timeout=self.timeout, headers=self.headers,
+                                    **kwargs)
             else:
                 # 普通请求
                 response = self.client.request(method, url, **kwargs)
@@ -272,6 +277,112 @@ class ApiRequest:
             response = self.post("/chat/chat", json=data)
             return response.json()
 
+    def knowledge_base_chat(
+            self,
+            query: str,
+            knowledge_base_name: str,
+            top_k: int = VECTOR_SEARCH_TOP_K,
+            score_threshold: float = SCORE_THRESHOLD,
+            conversation_id: str = None,
+            history: List[Dict] = None,
+            stream: bool = True,
+            model: str = None,
+            temperature: float = None,
+            max_tokens: int = None,
+            prompt_name: str = "default",
+            **kwargs,
+    ):
+        '''
+        知识库对话接口调用，最后一帧为匹配到的文档{"docs": [...]}
+        '''
+        if model is None and LLM_MODELS:
+            model = LLM_MODELS[0]
+        data = {
+            "query": query,
+            "knowledge_base_name": knowledge_base_name,
+            "top_k": top_k,
+            "score_threshold": score_threshold,
+            "conversation_id": conversation_id or "",
+            "history": history or [],
+            "stream": stream,
+            "model_name": model,
+            "prompt_name": prompt_name,
+            **kwargs
+        }
+        if temperature is not None:
+            data["temperature"] = temperature
+        if max_tokens is not None:
+            data["max_tokens"] = max_tokens
+
+        if stream:
+            response = self.post("/chat/knowledge_base_chat", json=data, stream=True)
+            return self.stream_to_generator(response, as_json=True)
+        else:
+            response = self.post("/chat/knowledge_base_chat", json=data)
+            return response.json()
+
+    def upload_temp_docs(self, files: List[Tuple[str, bytes]], prev_id: str = None) -> dict:
+        '''
+        上传文件用于文件对话，files: [(文件名, 文件内容), ...]，返回的data["id"]即file_chat_id
+        '''
+        response = self.post("/knowledge_base/upload_temp_docs",
+                             files=[("files", (name, content)) for name, content in files],
+                             data={"prev_id": prev_id} if prev_id else None)
+        return response.json()
+
+    def file_chat(
+            self,
+            query: str,
+            knowledge_id: str,
+            top_k: int = VECTOR_SEARCH_TOP_K,
+            score_threshold: float = SCORE_THRESHOLD,
+            conversation_id: str = None,
+            history: List[Dict] = None,
+            stream: bool = True,
+            model: str = None,
+            temperature: float = None,
+            max_tokens: int = None,
+            prompt_name: str = "default",
+    ):
+        '''
+        文件对话接口调用，knowledge_id为upload_temp_docs返回的file_chat_id，最后一帧为匹配到的文档{"docs": [...]}
+        '''
+        if model is None and LLM_MODELS:
+            model = LLM_MODELS[0]
+        data = {
+            "query": query,
+            "knowledge_id": knowledge_id,
+            "top_k": top_k,
+            "score_threshold": score_threshold,
+            "conversation_id": conversation_id or "",
+            "history": history or [],
+            "stream": stream,
+            "model_name": model,
+            "prompt_name": prompt_name,
+        }
+        if temperature is not None:
+            data["temperature"] = temperature
+        if max_tokens is not None:
+            data["max_tokens"] = max_tokens
+
+        if stream:
+            response = self.post("/chat/file_chat", json=data, stream=True)
+            return self.stream_to_generator(response, as_json=True)
+        else:
+            response = self.post("/chat/file_chat", json=data)
+            return response.json()
+
+    def list_knowledge_bases(self) -> List[str]:
+        '''
+        获取知识库列表
+        '''
+        response = self.get("/knowledge_base/list_knowledge_bases")
+        try:
+            return response.json().get("data", [])
+        except Exception as e:
+            self._log_error("解析知识库列表失败", e)
+            return []
+
     def list_running_models(
             self,
     ) -> Dict:
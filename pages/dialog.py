@@ -4,6 +4,7 @@ import uuid
 
 from streamlit_chatbox import ChatBox
 
+from configs.kb import VECTOR_SEARCH_TOP_K, SCORE_THRESHOLD
 from configs.model import TEMPERATURE, HISTORY_LEN
 from configs.prompt import PROMPT_TEMPLATES
 from pages.api_utils import ApiRequest
@@ -96,6 +97,22 @@ def dialogue_page(api: ApiRequest, is_lite: bool = False):
             key="prompt_template_select",
         )
         prompt_template_name = st.session_state.prompt_template_select
+        if dialogue_mode == "知识库问答":
+            kb_list = api.list_knowledge_bases()
+            selected_kb = st.selectbox("请选择知识库：", kb_list, key="selected_kb")
+            kb_top_k = st.number_input("匹配知识条数：", 1, 20, VECTOR_SEARCH_TOP_K)
+            score_threshold = st.slider("知识匹配分数阈值：", 0.0, 1.0, float(SCORE_THRESHOLD), 0.01)
+        elif dialogue_mode == "文件对话":
+            files = st.file_uploader("上传知识文件：", accept_multiple_files=True)
+            kb_top_k = st.number_input("匹配知识条数：", 1, 20, VECTOR_SEARCH_TOP_K)
+            score_threshold = st.slider("知识匹配分数阈值：", 0.0, 1.0, float(SCORE_THRESHOLD), 0.01)
+            if st.button("开始上传", disabled=not files):
+                r = api.upload_temp_docs([(f.name, f.getvalue()) for f in files],
+                                         prev_id=st.session_state["file_chat_id"])
+                if r.get("code") == 200:
+                    st.session_state["file_chat_id"] = r["data"]["id"]
+                st.toast(r.get("msg", ""))
+
         temperature = st.slider("Temperature：", 0.0, 2.0, TEMPERATURE, 0.05)
         history_len = st.number_input("历史对话轮数：", 0, 20, HISTORY_LEN)
 
@@ -108,11 +125,15 @@ def dialogue_page(api: ApiRequest, is_lite: bool = False):
         message_id = ""
         r = api.chat_chat(prompt,
                           history=[],
+                          history_len=history_len,
                           conversation_id=conversation_id,
                           model=llm_model,
                           prompt_name=prompt_template_name,
                           temperature=temperature)
         for t in r:
+            if t.get("code") and t.get("code") != 200:
+                text = t.get("msg", "")
+                break
             text += t.get("text", "")
             chat_box.update_msg(text)
             message_id = t.get("message_id", "")
@@ -121,7 +142,52 @@ def dialogue_page(api: ApiRequest, is_lite: bool = False):
             "message_id": message_id,
         }
         chat_box.update_msg(text, streaming=False, metadata=metadata)  # 更新最终的字符串，去除光标
-
-
-
-
+    elif dialogue_mode == "知识库问答" and prompt:
+        chat_box.ai_say(f"正在查询知识库 `{selected_kb}` ...")
+        text = ""
+        docs = []
+        message_id = ""
+        for d in api.knowledge_base_chat(prompt,
+                                         knowledge_base_name=selected_kb,
+                                         top_k=kb_top_k,
+                                         score_threshold=score_threshold,
+                                         conversation_id=conversation_id,
+                                         model=llm_model,
+                                         prompt_name=prompt_template_name,
+                                         temperature=temperature):
+            if "docs" in d:
+                docs = d["docs"]
+                continue
+            if d.get("code") and d.get("code") != 200:
+                text = d.get("msg", "")
+                break
+            text += d.get("text", "")
+            message_id = d.get("message_id", message_id)
+            chat_box.update_msg(text)
+        chat_box.update_msg(text + "\n\n" + "".join(docs), streaming=False, metadata={"message_id": message_id})
+    elif dialogue_mode == "文件对话" and prompt:
+        if st.session_state["file_chat_id"] is None:
+            st.error("请先上传文件再进行对话")
+            st.stop()
+        chat_box.ai_say("正在查询文件内容 ...")
+        text = ""
+        docs = []
+        message_id = ""
+        for d in api.file_chat(prompt,
+                               knowledge_id=st.session_state["file_chat_id"],
+                               top_k=kb_top_k,
+                               score_threshold=score_threshold,
+                               conversation_id=conversation_id,
+                               model=llm_model,
+                               prompt_name=prompt_template_name,
+                               temperature=temperature):
+            if "docs" in d:
+                docs = d["docs"]
+                continue
+            if d.get("code") and d.get("code") != 200:
+                text = d.get("msg", "")
+                break
+            text += d.get("text", "")
+            message_id = d.get("message_id", message_id)
+            chat_box.update_msg(text)
+        chat_box.update_msg(text + "\n\n" + "".join(docs), streaming=False, metadata={"message_id": message_id})
@@ -0,0 +1,112 @@
+"""
+对话执行引擎基准：在子进程中启动一个模拟的OpenAI兼容流式接口(每个请求尽快返回固定数量的token)，
+分别用 langchain 引擎(LLMChain + ChatOpenAI + AsyncIteratorCallbackHandler)与 direct 引擎并发请求，
+统计本进程(即API服务一侧)每生成一个token消耗的CPU时间。
+用法: python -m tests.bench_chat_engine [并发请求数] [每个请求的token数]
+"""
+import asyncio
+import json
+import multiprocessing
+import sys
+import time
+
+from configs.basic import LLM_MODELS
+
+model_name = LLM_MODELS[0]
+
+
+def run_fake_server(port_queue, n_tokens: int):
+    async def handle(reader, writer):
+        try:
+            while True:
+                head = await reader.readuntil(b"\r\n\r\n")
+                length = next((int(line.split(b":")[1]) for line in head.split(b"\r\n")
+                               if line.lower().startswith(b"content-length")), 0)
+                await reader.readexactly(length)
+                writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\n"
+                             b"Transfer-Encoding: chunked\r\n\r\n")
+                for i in range(n_tokens):
+                    data = json.dumps({"id": "chatcmpl-0", "object": "chat.completion.chunk", "model": model_name,
+                                       "choices": [{"index": 0, "delta": {"content": f"词{i % 10}"},
+                                                    "finish_reason": None}]}, ensure_ascii=False)
+                    event = f"data: {data}\n\n".encode("utf-8")
+                    writer.write(b"%x\r\n%s\r\n" % (len(event), event))
+                    if i % 16 == 0:
+                        await writer.drain()
+                event = b"data: [DONE]\n\n"
+                writer.write(b"%x\r\n%s\r\n0\r\n\r\n" % (len(event), event))
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            writer.close()
+
+    async def serve():
+        server = await asyncio.start_server(handle, "127.0.0.1", 0)
+        port_queue.put(server.sockets[0].getsockname()[1])
+        await server.serve_forever()
+
+    asyncio.run(serve())
+
+
+async def langchain_request(api_base: str, query: str) -> int:
+    from langchain.callbacks import AsyncIteratorCallbackHandler
+    from langchain.chains.llm import LLMChain
+
+    from chat.chat_utils import chat_model_pool, get_model_worker_config, get_llm_kwargs, \
+        get_compiled_prompt_template, wrap_done
+
+    model = chat_model_pool._create(model_name, api_base, 300, get_model_worker_config(model_name))
+    callback = AsyncIteratorCallbackHandler()
+    chain = LLMChain(llm=model, prompt=get_compiled_prompt_template("llm_chat", "default"),
+                     llm_kwargs=get_llm_kwargs(0.7))
+    task = asyncio.create_task(wrap_done(chain.acall({"input": query}, callbacks=[callback]), callback.done))
+    tokens = 0
+    async for token in callback.aiter():
+        json.dumps({"text": token, "message_id": ""}, ensure_ascii=False)
+        tokens += 1
+    await task
+    return tokens
+
+
+async def direct_request(api_base: str, query: str) -> int:
+    from chat.chat_utils import get_compiled_prompt_template, get_llm_kwargs, get_openai_messages
+    from chat.direct_engine import astream_chat_completion
+
+    messages = get_openai_messages(get_compiled_prompt_template("llm_chat", "default"), {"input": query})
+    tokens = 0
+    async for token in astream_chat_completion(model_name, messages, get_llm_kwargs(0.7), api_base=api_base):
+        json.dumps({"text": token, "message_id": ""}, ensure_ascii=False)
+        tokens += 1
+    return tokens
+
+
+async def bench(name: str, fn, api_base: str, concurrency: int):
+    await fn(api_base, "预热")
+    cpu, start = time.process_time(), time.perf_counter()
+    tokens = sum(await asyncio.gather(*(fn(api_base, f"问题{i}") for i in range(concurrency))))
+    cpu, elapsed = time.process_time() - cpu, time.perf_counter() - start
+    print(f"{name:9s}: {tokens} tokens  cpu {cpu / tokens * 1e6:7.1f} us/token  "
+          f"{tokens / elapsed:9.0f} tokens/s  wall {elapsed:6.2f}s")
+
+
+async def run_all(api_base: str, concurrency: int):
+    # 两个引擎共用进程内的httpx连接池，需在同一个事件循环中运行
+    await bench("langchain", langchain_request, api_base, concurrency)
+    await bench("direct", direct_request, api_base, concurrency)
+
+
+def main():
+    concurrency = int(sys.argv[1]) if len(sys.argv) > 1 else 32
+    n_tokens = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+    port_queue = multiprocessing.Queue()
+    server = multiprocessing.Process(target=run_fake_server, args=(port_queue, n_tokens), daemon=True)
+    server.start()
+    api_base = f"http://127.0.0.1:{port_queue.get()}/v1"
+    try:
+        print(f"concurrency: {concurrency}, tokens/request: {n_tokens}")
+        asyncio.run(run_all(api_base, concurrency))
+    finally:
+        server.terminate()
+
+
+if __name__ == '__main__':
+    main()
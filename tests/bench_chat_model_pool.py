@@ -0,0 +1,52 @@
+"""
+对比每次请求新建 ChatOpenAI + LLMChain 与复用客户端池两种方式的单请求开销(耗时与内存分配)。
+只构造对象，不实际请求模型服务。
+用法: python -m tests.bench_chat_model_pool
+"""
+import time
+import tracemalloc
+
+from langchain.chains.llm import LLMChain
+
+from chat.chat_utils import get_chat_model, get_pooled_chat_model, get_llm_kwargs, get_compiled_prompt_template
+from configs.basic import LLM_MODELS
+
+model_name = LLM_MODELS[0]
+rounds = 200
+
+
+def build_per_request():
+    model = get_chat_model(model_name=model_name, temperature=0.7, max_tokens=512, callbacks=[])
+    return LLMChain(llm=model, prompt=get_compiled_prompt_template("llm_chat", "default"))
+
+
+def build_pooled():
+    model = get_pooled_chat_model(model_name)
+    return LLMChain(llm=model,
+                    prompt=get_compiled_prompt_template("llm_chat", "default"),
+                    llm_kwargs=get_llm_kwargs(0.7, 512))
+
+
+def bench(name, fn):
+    fn()  # 预热
+    tracemalloc.start()
+    start = time.perf_counter()
+    for _ in range(rounds):
+        fn()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    snapshot = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    allocated = sum(stat.size for stat in snapshot.statistics("filename"))
+    print(f"{name:<12} {elapsed / rounds * 1000:8.3f} ms/req  "
+          f"retained {allocated / rounds / 1024:8.1f} KiB/req  peak {peak / 1024:10.1f} KiB")
+
+
+def main():
+    print(f"model: {model_name}, rounds: {rounds}")
+    bench("per-request", build_per_request)
+    bench("pooled", build_pooled)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+"""
+公平调度压测(吵闹邻居)：模拟一个模型(并发名额固定，每个请求占用名额一段时间)，
+一个重度租户用大量并发脚本持续请求，若干轻度租户偶尔请求，
+分别在只有轻度租户、先来先服务、按租户DRR、DRR+WebUI优先级(interactive)下统计轻度租户的延迟分位数和被拒绝数。
+用法: python -m tests.bench_fair_scheduler [每种场景的秒数] [重度租户并发数]
+"""
+import asyncio
+import random
+import sys
+import time
+
+from chat.admission import ModelGate, AdmissionRejected
+from configs.basic import ADMISSION_CONTROL, FAIR_SCHEDULING
+
+concurrency = 4
+service_time = 0.2
+light_tenants = 8
+# 每个轻度租户平均每秒的请求数
+light_rate = 1.0
+
+
+async def call_model(gate: ModelGate, tenant: str, priority: str):
+    slot = await gate.acquire(tenant, priority)
+    try:
+        await asyncio.sleep(random.uniform(0.5, 1.5) * service_time)
+    finally:
+        slot.release()
+
+
+async def heavy_worker(gate: ModelGate, deadline: float, counter: list):
+    while time.monotonic() < deadline:
+        try:
+            await call_model(gate, "script", "default")
+            counter[0] += 1
+        except AdmissionRejected:
+            await asyncio.sleep(0.05)
+
+
+async def light_user(gate: ModelGate, tenant: str, priority: str, deadline: float, latencies: list, rejected: list):
+    while True:
+        await asyncio.sleep(random.expovariate(light_rate))
+        if time.monotonic() >= deadline:
+            return
+        start = time.monotonic()
+        try:
+            await call_model(gate, tenant, priority)
+            latencies.append(time.monotonic() - start)
+        except AdmissionRejected:
+            rejected[0] += 1
+
+
+def percentile(values: list, p: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))] * 1000 if values else 0.0
+
+
+async def scenario(name: str, fair: bool, light_priority: str, heavy: int, duration: float):
+    max_queue = concurrency * ADMISSION_CONTROL["queue_factor"]
+    if fair:
+        gate = ModelGate("bench", concurrency, max_queue, ADMISSION_CONTROL["max_queue_time"],
+                         FAIR_SCHEDULING["priorities"], FAIR_SCHEDULING["default_priority"],
+                         max(1, int(max_queue * FAIR_SCHEDULING["max_tenant_queue_share"])))
+    else:
+        gate = ModelGate("bench", concurrency, max_queue, ADMISSION_CONTROL["max_queue_time"])
+    random.seed(0)
+    deadline = time.monotonic() + duration
+    latencies, rejected, heavy_done = [], [0], [0]
+    await asyncio.gather(*(heavy_worker(gate, deadline, heavy_done) for _ in range(heavy)),
+                         *(light_user(gate, f"user{i}", light_priority, deadline, latencies, rejected)
+                           for i in range(light_tenants)))
+    print(f"{name:22s}: light p50 {percentile(latencies, 0.5):6.0f}ms  p95 {percentile(latencies, 0.95):6.0f}ms  "
+          f"p99 {percentile(latencies, 0.99):6.0f}ms  ok {len(latencies):4d}  rejected {rejected[0]:4d}  "
+          f"heavy {heavy_done[0] / duration:5.1f} req/s")
+
+
+async def run_all(duration: float, heavy: int):
+    await scenario("light only", True, "default", 0, duration)
+    await scenario("fifo", False, "default", heavy, duration)
+    await scenario("drr", True, "default", heavy, duration)
+    await scenario("drr + interactive", True, "interactive", heavy, duration)
+
+
+def main():
+    duration = float(sys.argv[1]) if len(sys.argv) > 1 else 10
+    heavy = int(sys.argv[2]) if len(sys.argv) > 2 else 32
+    print(f"concurrency: {concurrency}, service: {service_time * 1000:.0f}ms, heavy workers: {heavy}, "
+          f"light tenants: {light_tenants} x {light_rate} req/s")
+    asyncio.run(run_all(duration, heavy))
+
+
+if __name__ == '__main__':
+    main()
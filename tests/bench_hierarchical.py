@@ -0,0 +1,67 @@
+"""
+分层检索基准：对比暴力检索与"摘要索引 -> 组内文本"两级检索的 recall@10 及单条查询耗时。
+模拟数据：每个文件围绕一个主题向量，文件内相邻文本段围绕一个小节向量，小节与入库时的分组一致。
+用法: python -m tests.bench_hierarchical [文本段数] [维度] [检索的摘要组数]
+"""
+import sys
+import time
+
+import numpy as np
+
+from knowledge_base.summary import SummaryIndex, summary_vectors
+from knowledge_base.vector_store.flat import FlatVectorStore
+
+top_k = 10
+n_queries = 200
+group_size = 16
+chunks_per_file = 128
+
+
+def normalize(x: np.ndarray) -> np.ndarray:
+    return x / np.linalg.norm(x, axis=-1, keepdims=True)
+
+
+def make_corpus(n: int, dim: int, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    n_files = -(-n // chunks_per_file)
+    topics = normalize(rng.standard_normal((n_files, dim), dtype=np.float32))
+    sections = normalize(np.repeat(topics, chunks_per_file // group_size, axis=0)
+                         + 0.8 * normalize(rng.standard_normal((n_files * chunks_per_file // group_size, dim),
+                                                               dtype=np.float32)))
+    chunks = np.repeat(sections, group_size, axis=0)[:n]
+    return normalize(chunks + 1.2 * normalize(rng.standard_normal((n, dim), dtype=np.float32)))
+
+
+def timed(fn, queries: np.ndarray):
+    start = time.perf_counter()
+    ids = np.concatenate([fn(q[None])[1] for q in queries])
+    return ids, (time.perf_counter() - start) / len(queries) * 1000
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 500_000
+    dim = int(sys.argv[2]) if len(sys.argv) > 2 else 1024
+    top_summaries = int(sys.argv[3]) if len(sys.argv) > 3 else 16
+    vectors = make_corpus(n, dim)
+    ids = np.arange(n)
+    rng = np.random.default_rng(1)
+    queries = normalize(vectors[rng.choice(n, n_queries, replace=False)]
+                        + 0.5 * normalize(rng.standard_normal((n_queries, dim), dtype=np.float32)))
+
+    flat = FlatVectorStore(path="", dim=dim)
+    flat.add(ids, vectors)
+    summaries = SummaryIndex(path="")
+    groups = [list(range(i, min(i + group_size, n))) for i in range(0, n, group_size)]
+    summaries.add(np.arange(n, n + len(groups)), summary_vectors(vectors, groups), [ids[g] for g in groups])
+
+    truth, flat_ms = timed(lambda q: flat.search(q, top_k), queries)
+    print(f"chunks: {n}, dim: {dim}, summaries: {summaries.size}")
+    print(f"flat        : {flat_ms:8.2f} ms/query  recall@10 1.000")
+    for probe in sorted({max(1, top_summaries // 4), top_summaries, top_summaries * 4}):
+        found, ms = timed(lambda q: summaries.search(q, top_k, flat.get_vectors, probe), queries)
+        recall = np.mean([len(set(a) & set(b)) / top_k for a, b in zip(found.tolist(), truth.tolist())])
+        print(f"hierarchical: {ms:8.2f} ms/query  recall@10 {recall:.3f}  (top_summaries={probe})")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+"""
+知识库入库基准：生成一批文本文件，统计不同进程数下加载、切分阶段的吞吐量(不含向量化)。
+用法: python -m tests.bench_ingest [文件数] [每个文件的段落数]
+"""
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+
+from knowledge_base.ingest import FileInfo, iter_load_and_split
+
+sentences = ["知识库问答先检索相关文档，再交给大模型生成回答。", "向量化前需要把长文档切分成较短的段落。",
+             "切分时优先在段落和句末标点处断开。", "Chunk overlap keeps context across splits. "]
+
+
+def make_files(folder: str, n: int, paragraphs: int) -> list:
+    rng = random.Random(0)
+    infos = []
+    for i in range(n):
+        path = os.path.join(folder, f"doc_{i}.txt")
+        with open(path, "w", encoding="utf-8") as f:
+            for _ in range(paragraphs):
+                f.write("".join(rng.choice(sentences) for _ in range(rng.randint(3, 12))) + "\n\n")
+        st = os.stat(path)
+        infos.append(FileInfo(os.path.basename(path), path, st.st_mtime, st.st_size))
+    return infos
+
+
+async def run(infos: list, workers: int) -> int:
+    chunks = 0
+    async for _, docs, error in iter_load_and_split(infos, max_workers=workers):
+        if error is not None:
+            raise error
+        chunks += len(docs)
+    return chunks
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 64
+    paragraphs = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+    cpus = os.cpu_count() or 1
+    worker_counts = sorted({1, *[2 ** i for i in range(1, cpus.bit_length()) if 2 ** i <= cpus], cpus})
+    with tempfile.TemporaryDirectory() as folder:
+        infos = make_files(folder, n, paragraphs)
+        size = sum(i.size for i in infos) / 1024 ** 2
+        print(f"files: {n}, total size: {size:.1f} MiB, cpus: {cpus}")
+        base = None
+        for workers in worker_counts:
+            start = time.perf_counter()
+            chunks = asyncio.run(run(infos, workers))
+            elapsed = time.perf_counter() - start
+            base = base or elapsed
+            print(f"workers {workers:>2}: {elapsed:7.2f} s  {n / elapsed:7.2f} files/s  "
+                  f"{size / elapsed:6.2f} MiB/s  {chunks / elapsed:9.0f} chunks/s  speedup {base / elapsed:4.2f}x")
+
+
+if __name__ == '__main__':
+    main()
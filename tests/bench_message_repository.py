@@ -0,0 +1,82 @@
+"""
+统计一次聊天(新增消息 + 回答结束后更新消息)对数据库的往返次数和耗时。
+需要本地MySQL(见 configs/store.py)，会在 message 表中写入测试数据。
+用法: python -m tests.bench_message_repository
+"""
+import asyncio
+import time
+import uuid
+
+from sqlalchemy import event
+
+from db.base import engine
+from db.models.message_model import MessageModel
+from db.repository.message_repository import add_message_to_db, update_message_to_db, message_write_queue
+from db.session import get_db_session, request_session
+
+rounds = 100
+counters = {"checkouts": 0, "statements": 0}
+
+
+@event.listens_for(engine.sync_engine, "before_cursor_execute")
+def _count_statement(conn, cursor, statement, parameters, context, executemany):
+    counters["statements"] += 1
+
+
+@event.listens_for(engine.sync_engine.pool, "checkout")
+def _count_checkout(dbapi_conn, conn_record, conn_proxy):
+    counters["checkouts"] += 1
+
+
+async def legacy_chat(conversation_id: str):
+    # 改造前的实现：新增一个会话，查询一个会话，更新再一个会话
+    message_id = uuid.uuid4().hex
+    async with get_db_session() as session:
+        session.add(MessageModel(id=message_id, conversation_id=conversation_id, chat_type="llm_chat",
+                                 query="你好", response="", meta_data={}))
+        await session.commit()
+    async with get_db_session() as session:
+        m = await session.get(MessageModel, message_id)
+    m.response = "你好，有什么可以帮你？"
+    async with get_db_session() as session:
+        session.add(m)
+        await session.commit()
+
+
+async def unit_of_work_chat(conversation_id: str):
+    async with request_session():
+        message_id = await add_message_to_db(conversation_id, "llm_chat", "你好")
+        await update_message_to_db(message_id, "你好，有什么可以帮你？")
+
+
+async def write_behind_chat(conversation_id: str):
+    message_id = message_write_queue.add(conversation_id, "llm_chat", "你好")
+    message_write_queue.update(message_id, "你好，有什么可以帮你？")
+
+
+async def bench(name, fn):
+    conversation_id = uuid.uuid4().hex
+    await fn(conversation_id)  # 预热
+    counters.update(checkouts=0, statements=0)
+    start = time.perf_counter()
+    for _ in range(rounds):
+        await fn(conversation_id)
+    if fn is write_behind_chat:
+        await message_write_queue.flush()
+    elapsed = time.perf_counter() - start
+    print(f"{name:<14} {elapsed / rounds * 1000:8.3f} ms/chat  "
+          f"checkouts {counters['checkouts'] / rounds:5.2f}/chat  "
+          f"statements {counters['statements'] / rounds:5.2f}/chat")
+
+
+async def main():
+    engine.echo = False
+    await bench("legacy", legacy_chat)
+    await bench("unit-of-work", unit_of_work_chat)
+    await bench("write-behind", write_behind_chat)
+    await message_write_queue.close()
+    await engine.dispose()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
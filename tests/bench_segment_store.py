@@ -0,0 +1,80 @@
+"""
+分段内存映射向量库基准：对比 flat 与 segment 两种向量库在新进程中的冷启动加载耗时、首次查询耗时及进程私有内存。
+私有内存取 /proc/self/status 的 RssAnon，memmap映射的页属于共享页缓存，不计入其中。
+用法: python -m tests.bench_segment_store [向量数] [维度] [每段向量数]
+"""
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from knowledge_base.vector_store.flat import FlatVectorStore
+from knowledge_base.vector_store.segment import SegmentVectorStore
+
+VS_CLASSES = {"flat": FlatVectorStore, "segment": SegmentVectorStore}
+
+
+def rss_mb() -> float:
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("RssAnon:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def child(vs_type: str, path: str, dim: int):
+    '''
+    在新进程中加载并查询一次，输出 加载耗时 首次查询耗时 加载后私有内存 查询后私有内存
+    '''
+    base = rss_mb()
+    start = time.perf_counter()
+    store = VS_CLASSES[vs_type](path)
+    store.load()
+    load_time = time.perf_counter() - start
+    loaded_rss = rss_mb() - base
+    query = np.random.default_rng(1).standard_normal((1, dim), dtype=np.float32)
+    start = time.perf_counter()
+    store.search(query, 10)
+    print(load_time, time.perf_counter() - start, loaded_rss, rss_mb() - base)
+
+
+def build(folder: str, n: int, dim: int, segment_size: int):
+    rng = np.random.default_rng(0)
+    flat = FlatVectorStore(os.path.join(folder, "flat"), dim)
+    segment = SegmentVectorStore(os.path.join(folder, "segment"), dim, max_segments=n)
+    for start in range(0, n, segment_size):
+        count = min(segment_size, n - start)
+        vectors = rng.standard_normal((count, dim), dtype=np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        ids = np.arange(start, start + count)
+        flat.add(ids, vectors)
+        segment.add(ids, vectors)
+        segment.save()
+    flat.save()
+
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == "--child":
+        child(sys.argv[2], sys.argv[3], int(sys.argv[4]))
+        return
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    dim = int(sys.argv[2]) if len(sys.argv) > 2 else 1024
+    segment_size = int(sys.argv[3]) if len(sys.argv) > 3 else 200_000
+    with tempfile.TemporaryDirectory() as folder:
+        build(folder, n, dim, segment_size)
+        print(f"vectors: {n}, dim: {dim}, size: {n * dim * 4 / 1024 ** 3:.2f} GiB")
+        for vs_type in VS_CLASSES:
+            # 丢弃页缓存需要root权限，这里测的是热页缓存下的冷启动(新进程)
+            output = subprocess.run([sys.executable, "-m", "tests.bench_segment_store", "--child", vs_type,
+                                     os.path.join(folder, vs_type), str(dim)],
+                                    capture_output=True, text=True, check=True).stdout.split()
+            load_time, query_time, loaded_rss, query_rss = map(float, output)
+            print(f"{vs_type:>8}: load {load_time * 1000:9.1f} ms  first query {query_time * 1000:9.1f} ms  "
+                  f"private RSS after load {loaded_rss:8.1f} MiB  after query {query_rss:8.1f} MiB")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+"""
+流式输出合并基准：模拟多路并发流，每路按固定速率产生token(与AsyncIteratorCallbackHandler一样经asyncio.Queue传递)，
+每帧做 json.dumps + SSE编码并写入本地TCP连接，对比逐token输出与合并输出的帧率和每路CPU耗时。
+用法: python -m tests.bench_stream_coalesce [并发流数] [每路token数] [每路每秒token数]
+"""
+import asyncio
+import json
+import sys
+import time
+
+from chat.streaming import coalesce_tokens
+from configs.basic import STREAM_COALESCE
+
+
+async def token_source(n_tokens: int, rate: float):
+    queue = asyncio.Queue()
+
+    async def produce():
+        for i in range(n_tokens):
+            await asyncio.sleep(1 / rate)
+            queue.put_nowait(f"词{i % 10}")
+        queue.put_nowait(None)
+
+    task = asyncio.create_task(produce())
+    try:
+        while (token := await queue.get()) is not None:
+            yield token
+    finally:
+        task.cancel()
+
+
+async def run_stream(port: int, n_tokens: int, rate: float, coalesce: bool) -> int:
+    _, writer = await asyncio.open_connection("127.0.0.1", port)
+    tokens = token_source(n_tokens, rate)
+    if coalesce:
+        tokens = coalesce_tokens(tokens, STREAM_COALESCE["interval_ms"], STREAM_COALESCE["max_chars"])
+    frames = 0
+    async for text in tokens:
+        data = json.dumps({"text": text, "message_id": "0" * 32}, ensure_ascii=False)
+        writer.write(f"data: {data}\r\n\r\n".encode("utf-8"))
+        await writer.drain()
+        frames += 1
+    writer.close()
+    await writer.wait_closed()
+    return frames
+
+
+async def bench(streams: int, n_tokens: int, rate: float, coalesce: bool):
+    async def discard(reader, writer):
+        while await reader.read(65536):
+            pass
+        writer.close()
+
+    server = await asyncio.start_server(discard, "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    cpu, start = time.process_time(), time.perf_counter()
+    frames = await asyncio.gather(*(run_stream(port, n_tokens, rate, coalesce) for _ in range(streams)))
+    cpu, elapsed = time.process_time() - cpu, time.perf_counter() - start
+    server.close()
+    await server.wait_closed()
+    name = "coalesced" if coalesce else "per-token"
+    print(f"{name:10s}: {sum(frames) / elapsed:10.0f} frames/s  {sum(frames) / streams:7.1f} frames/stream  "
+          f"cpu {cpu / streams * 1000:7.2f} ms/stream  wall {elapsed:6.2f}s")
+
+
+def main():
+    streams = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    n_tokens = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    rate = float(sys.argv[3]) if len(sys.argv) > 3 else 50
+    print(f"streams: {streams}, tokens/stream: {n_tokens}, tokens/s per stream: {rate}, "
+          f"interval_ms: {STREAM_COALESCE['interval_ms']}, max_chars: {STREAM_COALESCE['max_chars']}")
+    for coalesce in (False, True):
+        asyncio.run(bench(streams, n_tokens, rate, coalesce))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,40 @@
+"""
+向量检索基准：随机生成归一化向量，统计不同查询批大小下暴力检索 top-k 的单次查询耗时。
+用法: python -m tests.bench_vector_search [向量数] [维度]
+"""
+import sys
+import time
+
+import numpy as np
+
+from knowledge_base.vector_store.flat import FlatVectorStore
+
+top_k = 10
+batch_sizes = [1, 8, 32]
+
+
+def random_vectors(n: int, dim: int, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    vectors = rng.standard_normal((n, dim), dtype=np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    dim = int(sys.argv[2]) if len(sys.argv) > 2 else 1024
+    store = FlatVectorStore(path="", dim=dim)
+    store.add(np.arange(n), random_vectors(n, dim))
+    print(f"vectors: {n}, dim: {dim}, memory: {store.vectors.nbytes / 1024 ** 3:.2f} GiB")
+    for batch in batch_sizes:
+        queries = random_vectors(batch, dim, seed=1)
+        store.search(queries, top_k)  # 预热
+        rounds = max(3, 32 // batch)
+        start = time.perf_counter()
+        for _ in range(rounds):
+            store.search(queries, top_k)
+        elapsed = (time.perf_counter() - start) / rounds
+        print(f"batch {batch:>3}: {elapsed * 1000:8.2f} ms/batch  {elapsed / batch * 1000:8.2f} ms/query")
+
+
+if __name__ == '__main__':
+    main()
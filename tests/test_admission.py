@@ -0,0 +1,108 @@
+import asyncio
+from types import SimpleNamespace
+
+from starlette.datastructures import Headers
+
+from chat.admission import ModelGate, AdmissionRejected, request_tenant
+from configs.basic import FAIR_SCHEDULING
+
+
+def fake_request(headers: dict = None, host: str = "10.0.0.1"):
+    return SimpleNamespace(headers=Headers(headers or {}), client=SimpleNamespace(host=host))
+
+
+def fair_gate(concurrency: int = 1, max_queue: int = 100, max_queue_time: float = 5.0) -> ModelGate:
+    return ModelGate("m", concurrency, max_queue, max_queue_time, FAIR_SCHEDULING["priorities"],
+                     FAIR_SCHEDULING["default_priority"])
+
+
+def test_priority_header_cannot_claim_interactive(monkeypatch):
+    monkeypatch.setitem(FAIR_SCHEDULING, "tenant_priorities", {"webui-secret": "interactive"})
+    priority_header = FAIR_SCHEDULING["priority_header"]
+    assert request_tenant(fake_request({priority_header: "interactive"}), "c1") == ("c1", "default")
+    assert request_tenant(fake_request({priority_header: "Batch"})) == ("10.0.0.1", "batch")
+    # 配置过的API Key按配置的类别排队，忽略请求头
+    assert request_tenant(fake_request({"x-api-key": "webui-secret", priority_header: "batch"}), "c1") \
+        == ("webui-secret", "interactive")
+    assert request_tenant(fake_request({"Authorization": "Bearer webui-secret"})) == ("webui-secret", "interactive")
+    assert request_tenant(fake_request({"x-api-key": "other", priority_header: "interactive"})) == ("other", "default")
+
+
+def test_queued_requests_follow_priority_then_weighted_round_robin():
+    async def run():
+        gate = fair_gate()
+        holder = await gate.acquire("holder")
+        order = []
+
+        async def request(name: str, tenant: str, priority: str = None, weight: float = 1.0):
+            slot = await gate.acquire(tenant, priority, weight)
+            order.append(name)
+            slot.release()
+
+        tasks = []
+        for i in range(4):
+            tasks.append(asyncio.create_task(request(f"a{i}", "a", weight=2.0)))
+            tasks.append(asyncio.create_task(request(f"b{i}", "b")))
+        tasks.append(asyncio.create_task(request("webui", "w", "interactive")))
+        await asyncio.sleep(0)
+        assert gate.queued == 9
+        holder.release()
+        await asyncio.gather(*tasks)
+        return order, gate
+
+    order, gate = asyncio.run(run())
+    # interactive先于default；default中权重2的租户每轮出队2个
+    assert order == ["webui", "a0", "a1", "b0", "a2", "a3", "b1", "b2", "b3"]
+    assert gate.running == 0 and gate.queued == 0
+    assert gate.stats()["priorities"]["interactive"]["admitted"] == 1
+
+
+def test_full_queue_and_queue_timeout_are_rejected_with_429():
+    async def run():
+        gate = ModelGate("m", 1, 1, 0.05)
+        holder = await gate.acquire()
+        waiting = asyncio.create_task(gate.acquire())
+        await asyncio.sleep(0)
+        try:
+            await gate.acquire()
+        except AdmissionRejected as e:
+            full = e
+        try:
+            await waiting
+        except AdmissionRejected as e:
+            timeout = e
+        assert gate.queued == 0 and gate.running == 1
+        holder.release()
+        return gate, full, timeout
+
+    gate, full, timeout = asyncio.run(run())
+    assert full.reason == "队列已满" and timeout.reason == "排队超时"
+    response = full.to_response()
+    assert response.status_code == 429 and int(response.headers["Retry-After"]) >= 1
+    stats = gate.stats()
+    assert stats["rejected_full"] == 1 and stats["rejected_timeout"] == 1 and stats["running"] == 0
+
+
+def test_cancelled_waiters_hand_the_slot_on():
+    async def run():
+        gate = ModelGate("m", 1, 10, 5.0)
+        holder = await gate.acquire()
+        queued = asyncio.create_task(gate.acquire())
+        granted = asyncio.create_task(gate.acquire())
+        last = asyncio.create_task(gate.acquire())
+        await asyncio.sleep(0)
+        # 排队中被取消：直接移出队列
+        queued.cancel()
+        await asyncio.sleep(0)
+        assert gate.queued == 2
+        # 名额已交给等待者、但它恢复前被取消：名额继续交给下一个等待者
+        holder.release()
+        granted.cancel()
+        slot = await last
+        assert granted.cancelled() and gate.running == 1 and gate.queued == 0
+        slot.release()
+        slot.release()
+        return gate
+
+    gate = asyncio.run(run())
+    assert gate.running == 0 and gate.queued == 0
@@ -0,0 +1,40 @@
+import numpy as np
+
+from knowledge_base.bm25 import BM25Index, tokenize, reciprocal_rank_fusion
+
+texts = [
+    "型号 AB-123 的额定电压为220伏",
+    "知识库支持混合检索，向量检索与关键词检索结果融合",
+    "关键词检索使用BM25算法",
+    "AB-124 与 AB-123 外形相同",
+]
+
+
+def test_tokenize_keeps_codes_and_chinese_bigrams():
+    assert tokenize("型号AB-123") == ["型号", "ab-123", "ab", "123"]
+    assert tokenize("检索") == ["检索"] and tokenize("混合检索") == ["混合", "合检", "检索"]
+
+
+def test_bm25_add_delete_search_save_load(tmp_path):
+    index = BM25Index(str(tmp_path))
+    index.add(np.arange(4), texts)
+    scores, ids = index.search("AB-123", 4)
+    assert set(ids.tolist()) == {0, 3} and scores[0] >= scores[1] > 0
+    assert index.search("不存在的词", 4)[1].tolist() == []
+    assert index.delete(np.array([0, 99])) == 1 and index.size == 3
+    assert index.search("AB-123", 4)[1].tolist() == [3]
+    index.save()
+    # 保存后新增的文档在检索前合并
+    index.add(np.array([10]), ["额定电压 AB-123"])
+    assert index.search("额定电压", 2)[1].tolist() == [10]
+
+    loaded = BM25Index(str(tmp_path))
+    assert loaded.load() and loaded.size == 3
+    assert loaded.search("关键词检索", 3)[1].tolist()[0] == 2
+    loaded.add(np.array([20]), ["新词汇"])
+    assert loaded.search("新词汇", 1)[1].tolist() == [20]
+
+
+def test_reciprocal_rank_fusion_prefers_items_ranked_by_both():
+    fused = reciprocal_rank_fusion([["a", "b", "c"], ["b", "d"]], k=60)
+    assert [doc_id for doc_id, _ in fused] == ["b", "a", "d", "c"]
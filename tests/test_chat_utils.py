@@ -0,0 +1,54 @@
+import asyncio
+
+import pytest
+
+from chat import chat_utils
+from chat.chat_utils import pack_history, pack_history_messages, HISTORY_TURN_OVERHEAD
+from db.repository import message_repository
+
+
+def test_pack_history_keeps_the_most_recent_turns_within_budget():
+    assert pack_history([5, 5, 5], 10) == 2
+    assert pack_history([5, 5, 5], 9) == 1
+    assert pack_history([5, 5, 5], 100) == 3
+    assert pack_history([50, 5], 10) == 1
+    assert pack_history([5], 0) == 0 and pack_history([], 10) == 0
+
+
+@pytest.fixture
+def counted(monkeypatch):
+    calls, merged = [], []
+
+    def fake_count_tokens(text, model_name):
+        calls.append(text)
+        return len(text)
+
+    async def fake_merge(patches):
+        merged.append(patches)
+        return len(patches)
+
+    monkeypatch.setattr(chat_utils, "count_tokens", fake_count_tokens)
+    monkeypatch.setattr(message_repository, "merge_messages_metadata", fake_merge)
+    return calls, merged
+
+
+def test_pack_history_messages_truncates_and_caches_counts(counted):
+    calls, merged = counted
+    messages = [
+        {"id": "m0", "query": "q" * 10, "response": "r" * 10, "meta_data": {"kb": "samples"}},
+        {"id": "m1", "query": "q" * 4, "response": "r" * 4,
+         "meta_data": {"token_counts": {"other-model": [1, 1]}}},
+        {"id": "m2", "query": "q" * 2, "response": "r" * 2, "meta_data": {}},
+    ]
+    budget = 8 + 4 + 2 * HISTORY_TURN_OVERHEAD
+    packed = asyncio.run(pack_history_messages(messages, "m", budget))
+    assert [m["id"] for m in packed] == ["m1", "m2"] and len(calls) == 6
+    # token数合并到已有的meta_data中，一次批量写入
+    assert merged == [{mid: {"token_counts": {"m": counts}}
+                       for mid, counts in (("m0", [10, 10]), ("m1", [4, 4]), ("m2", [2, 2]))}]
+    assert messages[0]["meta_data"] == {"kb": "samples", "token_counts": {"m": [10, 10]}}
+    assert messages[1]["meta_data"]["token_counts"] == {"other-model": [1, 1], "m": [4, 4]}
+
+    # 已缓存token数的消息不再计算，也不再写入
+    packed = asyncio.run(pack_history_messages(messages, "m", budget + 20 + HISTORY_TURN_OVERHEAD))
+    assert len(packed) == 3 and len(calls) == 6 and len(merged) == 1
@@ -0,0 +1,29 @@
+from knowledge_base.dedup import DedupIndex
+
+base = "知识库入库时，切分后的文本段先计算MinHash签名，在LSH分桶中查找近似重复的文本段，重复段不再向量化。"
+# 只有空白、标点、大小写不同
+near = base.replace("，", " ; ").replace("MinHash", "minhash") + "\n"
+other = "模型准入控制按租户公平排队，队列已满或排队超时时返回429，并给出建议的重试间隔。"
+
+
+def test_dedup_find_remove_promote_save_load(tmp_path):
+    index = DedupIndex(str(tmp_path))
+    assert index.find(index.signature(base)) is None
+    index.add_canonical(1, index.signature(base))
+    assert index.find(index.signature(near)) == 1
+    assert index.find(index.signature(other)) is None
+    index.add_duplicate(2, 1)
+    index.add_duplicate(3, 1)
+    index.add_canonical(4, index.signature(other))
+    index.save()
+
+    loaded = DedupIndex(str(tmp_path))
+    assert loaded.load() and loaded.stats() == {"canonical": 2, "duplicates": 2}
+    # 删除重复段不影响原始段；删除原始段时返回剩余的重复段，由调用方提升其中一个
+    assert loaded.remove([3]) == {}
+    assert loaded.remove([1]) == {1: [2]}
+    assert loaded.find(index.signature(base)) is None
+    loaded.promote(1, 2, [])
+    assert loaded.find(index.signature(near)) == 2
+    assert loaded.stats() == {"canonical": 2, "duplicates": 0}
+    assert loaded.remove([4]) == {} and loaded.find(index.signature(other)) is None
@@ -0,0 +1,44 @@
+import asyncio
+import json
+import multiprocessing
+
+import pytest
+
+from chat.direct_engine import SSEDecoder
+from tests.bench_chat_engine import run_fake_server, model_name
+
+
+def test_sse_decoder_handles_split_chunks():
+    events = [json.dumps({"choices": [{"delta": {"content": f"词{i}"}}]}, ensure_ascii=False) for i in range(3)]
+    stream = ("".join(f"data: {e}\r\n\r\n" for e in events) + "data: [DONE]\n\n").encode("utf-8")
+    decoder = SSEDecoder()
+    # 逐字节喂入，多字节字符及行尾都会被切开
+    received = [data for i in range(len(stream)) for data in decoder.feed(stream[i:i + 1])]
+    assert received == events + ["[DONE]"]
+
+
+def test_astream_chat_completion_against_fake_server():
+    pytest.importorskip("httpx")
+    pytest.importorskip("langchain")
+    from chat.direct_engine import astream_chat_completion
+
+    port_queue = multiprocessing.Queue()
+    server = multiprocessing.Process(target=run_fake_server, args=(port_queue, 40), daemon=True)
+    server.start()
+    try:
+        api_base = f"http://127.0.0.1:{port_queue.get(timeout=10)}/v1"
+
+        async def request(query: str):
+            messages = [{"role": "user", "content": query}]
+            return [token async for token in astream_chat_completion(model_name, messages, {"temperature": 0.7},
+                                                                     api_base=api_base)]
+
+        async def run():
+            # 并发请求共用连接池，第二轮复用已建立的连接
+            first = await asyncio.gather(*(request(f"问题{i}") for i in range(4)))
+            return first + [await request("再问")]
+
+        results = asyncio.run(run())
+    finally:
+        server.terminate()
+    assert results == [[f"词{i % 10}" for i in range(40)]] * 5
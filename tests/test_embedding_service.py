@@ -0,0 +1,88 @@
+import threading
+import time
+
+import numpy as np
+
+from embeddings.service import BatchingEmbedder, EmbeddingCache
+from tests.test_semantic_cache import HashEmbedder
+
+
+class CountingEmbedder(HashEmbedder):
+    def __init__(self):
+        self.batches = []
+
+    def embed_documents(self, texts):
+        self.batches.append(len(texts))
+        return super().embed_documents(texts)
+
+
+def wait_for_cache_writes(embedder: BatchingEmbedder, timeout: float = 5.0):
+    deadline = time.monotonic() + timeout
+    while embedder._pending and time.monotonic() < deadline:
+        time.sleep(0.001)
+
+
+def test_concurrent_requests_are_batched():
+    inner = CountingEmbedder()
+    embedder = BatchingEmbedder(inner, max_batch_size=64, max_wait=0.05, cache=EmbeddingCache(disk_path=None))
+    results = {}
+    threads = [threading.Thread(target=lambda i=i: results.__setitem__(i, embedder.embed_documents([f"问题{i}"])))
+               for i in range(20)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert sum(inner.batches) == 20 and len(inner.batches) < 20
+    assert np.allclose(results[3], HashEmbedder().embed_documents(["问题3"]))
+
+
+def test_identical_text_is_not_recomputed(tmp_path):
+    path = str(tmp_path / "embedding_cache.db")
+    inner = CountingEmbedder()
+    embedder = BatchingEmbedder(inner, max_wait=0, cache=EmbeddingCache(disk_path=path))
+    first = embedder.embed_documents(["相同的文本", "相同的文本"])
+    embedder.embed_documents(["相同的文本"])
+    assert inner.batches == [1]
+    wait_for_cache_writes(embedder)
+    # 新实例从磁盘层命中
+    other = CountingEmbedder()
+    second = BatchingEmbedder(other, cache=EmbeddingCache(disk_path=path)).embed_documents(["相同的文本"])
+    assert other.batches == [] and np.allclose(first[0], second[0])
+
+
+def test_results_are_returned_before_the_cache_write():
+    cache = EmbeddingCache(disk_path=None)
+    write_started, release_write = threading.Event(), threading.Event()
+    set_many = cache.set_many
+
+    def slow_set_many(items):
+        write_started.set()
+        release_write.wait(5)
+        set_many(items)
+
+    cache.set_many = slow_set_many
+    inner = CountingEmbedder()
+    embedder = BatchingEmbedder(inner, max_wait=0, cache=cache)
+    try:
+        vectors = embedder.embed_documents(["查询"])
+        assert write_started.wait(5) and not release_write.is_set()
+        # 缓存写入完成前，相同文本取已完成的结果，不重新计算
+        assert np.array_equal(embedder.embed_documents(["查询"]), vectors) and inner.batches == [1]
+    finally:
+        release_write.set()
+    wait_for_cache_writes(embedder)
+    assert len(cache._items) == 1 and not embedder._pending
+
+
+def test_disk_tier_evicts_oldest_vectors(tmp_path):
+    path = str(tmp_path / "embedding_cache.db")
+    vector_bytes = HashEmbedder.dim * 4
+    cache = EmbeddingCache(max_memory_bytes=0, disk_path=path, max_disk_bytes=10 * vector_bytes)
+    vectors = HashEmbedder().embed_documents([f"文本{i}" for i in range(12)])
+    for i in range(12):
+        cache.set_many({f"k{i}": vectors[i]})
+    # 写入第11个向量时超过上限，删除最早写入的2个，降到上限的90%
+    assert cache.stats()["disk_evictions"] == 2 and cache.disk.bytes == 10 * vector_bytes
+    assert set(cache.get_many([f"k{i}" for i in range(12)])) == {f"k{i}" for i in range(2, 12)}
+    # 重新打开时统计已有的占用
+    assert EmbeddingCache(disk_path=path, max_disk_bytes=10 * vector_bytes).disk.bytes == 10 * vector_bytes
@@ -0,0 +1,136 @@
+import asyncio
+import threading
+
+import pytest
+
+from embeddings.service import BatchingEmbedder, EmbeddingCache
+from knowledge_base import file_chat
+from knowledge_base.file_chat import FileChatManager
+from tests.test_semantic_cache import HashEmbedder
+
+
+class FakeEmbedder(HashEmbedder):
+    '''
+    记录向量化的文本；设置gate后阻塞到gate被set，用于模拟正在建立的索引
+    '''
+
+    def __init__(self, gate: threading.Event = None):
+        self.texts = []
+        self.gate = gate
+
+    def embed_documents(self, texts):
+        if self.gate is not None:
+            self.gate.wait(5)
+        self.texts.extend(texts)
+        return super().embed_documents(texts)
+
+
+@pytest.fixture(autouse=True)
+def fake_loader(monkeypatch):
+    def fake_load_and_split(path, file_name, *args):
+        with open(path, encoding="utf-8") as f:
+            return [{"page_content": text, "metadata": {}} for text in f.read().split("\n\n")]
+
+    monkeypatch.setattr(file_chat, "load_and_split", fake_load_and_split)
+
+
+def make_manager(inner: FakeEmbedder = None, **kwargs) -> FileChatManager:
+    embedder = BatchingEmbedder(inner or FakeEmbedder(), max_wait=0, cache=EmbeddingCache(disk_path=None))
+    return FileChatManager(**{"ttl": 60, "max_memory_mb": 1, "max_sessions": 10, "max_concurrent_builds": 2,
+                              "embedder": embedder, **kwargs})
+
+
+def upload(text: str, name: str = "a.txt"):
+    return [(name, text.encode("utf-8"))]
+
+
+def test_build_and_search_through_the_embedding_service():
+    inner = FakeEmbedder()
+
+    async def run():
+        manager = make_manager(inner)
+        session = manager.create(upload("苹果是一种水果\n\n火车在铁轨上行驶"))
+        await session.ready.wait()
+        results = await manager.search(session, "苹果是一种水果", top_k=1, score_threshold=0.0)
+        # 重新上传相同文件时文本段向量取自缓存
+        again = manager.create(upload("苹果是一种水果\n\n火车在铁轨上行驶", "b.txt"))
+        await again.ready.wait()
+        return manager, session, again, results
+
+    manager, session, again, results = asyncio.run(run())
+    assert session.status == "ready" and again.status == "ready" and len(session.docs) == 2
+    assert results[0]["page_content"] == "苹果是一种水果" and results[0]["file_name"] == "a.txt"
+    assert len(inner.texts) == 3 and manager.memory == session.memory + again.memory
+
+
+def test_idle_sessions_expire_after_ttl():
+    async def run():
+        manager = make_manager()
+        old, new = manager.create(upload("old")), manager.create(upload("new"))
+        await asyncio.gather(old.ready.wait(), new.ready.wait())
+        old.last_access -= 61
+        return manager, old, new
+
+    manager, old, new = asyncio.run(run())
+    assert manager.get(old.id) is None and manager.get(new.id) is new
+    assert manager.stats()["expired"] == 1 and manager.memory == new.memory
+
+
+def test_least_recently_used_sessions_are_evicted_over_max_memory():
+    async def run():
+        # 每个会话约 3 * 1KB 向量 + 文本，上限10KB
+        manager = make_manager(max_memory_mb=10 / 1024)
+        sessions = []
+        for i in range(3):
+            session = manager.create(upload(f"s{i} x\n\ns{i} y\n\ns{i} z"))
+            await session.ready.wait()
+            sessions.append(session)
+        manager.get(sessions[0].id)
+        session = manager.create(upload("s3 x\n\ns3 y\n\ns3 z"))
+        await session.ready.wait()
+        return manager, sessions + [session]
+
+    manager, sessions = asyncio.run(run())
+    assert manager.get(sessions[1].id) is None and manager.stats()["evicted"] == 1
+    assert all(manager.get(s.id) is s for s in (sessions[0], sessions[2], sessions[3]))
+    assert manager.memory == sum(s.memory for s in (sessions[0], sessions[2], sessions[3])) <= manager.max_memory
+
+
+def test_oversized_session_is_rejected_without_evicting_others():
+    async def run():
+        manager = make_manager(max_memory_mb=10 / 1024)
+        kept = manager.create(upload("kept"))
+        await kept.ready.wait()
+        # 上传的文件已超出上限
+        big = manager.create(upload("x" * 20000))
+        # 上传的文件不大，但切分、向量化后超出上限
+        many = manager.create(upload("\n\n".join(f"段落{i}" for i in range(20))))
+        await asyncio.gather(big.ready.wait(), many.ready.wait())
+        return manager, kept, big, many
+
+    manager, kept, big, many = asyncio.run(run())
+    assert big.status == "failed" and many.status == "failed" and "内存上限" in many.error
+    assert manager.get(kept.id) is kept and manager.get(big.id) is None and manager.get(many.id) is None
+    assert manager.stats()["evicted"] == 0 and manager.memory == kept.memory
+
+
+def test_remove_during_pending_build():
+    gate = threading.Event()
+
+    async def run():
+        manager = make_manager(FakeEmbedder(gate))
+        session = manager.create(upload("pending"))
+        await asyncio.sleep(0.05)
+        assert manager.stats()["pending"] == 1 and manager.memory == len("pending")
+        assert manager.remove(session.id) and not manager.remove(session.id)
+        await asyncio.wait_for(session.ready.wait(), 1)
+        gate.set()
+        await asyncio.gather(session.task, return_exceptions=True)
+        return manager, session
+
+    try:
+        manager, session = asyncio.run(run())
+    finally:
+        gate.set()
+    assert session.task.cancelled() and session.status == "failed" and session.error == "会话已删除"
+    assert manager.memory == 0 and manager.stats()["sessions"] == 0
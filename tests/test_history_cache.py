@@ -0,0 +1,107 @@
+import asyncio
+
+from sqlalchemy import create_engine, inspect
+
+from db.base import _create_missing_indexes
+from db.history_cache import ConversationHistoryCache
+from db.models.message_model import MessageModel
+from db.repository import message_repository
+from db.repository.message_repository import get_history_messages, MessageWriteBehindQueue
+
+
+def turn(i: int, response: str = None) -> dict:
+    return {"id": f"m{i}", "query": f"q{i}", "response": f"r{i}" if response is None else response, "meta_data": {}}
+
+
+def test_get_returns_recent_finished_turns():
+    cache = ConversationHistoryCache(max_turns=4)
+    assert cache.get("c", 2) is None
+    cache.put("c", [turn(i) for i in range(3)], complete=True)
+    assert [t["id"] for t in cache.get("c", 2)] == ["m1", "m2"]
+    # 会话只有3轮时返回全部
+    assert [t["id"] for t in cache.get("c", 4)] == ["m0", "m1", "m2"]
+    assert cache.get("c", 5) is None
+    assert cache.stats()["hits"] == 2 and cache.stats()["misses"] == 2
+
+
+def test_unfinished_turns_fall_back_when_older_turns_are_not_cached():
+    cache = ConversationHistoryCache(max_turns=4)
+    # 从数据库加载的是最近的消息，更早的消息不在缓存中
+    cache.put("c", [turn(0), turn(1, ""), turn(2), turn(3, "")])
+    assert [t["id"] for t in cache.get("c", 2)] == ["m0", "m2"]
+    assert cache.get("c", 3) is None
+
+    cache.invalidate("c")
+    cache.put("d", [turn(0), turn(1, ""), turn(2)], complete=True)
+    assert [t["id"] for t in cache.get("d", 3)] == ["m0", "m2"]
+    # 追加消息丢弃最早的一轮后，缓存不再包含全部消息
+    for i in range(3, 6):
+        cache.on_message_added("d", f"d{i}", f"q{i}")
+    assert cache.get("d", 4) is None
+
+
+def test_writes_are_appended_to_cached_conversations():
+    cache = ConversationHistoryCache(max_turns=4)
+    cache.on_message_added("c", "m0", "q0")
+    assert cache.get("c", 1) is None
+    cache.put("c", [], complete=True)
+    cache.on_message_added("c", "m0", "q0")
+    assert cache.get("c", 1) == []
+    cache.on_message_updated("m0", response="r0", meta_data={"kb": "samples"})
+    assert cache.get("c", 1) == [{"id": "m0", "query": "q0", "response": "r0", "meta_data": {"kb": "samples"}}]
+    # 返回副本，调用方修改不影响缓存
+    cache.get("c", 1)[0]["response"] = "changed"
+    assert cache.get("c", 1)[0]["response"] == "r0"
+    cache.invalidate("c")
+    assert cache.get("c", 1) is None
+
+
+def test_least_recently_used_conversations_are_evicted():
+    cache = ConversationHistoryCache(max_conversations=2, max_turns=4)
+    for c in ("a", "b"):
+        cache.put(c, [turn(0)], complete=True)
+    cache.get("a", 1)
+    cache.put("c", [turn(0)], complete=True)
+    assert cache.get("b", 1) is None and cache.get("a", 1) and cache.stats()["evictions"] == 1
+
+    small = ConversationHistoryCache(max_turns=4, max_memory_bytes=2000)
+    for c in range(20):
+        small.put(str(c), [turn(i, "r" * 100) for i in range(2)], complete=True)
+    assert 0 < small.stats()["conversations"] < 20 and small.memory_bytes <= 2000
+    assert small.get("19", 2) is not None and small.get("0", 2) is None
+
+
+def test_get_history_messages_queries_finished_turns_when_recent_ones_are_unfinished(monkeypatch):
+    rows = [turn(i, "" if i % 2 else None) for i in range(10)]
+    queries = []
+
+    async def fake_filter_message(conversation_id, limit=10, finished_only=False):
+        queries.append((limit, finished_only))
+        matched = [dict(r) for r in rows if r["response"] or not finished_only]
+        return matched[-limit:]
+
+    monkeypatch.setattr(message_repository, "filter_message", fake_filter_message)
+    monkeypatch.setattr(message_repository, "history_cache", ConversationHistoryCache(max_turns=4))
+    monkeypatch.setattr(message_repository, "message_write_queue", MessageWriteBehindQueue())
+
+    turns = asyncio.run(get_history_messages("c", 4))
+    assert [t["id"] for t in turns] == ["m2", "m4", "m6", "m8"]
+    assert queries == [(5, False), (4, True)]
+    # 缓存中已完成的对话不足4轮，且更早的消息未缓存，仍查询数据库
+    asyncio.run(get_history_messages("c", 4))
+    assert len(queries) == 4
+    # 缓存中的已完成对话足够时不查询数据库
+    assert [t["id"] for t in asyncio.run(get_history_messages("c", 2))] == ["m6", "m8"] and len(queries) == 4
+
+
+def test_missing_indexes_are_created_on_existing_tables():
+    engine = create_engine("sqlite://")
+    table = MessageModel.__table__
+    with engine.begin() as connection:
+        table.create(connection)
+        index = next(iter(table.indexes))
+        index.drop(connection)
+        assert _create_missing_indexes(connection) == [index.name]
+        assert index.name in {i["name"] for i in inspect(connection).get_indexes(table.name)}
+        # 已存在的索引及不存在的表都跳过
+        assert _create_missing_indexes(connection) == []
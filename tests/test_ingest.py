@@ -0,0 +1,85 @@
+import asyncio
+import os
+from types import SimpleNamespace
+
+import pytest
+
+from knowledge_base import ingest, kb_service
+from knowledge_base.ingest import plan_ingestion, scan_kb_folder
+
+
+def write(path, text: str, mtime: float):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.utime(path, (mtime, mtime))
+
+
+@pytest.fixture
+def kb(tmp_path, monkeypatch):
+    '''
+    在临时目录中创建知识库content目录，knowledge_file表用records代替
+    '''
+    monkeypatch.setattr(kb_service, "KB_ROOT_PATH", str(tmp_path))
+    content = tmp_path / "samples" / "content"
+    records = {}
+
+    async def fake_list_files_from_db(kb_name):
+        assert kb_name == "samples"
+        return [SimpleNamespace(file_name=name, file_mtime=mtime, file_size=size)
+                for name, (mtime, size) in records.items()]
+
+    monkeypatch.setattr(ingest, "list_files_from_db", fake_list_files_from_db)
+    return content, records
+
+
+def record(records: dict, content, file_name: str):
+    st = os.stat(content / file_name)
+    records[file_name] = (st.st_mtime, st.st_size)
+
+
+def test_scan_skips_hidden_and_unsupported_files(kb):
+    content, records = kb
+    write(str(content / "a.md"), "a", 100)
+    write(str(content / "sub" / "b.txt"), "b", 100)
+    write(str(content / ".hidden.md"), "x", 100)
+    write(str(content / "~$lock.docx"), "x", 100)
+    write(str(content / "image.png"), "x", 100)
+    files = scan_kb_folder("samples")
+    assert sorted(files) == ["a.md", "sub/b.txt"]
+    assert files["sub/b.txt"].size == 1 and files["sub/b.txt"].mtime == 100
+
+
+def test_plan_ingestion_diffs_folder_against_records(kb):
+    content, records = kb
+    for name in ("unchanged.md", "touched.md", "resized.md", "removed.md"):
+        write(str(content / name), "hello", 100)
+        record(records, content, name)
+    write(str(content / "new.md"), "hello", 100)
+    # 只修改时间或只修改大小都视为修改过
+    write(str(content / "touched.md"), "hello", 200)
+    write(str(content / "resized.md"), "hello world", 100)
+    os.remove(content / "removed.md")
+    # 时间戳精度造成的微小差异不算修改
+    records["unchanged.md"] = (100 + ingest.MTIME_TOLERANCE / 2, records["unchanged.md"][1])
+
+    added, modified, deleted, unchanged = asyncio.run(plan_ingestion("samples"))
+    assert [i.file_name for i in added] == ["new.md"]
+    assert sorted(i.file_name for i in modified) == ["resized.md", "touched.md"]
+    assert deleted == ["removed.md"] and unchanged == 1
+
+
+def test_plan_ingestion_force_updates_recorded_files(kb):
+    content, records = kb
+    write(str(content / "a.md"), "a", 100)
+    write(str(content / "b.md"), "b", 100)
+    record(records, content, "a.md")
+    added, modified, deleted, unchanged = asyncio.run(plan_ingestion("samples", force=True))
+    assert [i.file_name for i in added] == ["b.md"] and [i.file_name for i in modified] == ["a.md"]
+    assert deleted == [] and unchanged == 0
+
+
+def test_plan_ingestion_of_missing_folder_deletes_all_records(kb):
+    content, records = kb
+    records["gone.md"] = (100.0, 1)
+    assert asyncio.run(plan_ingestion("samples")) == ([], [], ["gone.md"], 0)
@@ -0,0 +1,124 @@
+import asyncio
+
+import pytest
+from sqlalchemy.exc import OperationalError
+
+from db.repository import message_repository
+from db.repository.message_repository import MessageWriteBehindQueue
+
+
+class FakeTable:
+    '''
+    代替upsert_messages_to_db，按id合并写入的行；response过长的行写入失败
+    '''
+
+    def __init__(self):
+        self.rows = {}
+        self.calls = []
+        self.unavailable = 0
+
+    async def upsert(self, rows):
+        self.calls.append(len(rows))
+        if self.unavailable:
+            self.unavailable -= 1
+            raise OperationalError("INSERT", {}, ConnectionError("lost connection"))
+        if any(len(row.get("response") or "") > 10 for row in rows):
+            raise ValueError("Data too long for column 'response'")
+        for row in rows:
+            self.rows.setdefault(row["id"], {}).update(row)
+        return len(rows)
+
+
+@pytest.fixture
+def table(monkeypatch):
+    table = FakeTable()
+    monkeypatch.setattr(message_repository, "upsert_messages_to_db", table.upsert)
+    return table
+
+
+def test_updates_are_coalesced_into_one_row(table):
+    async def run():
+        queue = MessageWriteBehindQueue(flush_interval=60)
+        queue.add("c1", "llm_chat", "你好", message_id="m1")
+        queue.update("m1", response="你")
+        queue.update("m1", response="你好", metadata={"tokens": 2})
+        assert queue.get_pending("m1")["response"] == "你好"
+        written = await queue.flush()
+        await queue.close()
+        return queue, written
+
+    queue, written = asyncio.run(run())
+    assert written == 1 and table.calls == [1]
+    assert table.rows["m1"]["query"] == "你好" and table.rows["m1"]["meta_data"] == {"tokens": 2}
+    assert queue.stats()["enqueued"] == 3 and queue.stats()["pending"] == 0
+
+
+def test_db_unavailable_keeps_rows_for_retry(table):
+    async def run():
+        queue = MessageWriteBehindQueue(flush_interval=60, max_attempts=2)
+        queue.add("c1", "llm_chat", "q", message_id="m1")
+        table.unavailable = 3
+        for _ in range(3):
+            with pytest.raises(OperationalError):
+                await queue.flush()
+        # 失败期间的新修改与放回队列的消息合并
+        queue.update("m1", response="r")
+        assert queue.get_pending("m1")["query"] == "q"
+        written = await queue.flush()
+        await queue.close()
+        return queue, written
+
+    queue, written = asyncio.run(run())
+    # 数据库不可用不计入单条消息的失败次数
+    assert written == 1 and table.rows["m1"]["response"] == "r"
+    assert queue.stats()["errors"] == 3 and queue.stats()["dropped"] == 0
+
+
+def test_poison_row_is_isolated_and_dropped(table):
+    async def run():
+        queue = MessageWriteBehindQueue(flush_interval=60, max_attempts=2)
+        queue.add("c1", "llm_chat", "q1", response="x" * 100, message_id="bad")
+        queue.add("c1", "llm_chat", "q2", response="ok", message_id="good")
+        first = await queue.flush()
+        assert queue.stats()["pending"] == 1 and queue.stats()["retrying"] == 1
+        queue.add("c2", "llm_chat", "q3", message_id="later")
+        second = await queue.flush()
+        return queue, first, second
+
+    queue, first, second = asyncio.run(run())
+    assert first == 1 and second == 1 and set(table.rows) == {"good", "later"}
+    stats = queue.stats()
+    assert stats["pending"] == 0 and stats["retrying"] == 0 and stats["dropped"] == 1
+
+
+def test_close_drains_pending_rows(table):
+    async def run():
+        queue = MessageWriteBehindQueue(max_batch_size=1000, flush_interval=60)
+        for i in range(50):
+            queue.add("c1", "llm_chat", f"q{i}", message_id=f"m{i}")
+        task = queue._flush_task
+        await queue.close()
+        return queue, task
+
+    queue, task = asyncio.run(run())
+    assert task.done() and len(table.rows) == 50 and queue.stats()["pending"] == 0
+
+
+def test_merge_metadata_keeps_other_keys(table, monkeypatch):
+    async def run():
+        queue = MessageWriteBehindQueue(flush_interval=60)
+        monkeypatch.setattr(message_repository, "message_write_queue", queue)
+        message_repository.history_cache.put("merge-c1", [{"id": "merge-m1", "query": "q", "response": "r",
+                                                           "meta_data": {"kb": "samples"}}])
+        queue.add("merge-c1", "llm_chat", "q", response="r", message_id="merge-m1",
+                  metadata={"kb": "samples", "token_counts": {"a": [1, 1]}})
+        # 尚未落库的消息在队列中合并，不访问数据库
+        await message_repository.merge_messages_metadata({"merge-m1": {"token_counts": {"b": [2, 2]}}})
+        pending = queue.get_pending("merge-m1")
+        await queue.close()
+        return pending
+
+    pending = asyncio.run(run())
+    assert pending["meta_data"] == {"kb": "samples", "token_counts": {"a": [1, 1], "b": [2, 2]}}
+    cached = message_repository.history_cache.get("merge-c1", 1)
+    assert cached[0]["meta_data"] == {"kb": "samples", "token_counts": {"b": [2, 2]}}
@@ -0,0 +1,88 @@
+import os
+import sys
+import time
+import uuid
+
+import pytest
+
+from chat.prompt_registry import PromptTemplateRegistry
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def write(path, text: str, mtime: float = None):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(text)
+    if mtime is not None:
+        os.utime(path, (mtime, mtime))
+
+
+@pytest.fixture
+def registry(tmp_path, monkeypatch):
+    # 每个测试使用不同的模块名，避免读到上一个测试导入的配置模块
+    module_name = f"prompt_config_{uuid.uuid4().hex}"
+    write(str(tmp_path / f"{module_name}.py"),
+          'PROMPT_TEMPLATES = {"llm_chat": {"default": "config: {input}", "plain": "plain: {input}"}}\n')
+    monkeypatch.syspath_prepend(str(tmp_path))
+    clock = Clock()
+    monkeypatch.setattr(time, "monotonic", clock)
+    yield PromptTemplateRegistry(module_name, str(tmp_path / "prompts"), check_interval=1.0), clock, \
+        tmp_path / "prompts" / "llm_chat"
+    sys.modules.pop(module_name, None)
+
+
+def test_template_file_overrides_config_and_is_cached(registry):
+    registry, clock, template_dir = registry
+    assert registry.get("llm_chat", "default") == "config: {input}"
+    write(str(template_dir / "default.txt"), "file: {input}")
+    # 检查间隔内不重新扫描文件
+    assert registry.get("llm_chat", "default") == "config: {input}"
+    clock.now += 1.5
+    assert registry.get("llm_chat", "default") == "file: {input}" and registry.reloads == 2
+    assert sorted(registry.list_names("llm_chat")) == ["default", "plain"]
+
+    compiled = registry.get_compiled("llm_chat", "default")
+    assert compiled.format(input="x") == "file: x"
+    assert registry.get_compiled("llm_chat", "default") is compiled
+    assert registry.stats()["hits"] == 1 and registry.stats()["misses"] == 1
+    assert registry.get_compiled("llm_chat", "missing") is None
+
+
+def test_modified_template_is_reloaded_after_the_interval(registry):
+    registry, clock, template_dir = registry
+    path = str(template_dir / "default.txt")
+    write(path, "v1: {input}", mtime=1_000_000)
+    first = registry.get_compiled("llm_chat", "default")
+    assert first.format(input="x") == "v1: x"
+
+    # 文件未变化时到期检查也不重新加载
+    clock.now += 1.5
+    assert registry.get_compiled("llm_chat", "default") is first and registry.reloads == 1
+
+    write(path, "v2: {input}", mtime=1_000_010)
+    clock.now += 0.5
+    assert registry.get_compiled("llm_chat", "default") is first
+    clock.now += 1.0
+    second = registry.get_compiled("llm_chat", "default")
+    assert second is not first and second.format(input="x") == "v2: x" and registry.reloads == 2
+
+    # 删除文件后回到配置中的模板
+    os.remove(path)
+    clock.now += 1.5
+    assert registry.get("llm_chat", "default") == "config: {input}"
+
+
+def test_jinja2_template_file(registry):
+    registry, clock, template_dir = registry
+    write(str(template_dir / "rich.jinja2"), "{% if input %}Q: {{ input }}{% endif %}")
+    assert registry.get("llm_chat", "rich") == "{% if input %}Q: {{ input }}{% endif %}"
+    assert registry._templates["llm_chat"]["rich"][1] == "jinja2"
+    pytest.importorskip("jinja2")
+    assert registry.get_compiled("llm_chat", "rich").format(input="x") == "Q: x"
@@ -0,0 +1,73 @@
+import numpy as np
+
+from knowledge_base.reranker import Reranker
+
+
+class FakeReranker(Reranker):
+    '''
+    按文档中"rel"字符的数量打分，记录每批计算的(问题, 文档)对
+    '''
+
+    def __init__(self, **kwargs):
+        super().__init__("fake", **kwargs)
+        self.batches = []
+
+    def compute_scores(self, pairs):
+        self.batches.append([doc for _, doc in pairs])
+        return np.array([doc.count("rel") / 10 for _, doc in pairs], dtype=np.float32)
+
+
+def make_docs(*texts):
+    return [{"page_content": text, "metadata": {"i": i}} for i, text in enumerate(texts)]
+
+
+def test_rerank_orders_by_score_and_batches_by_length():
+    reranker = FakeReranker(batch_size=2)
+    docs = make_docs("rel", "rel rel rel", "x" * 50, "rel rel")
+    results, info = reranker.rerank("q", docs, top_n=3, budget_ms=0)
+    assert [r["metadata"]["i"] for r in results] == [1, 3, 0]
+    assert results[0]["relevance_score"] == np.float32(0.3).item() and "relevance_score" not in docs[1]
+    # 按长度从长到短分批，同一批内长度相近
+    assert reranker.batches == [["x" * 50, "rel rel rel"], ["rel rel", "rel"]]
+    assert info["candidates"] == 4 and info["scored"] == 4 and info["cached"] == 0 and info["dropped"] == 0
+
+
+def test_second_call_is_served_from_the_cache():
+    reranker = FakeReranker()
+    docs = make_docs("rel", "rel rel")
+    first, _ = reranker.rerank("q", docs, top_n=2, budget_ms=0)
+    second, info = reranker.rerank("q", docs + make_docs("rel rel rel"), top_n=2, budget_ms=0)
+    assert info["cached"] == 2 and info["scored"] == 1 and reranker.batches[-1] == ["rel rel rel"]
+    assert [r["page_content"] for r in second] == ["rel rel rel", "rel rel"]
+    # 不同问题或不同模型的得分不共用缓存
+    _, info = reranker.rerank("other", docs, top_n=2, budget_ms=0)
+    assert info["cached"] == 0
+    assert reranker.stats()["cache_hits"] == 2 and reranker.stats()["cache_items"] == 5
+
+
+def test_cache_evicts_least_recently_used_pairs():
+    reranker = FakeReranker(cache_size=2)
+    reranker.rerank("q", make_docs("a", "b"), top_n=2, budget_ms=0)
+    reranker.rerank("q", make_docs("a"), top_n=1, budget_ms=0)
+    reranker.rerank("q", make_docs("c"), top_n=1, budget_ms=0)
+    _, info = reranker.rerank("q", make_docs("a", "b"), top_n=2, budget_ms=0)
+    assert info["cached"] == 1 and reranker.batches[-1] == ["b"]
+
+
+def test_candidates_are_truncated_when_the_budget_would_be_exceeded():
+    reranker = FakeReranker()
+    reranker.seconds_per_pair = 0.05
+    docs = make_docs(*[f"doc{i} " + "rel " * i for i in range(10)])
+    results, info = reranker.rerank("q", docs, top_n=2, budget_ms=200)
+    # 预算只够4对，保留向量相似度最高的前4个候选
+    assert info["scored"] == 4 and info["dropped"] == 6 and reranker.stats()["truncated_requests"] == 1
+    assert [r["metadata"]["i"] for r in results] == [3, 2]
+
+    # 预算至少保证top_n个候选
+    _, info = reranker.rerank("q2", docs, top_n=5, budget_ms=1)
+    assert info["scored"] == 5 and info["dropped"] == 5
+    # 不限制预算或尚无耗时统计时重排全部候选
+    _, info = reranker.rerank("q3", docs, top_n=2, budget_ms=0)
+    assert info["scored"] == 10
+    _, info = FakeReranker().rerank("q", docs, top_n=2, budget_ms=1)
+    assert info["scored"] == 10 and info["dropped"] == 0
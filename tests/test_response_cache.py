@@ -0,0 +1,62 @@
+import asyncio
+import time
+
+from chat.response_cache import ResponseCache, make_response_cache_key, iter_replay_chunks
+
+
+def test_key_depends_on_model_prompt_and_params():
+    key = make_response_cache_key("m", "default", "你好", {"temperature": 0, "max_tokens": 100})
+    assert key == make_response_cache_key("m", "default", "你好", {"max_tokens": 100, "temperature": 0})
+    assert key != make_response_cache_key("m", "default", "你好", {"temperature": 0, "max_tokens": 200})
+    assert key != make_response_cache_key("m2", "default", "你好", {"temperature": 0, "max_tokens": 100})
+    assert key != make_response_cache_key("m", "other", "你好", {"temperature": 0, "max_tokens": 100})
+
+
+def test_memory_tier_expires_and_evicts_by_bytes(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(time, "time", lambda: now[0])
+    cache = ResponseCache(ttl=10, max_memory_bytes=3 * (64 + 30), disk_path=None)
+    for i in range(3):
+        cache.set(make_response_cache_key("m", "p", str(i), {}), f"{i}" * 30)
+    assert cache.get(make_response_cache_key("m", "p", "0", {})) == "0" * 30
+    # 超过字节上限时淘汰最久未使用的
+    cache.set(make_response_cache_key("m", "p", "3", {}), "3" * 30)
+    assert cache.get(make_response_cache_key("m", "p", "1", {})) is None and cache.evictions == 1
+    assert cache.get(make_response_cache_key("m", "p", "0", {})) == "0" * 30
+    now[0] += 11
+    assert cache.get(make_response_cache_key("m", "p", "0", {})) is None and cache.expirations == 1
+    # 超过上限的单个回答不缓存
+    cache.set("big", "x" * 1000)
+    assert cache.get("big") is None and cache.memory_bytes <= cache.max_memory_bytes
+
+
+def test_disk_tier_round_trip_expiry_and_byte_cap(tmp_path, monkeypatch):
+    path = str(tmp_path / "response_cache.db")
+    cache = ResponseCache(ttl=60, disk_path=path, max_disk_bytes=1000)
+
+    async def write_and_read():
+        await cache.aset("k0", "回答")
+        return await cache.aget("k0")
+
+    assert asyncio.run(write_and_read()) == "回答"
+    # 新实例(如服务重启后)从磁盘层命中并回填内存
+    restarted = ResponseCache(ttl=60, disk_path=path, max_disk_bytes=1000)
+    assert restarted.get("k0") == "回答" and restarted.disk_hits == 1
+    assert restarted.get("k0") == "回答" and restarted.disk_hits == 1
+
+    for i in range(1, 13):
+        cache.set(f"k{i}", "x" * 100)
+    # 超过1000字节后删除最早写入的回答
+    assert cache.disk.bytes <= 1000 and cache.stats()["disk_evictions"] > 0
+    assert cache.disk.get("k0") is None and cache.disk.get("k12") is not None
+
+    # 过期的回答在间隔purge_interval后的写入时清理
+    cache.disk.purge_interval = 0
+    now = time.time()
+    monkeypatch.setattr(time, "time", lambda: now + 61)
+    cache.set("fresh", "y")
+    assert cache.disk.get("k12") is None and cache.disk.get("fresh") is not None
+
+
+def test_replay_chunks_cover_the_answer():
+    assert list(iter_replay_chunks("abcdefghij", 4)) == ["abcd", "efgh", "ij"]
@@ -0,0 +1,76 @@
+import hashlib
+import time
+
+import numpy as np
+
+from chat.semantic_cache import SemanticCache
+from embeddings.base import Embedder
+
+
+class HashEmbedder(Embedder):
+    """
+    离线测试用的确定性嵌入：字符bigram哈希到固定维度后归一化，字面相近的文本向量相近
+    """
+    model_name = "hash"
+    dim = 256
+
+    def embed_documents(self, texts):
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for i, text in enumerate(texts):
+            for j in range(max(len(text) - 1, 1)):
+                h = int(hashlib.md5(text[j:j + 2].encode("utf-8")).hexdigest(), 16)
+                vectors[i, h % self.dim] += 1.0
+        return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+
+def make_cache(**kwargs):
+    return SemanticCache(embedder=HashEmbedder(), **{"threshold": 0.8, "capacity": 100, "ttl": 60, **kwargs})
+
+
+def test_similar_query_hits():
+    cache = make_cache()
+    cache.add("m", "default", "怎么修改登录密码？", "在设置页面修改")
+    hit = cache.lookup("m", "default", "怎么修改登录密码")
+    assert hit is not None and hit[0] == "在设置页面修改"
+    assert cache.lookup("m", "default", "今天天气怎么样") is None
+
+
+def test_namespaces_are_isolated():
+    cache = make_cache()
+    cache.add("m", "default", "怎么修改登录密码？", "在设置页面修改")
+    assert cache.lookup("m", "py", "怎么修改登录密码？") is None
+    assert cache.lookup("other", "default", "怎么修改登录密码？") is None
+
+
+def test_namespaces_include_llm_params():
+    cache = make_cache()
+    cache.add("m", "default", "写一首诗", "短诗", {"temperature": 0, "max_tokens": 16})
+    assert cache.lookup("m", "default", "写一首诗", {"temperature": 0}) is None
+    assert cache.lookup("m", "default", "写一首诗", {"temperature": 0, "max_tokens": 512}) is None
+    assert cache.lookup("m", "default", "写一首诗", {"max_tokens": 16, "temperature": 0})[0] == "短诗"
+
+
+def test_lookup_batch():
+    cache = make_cache()
+    cache.add_batch("m", "default", ["如何退款", "如何开发票"], ["联系客服退款", "在订单页开发票"])
+    results = cache.lookup_batch("m", "default", ["如何开发票", "如何退款", "你是谁"])
+    assert [r[0] if r else None for r in results] == ["在订单页开发票", "联系客服退款", None]
+
+
+def test_capacity_evicts_least_recently_used():
+    cache = make_cache(capacity=2)
+    cache.add("m", "default", "问题一号", "一")
+    time.sleep(0.01)
+    cache.add("m", "default", "问题二号", "二")
+    time.sleep(0.01)
+    assert cache.lookup("m", "default", "问题一号")[0] == "一"
+    cache.add("m", "default", "问题三号", "三")
+    assert cache.evictions == 1
+    assert cache.lookup("m", "default", "问题二号") is None
+    assert cache.lookup("m", "default", "问题一号")[0] == "一"
+
+
+def test_expired_entries_do_not_hit():
+    cache = make_cache(ttl=-1)
+    cache.add("m", "default", "怎么修改登录密码？", "在设置页面修改")
+    assert cache.lookup("m", "default", "怎么修改登录密码？") is None
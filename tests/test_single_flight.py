@@ -0,0 +1,126 @@
+import asyncio
+import gc
+
+import pytest
+
+from chat.single_flight import SingleFlight
+
+
+def make_generate(tokens, calls: list, delay: float = 0.01, error: Exception = None):
+    def generate():
+        calls.append(1)
+
+        async def stream():
+            for token in tokens:
+                await asyncio.sleep(delay)
+                yield token
+            if error is not None:
+                raise error
+
+        return stream()
+
+    return generate
+
+
+async def collect(stream, limit: int = None):
+    tokens = []
+    async for token in stream:
+        tokens.append(token)
+        if limit and len(tokens) >= limit:
+            break
+    return tokens
+
+
+def test_follower_replays_tokens_from_the_start():
+    async def run():
+        flights, calls = SingleFlight(), []
+        generate = make_generate(["a", "b", "c", "d"], calls)
+        leader = asyncio.create_task(collect(flights.join("k", generate)))
+        await asyncio.sleep(0.025)
+        assert flights.in_flight("k")
+        follower = await collect(flights.join("k", generate))
+        return await leader, follower, calls, flights
+
+    leader, follower, calls, flights = asyncio.run(run())
+    assert leader == follower == ["a", "b", "c", "d"]
+    assert len(calls) == 1 and flights.leaders == 1 and flights.followers == 1
+    assert not flights.in_flight("k")
+
+
+def test_upstream_error_reaches_every_subscriber():
+    async def run():
+        flights, calls = SingleFlight(), []
+        generate = make_generate(["a"], calls, error=ValueError("boom"))
+        return await asyncio.gather(collect(flights.join("k", generate)), collect(flights.join("k", generate)),
+                                    return_exceptions=True)
+
+    results = asyncio.run(run())
+    assert all(isinstance(r, ValueError) for r in results)
+
+
+def test_upstream_is_cancelled_when_all_subscribers_leave():
+    async def run():
+        flights, calls = SingleFlight(), []
+        first = flights.join("k", make_generate(["a"] * 100, calls))
+        second = flights.join("k", make_generate(["a"] * 100, calls))
+        assert await collect(first, 1) == ["a"]
+        await first.aclose()
+        # 仍有订阅者时生成继续
+        assert flights.in_flight("k")
+        assert await collect(second, 3) == ["a"] * 3
+        await second.aclose()
+        await asyncio.sleep(0)
+        return flights, calls
+
+    flights, calls = asyncio.run(run())
+    assert len(calls) == 1 and not flights.in_flight("k")
+    assert flights.stats()["in_flight"] == 0
+
+
+def test_cancelled_upstream_fails_late_subscriber():
+    async def run():
+        flights = SingleFlight()
+        stream = flights.join("k", make_generate(["a"] * 100, [], delay=1))
+        task = asyncio.create_task(collect(stream))
+        await asyncio.sleep(0)
+        next(iter(flights._flights.values())).task.cancel()
+        await task
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(run())
+
+
+def test_on_done_returns_the_slot_when_the_upstream_ends():
+    async def run():
+        flights, released = SingleFlight(), []
+        generate = make_generate(["a", "b"], [])
+        leader = flights.join("k", generate, on_done=lambda: released.append("leader"))
+        follower = flights.join("k", generate, on_done=lambda: released.append("follower"))
+        # 合并到已有生成的请求立即归还名额，发起生成的请求在上游结束后归还
+        assert released == ["follower"]
+        await collect(leader)
+        await collect(follower)
+        await asyncio.sleep(0)
+        return released
+
+    assert asyncio.run(run()) == ["follower", "leader"]
+
+
+def test_unread_subscriptions_leave_when_closed_or_dropped():
+    async def run():
+        flights, calls = SingleFlight(), []
+        # 调用方在读取前出错(如写入消息失败)，显式退订；重复退订不重复计数
+        first = flights.join("k", make_generate(["a"] * 100, calls))
+        second = flights.join("k", make_generate(["a"] * 100, calls))
+        first.close()
+        await first.aclose()
+        await asyncio.sleep(0)
+        assert flights.in_flight("k") and flights.stats()["subscribers"] == 1
+        # 响应从未开始输出，订阅被丢弃后回收时退订
+        del second
+        gc.collect()
+        await asyncio.sleep(0)
+        return flights, first
+
+    flights, first = asyncio.run(run())
+    assert first.closed and not flights.in_flight("k") and flights.stats()["subscribers"] == 0
@@ -0,0 +1,104 @@
+import asyncio
+import time
+
+from chat.streaming import coalesce_tokens
+
+
+async def upstream(tokens, delay: float = 0, error: BaseException = None, closed: list = None):
+    try:
+        for token in tokens:
+            await asyncio.sleep(delay)
+            yield token
+        if error is not None:
+            raise error
+    finally:
+        if closed is not None:
+            closed.append(True)
+
+
+async def collect(stream):
+    return [frame async for frame in stream]
+
+
+def other_tasks():
+    return [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+
+
+def test_frames_are_flushed_when_max_chars_is_reached():
+    async def run():
+        start = time.monotonic()
+        frames = await collect(coalesce_tokens(upstream(["ab"] * 10), interval_ms=1000, max_chars=4))
+        return frames, time.monotonic() - start
+
+    frames, elapsed = asyncio.run(run())
+    # 达到max_chars即输出，不等待interval
+    assert "".join(frames) == "ab" * 10 and len(frames) > 1 and elapsed < 0.5
+    assert all(len(frame) >= 4 for frame in frames[:-1])
+
+
+def test_frames_are_flushed_after_the_interval():
+    async def run():
+        return await collect(coalesce_tokens(upstream(["a", "b", "c"], delay=0.1), interval_ms=20, max_chars=100))
+
+    assert asyncio.run(run()) == ["a", "b", "c"]
+
+
+def test_final_partial_frame_is_flushed_when_upstream_ends():
+    async def run():
+        start = time.monotonic()
+        frames = await collect(coalesce_tokens(upstream(["a", "b", "c"]), interval_ms=1000, max_chars=100))
+        return frames, time.monotonic() - start
+
+    frames, elapsed = asyncio.run(run())
+    assert frames == ["abc"] and elapsed < 0.5
+
+
+def test_upstream_error_is_raised_after_buffered_text():
+    async def run():
+        frames = []
+        try:
+            async for frame in coalesce_tokens(upstream(["x", "y"], error=ValueError("boom")), 1000, 100):
+                frames.append(frame)
+        except ValueError as e:
+            return frames, e, other_tasks()
+
+    frames, error, pending = asyncio.run(run())
+    assert frames == ["xy"] and str(error) == "boom" and pending == []
+
+
+def test_upstream_cancellation_is_not_a_normal_end():
+    async def run():
+        frames = []
+        try:
+            async for frame in coalesce_tokens(upstream(["x"], error=asyncio.CancelledError()), 1000, 100):
+                frames.append(frame)
+        except asyncio.CancelledError:
+            return frames, other_tasks()
+
+    frames, pending = asyncio.run(run())
+    assert frames == ["x"] and pending == []
+
+
+def test_cancelled_consumer_stops_pump_and_upstream():
+    async def run():
+        closed = []
+        consumer = asyncio.create_task(collect(coalesce_tokens(upstream(["a"] * 100, delay=10, closed=closed))))
+        await asyncio.sleep(0.05)
+        consumer.cancel()
+        await asyncio.gather(consumer, return_exceptions=True)
+        return consumer, closed, other_tasks()
+
+    consumer, closed, pending = asyncio.run(run())
+    assert consumer.cancelled() and closed == [True] and pending == []
+
+
+def test_closing_the_stream_early_stops_pump_and_upstream():
+    async def run():
+        closed = []
+        stream = coalesce_tokens(upstream(["ab"] * 100, delay=0.01, closed=closed), interval_ms=5, max_chars=2)
+        first = await stream.__anext__()
+        await stream.aclose()
+        return first, closed, other_tasks()
+
+    first, closed, pending = asyncio.run(run())
+    assert first == "ab" and closed == [True] and pending == []
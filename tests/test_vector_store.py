@@ -0,0 +1,229 @@
+import threading
+
+import numpy as np
+
+from knowledge_base.summary import SummaryIndex, summary_vectors
+from knowledge_base.vector_store import segment as segment_module
+from knowledge_base.vector_store.flat import FlatVectorStore
+from knowledge_base.vector_store.hnsw import HNSWVectorStore
+from knowledge_base.vector_store.ivfpq import IVFPQVectorStore
+from knowledge_base.vector_store.segment import SegmentVectorStore
+
+
+def random_vectors(n: int, dim: int = 32, seed: int = 0) -> np.ndarray:
+    vectors = np.random.default_rng(seed).standard_normal((n, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def test_segment_add_delete_search_save_load(tmp_path):
+    vectors = random_vectors(300)
+    store = SegmentVectorStore(str(tmp_path), max_segments=100)
+    for start in range(0, 300, 100):
+        store.add(np.arange(start, start + 100), vectors[start:start + 100])
+        store.save()
+    assert store.delete(np.array([5, 150])) == 2
+    store.save()
+
+    loaded = SegmentVectorStore(str(tmp_path))
+    assert loaded.load() and loaded.size == 298
+    scores, ids = loaded.search(vectors[[7, 150]], 1)
+    assert ids[0, 0] == 7 and ids[1, 0] != 150
+    found, _ = loaded.get_vectors(np.array([5, 6]))
+    assert found.tolist() == [6]
+
+
+def test_segment_save_during_merge_keeps_merged_file(tmp_path, monkeypatch):
+    vectors = random_vectors(200)
+    store = SegmentVectorStore(str(tmp_path), max_segments=100)
+    for start in range(0, 200, 50):
+        store.add(np.arange(start, start + 50), vectors[start:start + 50])
+        store.save()
+    store.delete(np.arange(0, 40))
+    monkeypatch.setattr(store, "maybe_merge", lambda background=True: None)
+
+    save_arrays = segment_module.save_arrays
+
+    def save_arrays_then_save(path, arrays, meta=None):
+        save_arrays(path, arrays, meta)
+        # 合并写出新段后、替换manifest前，另一次保存清理未引用的文件
+        if len(arrays["ids"]) == 160:
+            store.add(np.array([1000]), vectors[:1])
+            store.save()
+
+    monkeypatch.setattr(segment_module, "save_arrays", save_arrays_then_save)
+    store.merge(list(store.segments))
+
+    loaded = SegmentVectorStore(str(tmp_path))
+    assert loaded.load() and loaded.size == 161
+    assert loaded.search(vectors[[100]], 1)[1][0, 0] == 100
+
+
+def test_flat_search_is_consistent_during_writes(tmp_path):
+    vectors = random_vectors(2000)
+    store = FlatVectorStore(str(tmp_path))
+    store.add(np.arange(1000), vectors[:1000])
+    stop = threading.Event()
+
+    def write():
+        i = 1000
+        while not stop.is_set() and i < 2000:
+            store.add(np.arange(i, i + 50), vectors[i:i + 50])
+            store.delete(np.arange(i, i + 25))
+            i += 50
+
+    writer = threading.Thread(target=write)
+    writer.start()
+    try:
+        for _ in range(200):
+            _, ids = store.search(vectors[:10], 1)
+            assert ids[:, 0].tolist() == list(range(10))
+    finally:
+        stop.set()
+        writer.join()
+
+    store.save()
+    loaded = FlatVectorStore(str(tmp_path))
+    assert loaded.load() and loaded.size == store.size
+    assert np.array_equal(loaded.ids, store.ids)
+
+
+def test_hnsw_add_delete_search_save_load(tmp_path):
+    vectors = random_vectors(500)
+    store = HNSWVectorStore(str(tmp_path), M=8, ef_construction=64)
+    store.add(np.arange(500), vectors)
+    _, ids = store.search(vectors[:20], 1)
+    assert ids[:, 0].tolist() == list(range(20))
+    assert store.delete(np.array([3, 4, 4000])) == 2
+    store.save()
+
+    loaded = HNSWVectorStore(str(tmp_path))
+    assert loaded.load() and loaded.size == 498
+    _, ids = loaded.search(vectors[[3, 5]], 5)
+    assert 3 not in ids[0] and ids[1, 0] == 5
+    # memmap加载的索引首次写入时复制到内存
+    loaded.add(np.array([1000]), vectors[3:4])
+    assert loaded.search(vectors[3:4], 1)[1][0, 0] == 1000
+
+
+def test_hnsw_compacted_builds_new_store(tmp_path):
+    vectors = random_vectors(400)
+    store = HNSWVectorStore(str(tmp_path), M=8, ef_construction=64, compact_ratio=0.2)
+    store.add(np.arange(400), vectors)
+    store.delete(np.arange(50))
+    assert store.compacted() is None
+    store.delete(np.arange(50, 100))
+    fresh = store.compacted()
+    # 原索引不变，进行中的检索仍可使用
+    assert store.n == 400 and store.size == 300
+    assert fresh is not store and fresh.n == 300 and fresh.n_deleted == 0
+    _, ids = fresh.search(vectors[100:110], 1)
+    assert ids[:, 0].tolist() == list(range(100, 110))
+    assert fresh.get_vectors(np.array([10, 150]))[0].tolist() == [150]
+
+
+def test_ivfpq_train_retrain_delete_save_load(tmp_path):
+    vectors = random_vectors(3000)
+    store = IVFPQVectorStore(str(tmp_path), nlist=64, m=8, min_train_size=500, kmeans_iters=5, retrain_factor=2)
+    store.add(np.arange(400), vectors[:400])
+    assert not store.trained
+    assert store.delete(np.array([1])) == 1 and store.size == 399
+    store.add(np.arange(400, 1000), vectors[400:1000])
+    assert store.trained and store.trained_size == 999 and len(store.centroids) == 999 // 39
+    for start in range(1000, 3000, 500):
+        store.add(np.arange(start, start + 500), vectors[start:start + 500])
+    # 行数达到上次训练时的2倍后重新训练，倒排列表数随之增加
+    assert store.trained_size == 1999 and len(store.centroids) == 1999 // 39 and store.size == 2999
+
+    assert store.delete(np.array([5, 2500, 1])) == 2 and store.size == 2997
+    queries = vectors[[0, 5, 1500, 2999]]
+    _, ids = store.search(queries, 3)
+    assert ids[[0, 2, 3], 0].tolist() == [0, 1500, 2999] and 5 not in ids[1]
+    store.save()
+
+    loaded = IVFPQVectorStore(str(tmp_path))
+    assert loaded.load() and loaded.size == 2997
+    assert np.array_equal(loaded.search(queries, 3)[1], ids)
+    found, found_vectors = loaded.get_vectors(np.array([5, 6]))
+    assert found.tolist() == [6] and np.allclose(found_vectors[0], vectors[6])
+    # memmap加载后继续写入
+    loaded.add(np.array([5000]), vectors[5:6])
+    assert loaded.search(vectors[5:6], 1)[1][0, 0] == 5000
+
+
+def test_ivfpq_search_uses_snapshot_during_writes():
+    vectors = random_vectors(4000)
+    store = IVFPQVectorStore("", nlist=16, m=8, min_train_size=500, kmeans_iters=5)
+    store.add(np.arange(1000), vectors[:1000])
+    stop = threading.Event()
+
+    def write():
+        i = 1000
+        while not stop.is_set() and i < 4000:
+            store.add(np.arange(i, i + 100), vectors[i:i + 100])
+            store.delete(np.arange(i, i + 50))
+            i += 100
+
+    writer = threading.Thread(target=write)
+    writer.start()
+    try:
+        for _ in range(100):
+            _, ids = store.search(vectors[:10], 1)
+            assert ids[:, 0].tolist() == list(range(10))
+    finally:
+        stop.set()
+        writer.join()
+
+
+def test_flat_get_vectors_looks_up_ids():
+    vectors = random_vectors(100)
+    store = FlatVectorStore("")
+    # id不一定有序(如重新入库的文件)
+    store.add(np.arange(50, 100), vectors[50:])
+    store.add(np.arange(50), vectors[:50])
+    store.delete(np.array([60]))
+    found, found_vectors = store.get_vectors(np.array([99, 3, 60, 3, 1000, -1]))
+    assert found.tolist() == [99, 3] and np.array_equal(found_vectors, vectors[[99, 3]])
+    assert store.get_vectors(np.zeros(0, dtype=np.int64))[0].tolist() == []
+    assert FlatVectorStore("").get_vectors(np.array([1]))[0].tolist() == []
+
+
+def test_flat_tombstones_and_compaction(tmp_path):
+    vectors = random_vectors(200)
+    store = FlatVectorStore(str(tmp_path), compact_ratio=0.2)
+    store.add(np.arange(100), vectors[:100])
+    capacity = len(store._ids)
+    # 重新入库一个文件：删除旧行、追加新行，不复制整个矩阵
+    assert store.delete(np.arange(10)) == 10
+    store.add(np.arange(10), vectors[100:110])
+    assert len(store._ids) == capacity and store.n == 110 and store.size == 100
+    _, ids = store.search(vectors[[3, 103]], 1)
+    assert ids[0, 0] != 3 and ids[1, 0] == 3
+    found, found_vectors = store.get_vectors(np.array([3, 50]))
+    assert found.tolist() == [50, 3] and np.array_equal(found_vectors[1], vectors[103])
+    # top_k超过未删除的行数时不返回已删除的行
+    assert store.search(vectors[:1], 500)[1].shape == (1, 100)
+    # 已删除行占比超过compact_ratio后去掉已删除的行
+    store.delete(np.arange(10, 40))
+    assert store.n == store.size == 70 and store.n_deleted == 0
+    store.save()
+    loaded = FlatVectorStore(str(tmp_path))
+    assert loaded.load() and np.array_equal(loaded.ids, store.ids)
+
+
+def test_summary_index_hierarchical_search_delete_save_load(tmp_path):
+    vectors = random_vectors(64)
+    docs = FlatVectorStore("")
+    docs.add(np.arange(64), vectors)
+    groups = [np.arange(start, start + 16) for start in range(0, 64, 16)]
+    index = SummaryIndex(str(tmp_path))
+    index.add(np.arange(1000, 1004), summary_vectors(vectors, groups), groups)
+    _, ids = index.search(vectors[[5, 40]], 3, docs.get_vectors, top_summaries=4)
+    assert ids[:, 0].tolist() == [5, 40]
+    assert index.delete([1000]) == 1 and index.size == 3
+    index.save()
+
+    loaded = SummaryIndex(str(tmp_path))
+    assert loaded.load() and loaded.size == 3
+    assert sorted(loaded.members(np.array([1001, 1000])).tolist()) == list(range(16, 32))
+    _, ids = loaded.search(vectors[[5, 40]], 3, docs.get_vectors, top_summaries=4)
+    assert 5 not in ids[0] and ids[1, 0] == 40
@@ -1,10 +1,11 @@
 # HTTP工具：统一HTTP客户端配置
-from typing import Union, Dict
+from typing import Union, Dict, Optional
 
 import httpx
 from httpx import AsyncClient
 
-from configs.basic import HTTPX_DEFAULT_TIMEOUT
+from configs.basic import HTTPX_DEFAULT_TIMEOUT, HTTPX_MAX_CONNECTIONS, HTTPX_MAX_KEEPALIVE_CONNECTIONS, \
+    HTTPX_KEEPALIVE_EXPIRY
 from configs.fastchat import get_controller_addr, get_model_worker_addr, get_api_server_addr, get_openai_api_addr, get_webui_addr
 
 
@@ -15,6 +16,37 @@ def get_httpx_client() -> AsyncClient:
         follow_redirects=True
     )
 
+
+_shared_async_clients: Dict[Optional[str], AsyncClient] = {}
+
+
+def get_shared_httpx_async_client(proxy: str = None) -> AsyncClient:
+    """
+    获取进程内共享的HTTP客户端，按代理区分。
+    所有请求复用同一个keep-alive连接池，避免每次请求都重新建立连接。
+    """
+    proxy = proxy or None
+    client = _shared_async_clients.get(proxy)
+    if client is None or client.is_closed:
+        client = httpx.AsyncClient(
+            timeout=HTTPX_DEFAULT_TIMEOUT,
+            proxy=proxy,
+            limits=httpx.Limits(
+                max_connections=HTTPX_MAX_CONNECTIONS,
+                max_keepalive_connections=HTTPX_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=HTTPX_KEEPALIVE_EXPIRY,
+            ),
+        )
+        _shared_async_clients[proxy] = client
+    return client
+
+
+async def close_shared_httpx_async_clients():
+    """关闭共享的HTTP客户端，在服务退出时调用"""
+    for client in list(_shared_async_clients.values()):
+        await client.aclose()
+    _shared_async_clients.clear()
+
 def set_httpx_config(
         timeout: float = HTTPX_DEFAULT_TIMEOUT,
         proxy: Union[str, Dict] = None,
@@ -0,0 +1,20 @@
+# 运行统计：汇总各缓存、队列的计数器，供 /server/stats 接口查询
+from typing import Any, Callable, Dict
+
+_STATS_PROVIDERS: Dict[str, Callable[[], Dict[str, Any]]] = {}
+
+
+def register_stats_provider(name: str, provider: Callable[[], Dict[str, Any]]) -> None:
+    """注册统计项，同名覆盖"""
+    _STATS_PROVIDERS[name] = provider
+
+
+def collect_stats() -> Dict[str, Any]:
+    """收集所有已注册的统计项"""
+    stats = {}
+    for name, provider in list(_STATS_PROVIDERS.items()):
+        try:
+            stats[name] = provider()
+        except Exception as e:
+            stats[name] = {"error": str(e)}
+    return stats